@@ -1,8 +1,15 @@
 from celery.schedules import crontab
+from services.nepse_http import get_feed_config
 
 app.conf.beat_schedule = {
     'update-stock-prices': {
         'task': 'trading.tasks.update_stock_prices_task',
         'schedule': 60.0,  # Every 60 seconds
     },
+    # Single writer for the live snapshot; a no-op unless NEPSE_API['FEED']['ENABLED'].
+    # Fires at the open-market interval, the task itself backs off to CLOSED_INTERVAL
+    'poll-market-feed': {
+        'task': 'trading.tasks.poll_market_feed_task',
+        'schedule': float(get_feed_config()['INTERVAL']),
+    },
 }
\ No newline at end of file
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/6.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 from datetime import timedelta
 
@@ -44,6 +45,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',  # BRIN indexes on the tick, ledger and idempotency tables
 ]
 
 MIDDLEWARE = [
@@ -86,6 +88,15 @@ CORS_ALLOW_HEADERS = [
     'user-agent',
     'x-csrftoken',
     'x-requested-with',
+    'idempotency-key',
+]
+
+# Let the frontend read cache freshness headers on market data responses
+CORS_EXPOSE_HEADERS = [
+    'x-data-source',
+    'x-data-age',
+    'x-data-stale',
+    'idempotent-replayed',
 ]
 
 # CSRF Trusted Origins
@@ -198,4 +209,59 @@ SIMPLE_JWT = {
     'TOKEN_TYPE_CLAIM': 'token_type',
 
     'JTI_CLAIM': 'jti',
-}
\ No newline at end of file
+}
+
+# NEPSE upstream API
+NEPSE_API = {
+    'BASE_URL': os.environ.get('NEPSE_API_BASE_URL', 'http://localhost:8003'),
+    'POOL_SIZE': 20,            # keep-alive connections per worker
+    'MAX_RETRIES': 2,           # retries on connect errors / 502-504
+    'BACKOFF_FACTOR': 0.2,      # 0.2s, 0.4s, ... between retries
+    'BACKOFF_JITTER': 0.1,      # up to +0.1s random jitter per retry
+    # (connect, read) timeouts in seconds, per endpoint
+    'TIMEOUTS': {
+        'default': (2, 5),
+        '/CompanyList': (2, 10),
+        '/stockIntraday': (2, 10),
+    },
+    # (soft, hard) TTLs in seconds: past soft we serve stale and refresh in
+    # the background; past hard the entry is gone and callers wait for upstream
+    'CACHE_TTLS': {
+        'live_prices': (30, 900),
+        'stock_list': (3600, 86400),
+        'intraday_open': (30, 900),
+        'intraday_closed': (300, 3600),
+    },
+    # Per-endpoint circuit breaker: after MIN_CALLS, trip when FAILURE_RATE of
+    # the last WINDOW calls failed; fail fast for COOL_DOWN seconds, then probe
+    'CIRCUIT_BREAKER': {
+        'WINDOW': 20,
+        'MIN_CALLS': 5,
+        'FAILURE_RATE': 0.5,
+        'COOL_DOWN': 30,
+        'HALF_OPEN_CALLS': 1,
+    },
+    # Market feed poller (`manage.py run_market_feed` or poll_market_feed_task).
+    # When ENABLED, requests only read the snapshot it publishes and never call
+    # /LiveMarket themselves - needs a cache shared by all processes (REDIS_URL).
+    'FEED': {
+        'ENABLED': os.environ.get('NEPSE_FEED_ENABLED', '').lower() in ('1', 'true', 'yes'),
+        'INTERVAL': 5,          # seconds between polls while the market is open
+        'CLOSED_INTERVAL': 30,  # ... while closed or halted
+    },
+    # Synthetic market behind the mock data path (services/market_simulator.py).
+    # A fixed seed gives every process the same past sessions.
+    'SIMULATOR': {
+        'SEED': int(os.environ.get('NEPSE_SIMULATOR_SEED', 0)),
+    },
+}
+
+# Shared cache so workers, Celery and the feed poller see the same snapshots.
+# Falls back to Django's per-process LocMem cache when REDIS_URL is unset.
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
@@ -0,0 +1,114 @@
+import asyncio
+import logging
+from datetime import datetime
+from django.http import JsonResponse
+from django.views import View
+from services.async_nepse_client import AsyncNepseClient
+from .views import (
+    to_nepal_time, chart_days, format_chart_data, filter_stock_list, freshness_headers,
+)
+
+logger = logging.getLogger(__name__)
+
+# Native async versions of the public market_data views.
+# Under ASGI these await AsyncNepseClient directly, so a slow upstream
+# never pins a worker thread. Payloads match the DRF views in views.py.
+
+
+class AsyncLivePricesView(View):
+    """Get live prices for all stocks"""
+
+    async def get(self, request):
+        result = await AsyncNepseClient.get_snapshot_result()
+        return JsonResponse(result.value.to_list(), safe=False, headers=freshness_headers(result))
+
+
+class AsyncStockPriceView(View):
+    """Get price for specific stock"""
+
+    async def get(self, request, symbol):
+        price_data, market_status = await asyncio.gather(
+            AsyncNepseClient.get_stock_price(symbol.upper()),
+            AsyncNepseClient.get_market_status(),
+        )
+        if not price_data:
+            return JsonResponse({'error': 'Stock not found'}, status=404)
+
+        return JsonResponse({
+            **price_data,
+            'market_status': {
+                'is_open': market_status.get('is_open') if market_status else False,
+                'message': market_status.get('message') if market_status else 'Market status unknown'
+            },
+            'nepal_time': to_nepal_time().isoformat(),
+            'last_updated': datetime.now().isoformat()
+        })
+
+
+class AsyncIntradayChartView(View):
+    """Get candlestick chart data for landing page"""
+
+    async def get(self, request):
+        symbol = request.GET.get('symbol', 'NABIL').upper()
+        try:
+            days = chart_days(request.GET.get('days'))
+        except ValueError:
+            return JsonResponse({'error': 'days must be a number'}, status=400)
+
+        result, market_status = await asyncio.gather(
+            AsyncNepseClient.get_intraday_result(symbol, days),
+            AsyncNepseClient.get_market_status(),
+        )
+        formatted_data = format_chart_data(result.value, days)
+
+        return JsonResponse({
+            'symbol': symbol,
+            'market_status': market_status,
+            'data': formatted_data,
+            'data_points': len(formatted_data),
+            'timezone': 'Asia/Kathmandu (NPT)',
+            'source': result.source,
+            'data_age': round(result.age, 1),
+            'stale': result.stale
+        })
+
+
+class AsyncStockSearchView(View):
+    """Search stocks by symbol or name"""
+
+    async def get(self, request):
+        query = request.GET.get('q', '').upper()
+        result = await AsyncNepseClient.get_stock_list_result()
+        return JsonResponse(
+            filter_stock_list(result.value, query), safe=False, headers=freshness_headers(result)
+        )
+
+
+class AsyncMarketSummaryView(View):
+    """Get market summary (indices, gainers, losers)"""
+
+    async def get(self, request):
+        # Summary, index and live feed are independent upstream calls
+        summary, nepse_index, snapshot = await asyncio.gather(
+            AsyncNepseClient.get_market_summary(),
+            AsyncNepseClient.get_nepse_index(),
+            AsyncNepseClient.get_snapshot(),
+        )
+
+        top_gainers = await AsyncNepseClient.get_top_gainers(5, summary=summary or {})
+        top_losers = await AsyncNepseClient.get_top_losers(5, summary=summary or {})
+
+        columns = snapshot.columns
+        if not top_gainers:
+            top_gainers = columns.top_movers(5, gainers=True)
+        if not top_losers:
+            top_losers = columns.top_movers(5, gainers=False)
+
+        return JsonResponse({
+            'summary': summary,
+            'nepse_index': nepse_index,
+            'top_gainers': top_gainers,
+            'top_losers': top_losers,
+            'market_breadth': columns.aggregate() if len(columns) else None,
+            'last_updated': to_nepal_time().isoformat()
+        })
@@ -1,5 +1,5 @@
 from django.urls import path
-from . import views
+from . import views, async_views
 
 urlpatterns = [
     path('status/', views.MarketStatusView.as_view(), name='market-status'),
@@ -8,4 +8,13 @@ urlpatterns = [
     path('intraday/', views.IntradayChartView.as_view(), name='intraday-chart'),
     path('search/', views.StockSearchView.as_view(), name='stock-search'),
     path('summary/', views.MarketSummaryView.as_view(), name='market-summary'),
-]
\ No newline at end of file
+    path('deltas/', views.PriceDeltasView.as_view(), name='price-deltas'),
+    path('upstream/', views.UpstreamHealthView.as_view(), name='upstream-health'),
+    
+    # Native async variants (serve these from the ASGI app)
+    path('async/prices/', async_views.AsyncLivePricesView.as_view(), name='live-prices-async'),
+    path('async/price/<str:symbol>/', async_views.AsyncStockPriceView.as_view(), name='stock-price-async'),
+    path('async/intraday/', async_views.AsyncIntradayChartView.as_view(), name='intraday-chart-async'),
+    path('async/search/', async_views.AsyncStockSearchView.as_view(), name='stock-search-async'),
+    path('async/summary/', async_views.AsyncMarketSummaryView.as_view(), name='market-summary-async'),
+]
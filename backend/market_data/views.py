@@ -2,6 +2,10 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from services.nepse_client import NepseClient
+from services.nepse_http import base_url, feed_enabled
+from services.market_feed import get_heartbeat
+from services.snapshot_diff import recent_diffs
+from services.circuit_breaker import all_breakers, OPEN
 import logging
 import datetime
 import pytz
@@ -39,6 +43,57 @@ def to_nepal_time(dt_str=None):
         logger.error(f"Error converting to Nepal time: {e}")
         return datetime.now(nepali_tz)
 
+def freshness_headers(result):
+    """Response headers describing where cached data came from and how old it is"""
+    return {
+        'X-Data-Source': result.source,
+        'X-Data-Age': str(int(result.age)),
+        'X-Data-Stale': 'true' if result.stale else 'false',
+    }
+
+# Most sessions an intraday chart spans
+MAX_CHART_DAYS = 5
+
+def chart_days(value):
+    """?days= clamped to 1..MAX_CHART_DAYS; raises ValueError if it isn't a number"""
+    days = int(value) if value not in (None, '') else 1
+    return max(1, min(days, MAX_CHART_DAYS))
+
+def format_chart_data(chart_data, days):
+    """Convert intraday candles to Nepal time with display labels"""
+    formatted_data = []
+    for item in chart_data:
+        dt_nepal = to_nepal_time(item.get('time'))
+        
+        # Format in a nice readable format
+        if days > 1:
+            # For multiple days, show date and time
+            time_str = dt_nepal.strftime('%b %d, %H:%M')
+        else:
+            # For single day, just show time
+            time_str = dt_nepal.strftime('%H:%M')
+        
+        formatted_data.append({
+            'time': time_str,
+            'timestamp': dt_nepal.isoformat(),
+            'open': item.get('open', 0),
+            'high': item.get('high', 0),
+            'low': item.get('low', 0),
+            'close': item.get('close', 0),
+            'volume': item.get('volume', 0)
+        })
+    return formatted_data
+
+def filter_stock_list(stocks, query):
+    """Match symbol or company name; first 50 when there is no query"""
+    if query:
+        return [
+            s for s in stocks 
+            if query in s.get('symbol', '').upper() or 
+               query in s.get('companyName', '').upper()
+        ]
+    return stocks[:50]  # Limit to 50 if no query
+
 class MarketStatusView(APIView):
     """Check if market is open using NEPSE API"""
     
@@ -100,13 +155,50 @@ class MarketStatusView(APIView):
             'source': 'local calculation (API unavailable)'
         })
         
+class UpstreamHealthView(APIView):
+    """Circuit breaker state per NEPSE endpoint (for this worker process)"""
+    permission_classes = []
+    
+    def get(self, request):
+        breakers = all_breakers()
+        return Response({
+            'base_url': base_url(),
+            'healthy': all(b['state'] != OPEN for b in breakers),
+            'endpoints': breakers,
+            'feed': {
+                'enabled': feed_enabled(),
+                'last_poll': get_heartbeat()
+            },
+            'checked_at': to_nepal_time().isoformat()
+        })
+
+class PriceDeltasView(APIView):
+    """Per-symbol price changes published by the market feed since ?since=<seq>"""
+    permission_classes = []
+    
+    def get(self, request):
+        try:
+            since = int(request.GET.get('since', 0))
+        except ValueError:
+            return Response({'error': 'since must be an integer sequence number'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        
+        diffs = recent_diffs(since)
+        return Response({
+            'since': since,
+            'latest_seq': diffs[-1]['seq'] if diffs else since,
+            # History was trimmed past `since` - reload /prices/ instead
+            'resync': bool(since and diffs and diffs[0]['seq'] > since + 1),
+            'diffs': diffs
+        })
+
 class LivePricesView(APIView):
     """Get live prices for all stocks"""
     permission_classes = []
     
     def get(self, request):
-        prices = NepseClient.get_live_prices()
-        return Response(prices)
+        result = NepseClient.get_snapshot_result()
+        return Response(result.value.to_list(), headers=freshness_headers(result))
 
 class StockPriceView(APIView):
     """Get price for specific stock"""
@@ -138,47 +230,29 @@ class IntradayChartView(APIView):
     
     def get(self, request):
         symbol = request.GET.get('symbol', 'NABIL').upper()
-        days = int(request.GET.get('days', 1))
+        try:
+            days = chart_days(request.GET.get('days'))
+        except ValueError:
+            return Response({'error': 'days must be a number'}, status=status.HTTP_400_BAD_REQUEST)
         
-        # Limit days to reasonable range
-        if days > 5:
-            days = 5
-        
-        chart_data = NepseClient.get_intraday_data(symbol, days)
+        result = NepseClient.get_intraday_result(symbol, days)
+        chart_data = result.value
         
         # Get market status to include in response
         market_status = NepseClient.get_market_status()
         
         # Convert timestamps to Nepal time (UTC+5:45)
-        formatted_data = []
-        for item in chart_data:
-            dt_nepal = to_nepal_time(item.get('time'))
-            
-            # Format in a nice readable format
-            if days > 1:
-                # For multiple days, show date and time
-                time_str = dt_nepal.strftime('%b %d, %H:%M')
-            else:
-                # For single day, just show time
-                time_str = dt_nepal.strftime('%H:%M')
-            
-            formatted_item = {
-                'time': time_str,
-                'timestamp': dt_nepal.isoformat(),
-                'open': item.get('open', 0),
-                'high': item.get('high', 0),
-                'low': item.get('low', 0),
-                'close': item.get('close', 0),
-                'volume': item.get('volume', 0)
-            }
-            formatted_data.append(formatted_item)
+        formatted_data = format_chart_data(chart_data, days)
         
         return Response({
             'symbol': symbol,
             'market_status': market_status,
             'data': formatted_data,
             'data_points': len(formatted_data),
-            'timezone': 'Asia/Kathmandu (NPT)'
+            'timezone': 'Asia/Kathmandu (NPT)',
+            'source': result.source,
+            'data_age': round(result.age, 1),
+            'stale': result.stale
         })
 
 class StockSearchView(APIView):
@@ -187,18 +261,9 @@ class StockSearchView(APIView):
     
     def get(self, request):
         query = request.GET.get('q', '').upper()
-        stocks = NepseClient.get_stock_list()
+        result = NepseClient.get_stock_list_result()
         
-        if query:
-            filtered = [
-                s for s in stocks 
-                if query in s.get('symbol', '').upper() or 
-                   query in s.get('companyName', '').upper()
-            ]
-        else:
-            filtered = stocks[:50]  # Limit to 50 if no query
-        
-        return Response(filtered)
+        return Response(filter_stock_list(result.value, query), headers=freshness_headers(result))
 
 class MarketSummaryView(APIView):
     """Get market summary (indices, gainers, losers)"""
@@ -212,52 +277,18 @@ class MarketSummaryView(APIView):
         top_gainers = NepseClient.get_top_gainers(5)
         top_losers = NepseClient.get_top_losers(5)
         
-        # If they're None or empty, try to extract from live data
-        if not top_gainers or len(top_gainers) == 0:
-            live_data = NepseClient.get_live_prices()
-            if live_data:
-                # Sort by percentageChange descending for gainers
-                sorted_by_change = sorted(
-                    live_data, 
-                    key=lambda x: float(x.get('percentageChange', 0)), 
-                    reverse=True
-                )
-                top_gainers = [
-                    {
-                        'symbol': item['symbol'],
-                        'companyName': item.get('securityName', item['symbol']),
-                        'lastTradedPrice': item['lastTradedPrice'],
-                        'percentageChange': item['percentageChange'],
-                        'volume': item.get('totalTradeQuantity', 0)
-                    }
-                    for item in sorted_by_change[:5] 
-                    if float(item.get('percentageChange', 0)) > 0
-                ]
-        
-        if not top_losers or len(top_losers) == 0:
-            live_data = NepseClient.get_live_prices()
-            if live_data:
-                # Sort by percentageChange ascending for losers
-                sorted_by_change = sorted(
-                    live_data, 
-                    key=lambda x: float(x.get('percentageChange', 0))
-                )
-                top_losers = [
-                    {
-                        'symbol': item['symbol'],
-                        'companyName': item.get('securityName', item['symbol']),
-                        'lastTradedPrice': item['lastTradedPrice'],
-                        'percentageChange': item['percentageChange'],
-                        'volume': item.get('totalTradeQuantity', 0)
-                    }
-                    for item in sorted_by_change[:5] 
-                    if float(item.get('percentageChange', 0)) < 0
-                ]
+        # If they're None or empty, rank the live snapshot ourselves
+        columns = NepseClient.get_snapshot().columns
+        if not top_gainers:
+            top_gainers = columns.top_movers(5, gainers=True)
+        if not top_losers:
+            top_losers = columns.top_movers(5, gainers=False)
         
         return Response({
             'summary': summary,
             'nepse_index': nepse_index,
             'top_gainers': top_gainers,
             'top_losers': top_losers,
+            'market_breadth': columns.aggregate() if len(columns) else None,
             'last_updated': to_nepal_time().isoformat()
         })
\ No newline at end of file
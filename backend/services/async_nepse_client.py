@@ -0,0 +1,280 @@
+import asyncio
+import logging
+import httpx
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from services.market_snapshot import MarketSnapshot, anext_snapshot_version
+from services.nepse_http import anepse_get, get_cache_ttls, feed_enabled
+from services.circuit_breaker import CircuitOpenError
+from services.cache import asingle_flight, aswr_get, aswr_set, aswr_peek, SWRResult
+from services.candle_store import CandleStore
+from services.nepse_client import (
+    NepseClient, parse_market_status, is_market_inactive,
+    intraday_cache_ttls, snapshot_freshness, MOCK_SOFT_TTL,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncNepseClient:
+    """
+    asyncio counterpart of NepseClient for ASGI views and Channels consumers.
+    Same cache keys and payload shapes, so both clients share cached data.
+    """
+    BASE_URL = NepseClient.BASE_URL
+    MOCK_PRICES = NepseClient.MOCK_PRICES
+
+    # The simulator is CPU work and builds its universe from the DB on first use
+    get_mock_prices = staticmethod(sync_to_async(NepseClient.get_mock_prices))
+    get_mock_quote = staticmethod(sync_to_async(NepseClient.get_mock_quote))
+    get_mock_stock_list = staticmethod(sync_to_async(NepseClient.get_mock_stock_list))
+    generate_mock_intraday = staticmethod(sync_to_async(NepseClient.generate_mock_intraday))
+
+    @classmethod
+    async def get_market_status(cls):
+        """Check if NEPSE market is currently open"""
+        cache_key = 'nepse_market_status'
+
+        cached = await cache.aget(cache_key)
+        if cached:
+            return cached
+
+        return await asingle_flight(cache_key, cls._fetch_market_status)
+
+    @classmethod
+    async def _fetch_market_status(cls):
+        """Fetch /IsNepseOpen and cache the parsed status"""
+        cache_key = 'nepse_market_status'
+
+        try:
+            response = await anepse_get("/IsNepseOpen")
+            if response.status_code == 200:
+                data = response.json()
+                result = parse_market_status(data)
+                await cache.aset(cache_key, result, 60)
+                logger.info(f"Market status: {result['raw_status']} at {data.get('asOf')}")
+                return result
+        except CircuitOpenError as e:
+            logger.warning(f"Skipping NEPSE call: {e}")
+        except httpx.ConnectError:
+            logger.error(f"Cannot connect to NEPSE API at {cls.BASE_URL}")
+        except Exception as e:
+            logger.error(f"Failed to fetch market status: {e}")
+
+        return None
+
+    @classmethod
+    async def _fetch_live_market(cls):
+        """Raw /LiveMarket rows, or None on any failure"""
+        try:
+            response = await anepse_get("/LiveMarket")
+            if response.status_code == 200:
+                data = response.json()
+                logger.info(f"API returned {len(data) if data else 0} stocks")
+                if data:
+                    return data
+                logger.warning("API returned empty data")
+            else:
+                logger.warning(f"API returned status {response.status_code}")
+        except Exception as e:
+            logger.error(f"Live market fetch failed: {e}")
+        return None
+
+    @classmethod
+    async def get_snapshot_result(cls):
+        """Current snapshot wrapped in an SWRResult (see NepseClient)"""
+        cache_key = 'nepse_live_prices'
+        soft_ttl, hard_ttl = get_cache_ttls('live_prices')
+
+        if feed_enabled():
+            result = await aswr_peek(cache_key)
+            if result:
+                return result
+            logger.warning("Market feed has not published a snapshot yet, serving mock data")
+            snapshot = MarketSnapshot(await cls.get_mock_prices(), source='mock', version=0)
+            return SWRResult(snapshot, 'mock', 0.0, False)
+
+        result = await aswr_get(cache_key, cls._fetch_snapshot, soft_ttl, hard_ttl)
+        if result:
+            return result
+
+        logger.info("Using mock data as fallback")
+        version = await anext_snapshot_version()
+        snapshot = MarketSnapshot(await cls.get_mock_prices(), source='mock', version=version)
+        await aswr_set(cache_key, snapshot, 'mock', MOCK_SOFT_TTL, 60)
+        return SWRResult(snapshot, 'mock', 0.0, False)
+
+    @classmethod
+    async def get_snapshot(cls):
+        """Get the current live market snapshot with fallback"""
+        result = await cls.get_snapshot_result()
+        return result.value
+
+    @classmethod
+    async def _fetch_snapshot(cls):
+        """Build a fresh snapshot: (snapshot, source), or None if upstream failed"""
+        # Market status and the live feed are independent - fetch both at once
+        market_status, data = await asyncio.gather(
+            cls.get_market_status(),
+            cls._fetch_live_market(),
+        )
+
+        if is_market_inactive(market_status):
+            logger.info(f"Market is {market_status['status']}, using mock data")
+            version = await anext_snapshot_version()
+            return MarketSnapshot(await cls.get_mock_prices(), source='mock', version=version), 'mock'
+
+        if data:
+            version = await anext_snapshot_version()
+            return MarketSnapshot(data, source='live', version=version), 'live'
+
+        return None
+
+    @classmethod
+    async def get_live_prices(cls):
+        """Get live market data with fallback (/LiveMarket-shaped rows)"""
+        snapshot = await cls.get_snapshot()
+        return snapshot.to_list()
+
+    @classmethod
+    async def get_stock_price(cls, symbol):
+        """Get price for specific stock"""
+        market_status, result = await asyncio.gather(
+            cls.get_market_status(),
+            cls.get_snapshot_result(),
+        )
+        snapshot = result.value
+
+        if is_market_inactive(market_status):
+            mock_data = await cls.get_mock_quote(symbol)
+            if mock_data:
+                mock_data['source'] = 'mock (market closed/halted)'
+                return mock_data
+
+        price_data = snapshot.get(symbol)
+        if price_data and snapshot.source == 'live':
+            price_data.update(snapshot_freshness(result))
+            return price_data
+
+        mock_data = await cls.get_mock_quote(symbol)
+        if mock_data:
+            return mock_data
+
+        logger.warning(f"No price found for {symbol}")
+        return None
+
+    @classmethod
+    async def get_stock_list_result(cls):
+        """Company list wrapped in an SWRResult"""
+        cache_key = 'nepse_stock_list'
+        soft_ttl, hard_ttl = get_cache_ttls('stock_list')
+
+        result = await aswr_get(cache_key, cls._fetch_stock_list, soft_ttl, hard_ttl)
+        if result:
+            return result
+
+        mock_list = await cls.get_mock_stock_list()
+        await aswr_set(cache_key, mock_list, 'mock', MOCK_SOFT_TTL, 3600)
+        return SWRResult(mock_list, 'mock', 0.0, False)
+
+    @classmethod
+    async def get_stock_list(cls):
+        """Get list of all stocks"""
+        result = await cls.get_stock_list_result()
+        return result.value
+
+    @classmethod
+    async def _fetch_stock_list(cls):
+        """Fetch /CompanyList: (data, source), or None on failure"""
+        try:
+            response = await anepse_get("/CompanyList")
+            if response.status_code == 200:
+                return response.json(), 'live'
+        except Exception as e:
+            logger.error(f"Failed to fetch stock list: {e}")
+        return None
+
+    @classmethod
+    async def get_market_summary(cls):
+        """Get market summary (top gainers, losers, etc)"""
+        try:
+            response = await anepse_get("/Summary")
+            if response.status_code == 200:
+                return response.json()
+        except Exception as e:
+            logger.error(f"Failed to fetch market summary: {e}")
+        return None
+
+    @classmethod
+    async def get_top_gainers(cls, limit=5, summary=None):
+        """Get top gaining stocks (pass summary to avoid a second fetch)"""
+        summary = summary if summary is not None else await cls.get_market_summary()
+        if summary and 'topGainers' in summary:
+            return summary['topGainers'][:limit]
+        return []
+
+    @classmethod
+    async def get_top_losers(cls, limit=5, summary=None):
+        """Get top losing stocks (pass summary to avoid a second fetch)"""
+        summary = summary if summary is not None else await cls.get_market_summary()
+        if summary and 'topLosers' in summary:
+            return summary['topLosers'][:limit]
+        return []
+
+    @classmethod
+    async def get_nepse_index(cls):
+        """Get current NEPSE index"""
+        try:
+            response = await anepse_get("/NepseIndex")
+            if response.status_code == 200:
+                return response.json()
+        except Exception as e:
+            logger.error(f"Failed to fetch NEPSE index: {e}")
+        return None
+
+    @classmethod
+    async def get_intraday_result(cls, symbol, days=1):
+        """Intraday candles wrapped in an SWRResult (see NepseClient)"""
+        mock_key = f'intraday_{symbol}_{days}_mock'
+
+        mock = await aswr_peek(mock_key)
+        if mock and not mock.stale:
+            return mock
+
+        soft_ttl, hard_ttl = intraday_cache_ttls(await cls.get_market_status())
+        result = await CandleStore.aget_window(
+            symbol, days, lambda window: cls._fetch_intraday_rows(symbol, window), soft_ttl, hard_ttl
+        )
+        if result:
+            return result
+
+        logger.info(f"Generating mock intraday data for {symbol}")
+        mock_data = await cls.generate_mock_intraday(symbol, days)
+        await aswr_set(mock_key, mock_data, 'mock', MOCK_SOFT_TTL, 300)
+        return SWRResult(mock_data, 'mock', 0.0, False)
+
+    @classmethod
+    async def get_intraday_data(cls, symbol, days=1):
+        """Get intraday candlestick data for chart"""
+        result = await cls.get_intraday_result(symbol, days)
+        return result.value
+
+    @classmethod
+    async def _fetch_intraday_rows(cls, symbol, days):
+        """Raw /stockIntraday rows, or None on failure"""
+        try:
+            response = await anepse_get(
+                "/stockIntraday",
+                params={'symbol': symbol, 'days': days if days > 1 else None}
+            )
+            if response.status_code == 200:
+                data = response.json()
+                logger.info(f"Got intraday data for {symbol}: {len(data)} points")
+                return data
+        except CircuitOpenError as e:
+            logger.warning(f"Skipping NEPSE call: {e}")
+        except httpx.ConnectError:
+            logger.error(f"Cannot connect to NEPSE API at {cls.BASE_URL}")
+        except Exception as e:
+            logger.error(f"Failed to fetch intraday for {symbol}: {e}")
+        return None
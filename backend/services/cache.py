@@ -0,0 +1,363 @@
+# services/cache.py
+import math
+import os
+import time
+import uuid
+import asyncio
+import logging
+import threading
+import weakref
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from django.core.cache import cache
+from django.db import close_old_connections
+from services.nepse_http import worst_case_request_time
+
+logger = logging.getLogger(__name__)
+
+# Slack on top of the worst-case upstream call for parsing and cache writes
+LOCK_MARGIN = 5
+POLL_INTERVAL = 0.05
+# Threads shared by all background refreshes in a worker
+REFRESH_WORKERS = 4
+# Last good value, kept well past the normal TTL so followers have something to serve
+LAST_VALUE_TIMEOUT = 60 * 60 * 24
+
+_local_locks = {}
+_local_locks_guard = threading.Lock()
+
+_refresh_executor = None
+_refresh_executor_pid = None
+
+# Per event loop: cache key -> in-flight asyncio.Task
+_async_inflight = weakref.WeakKeyDictionary()
+
+# What swr_get hands back: the value plus where it came from and how old it is
+SWRResult = namedtuple('SWRResult', ['value', 'source', 'age', 'stale'])
+
+
+def lock_timeout():
+    """
+    Cross-worker lock lifetime: one upstream call with every retry timing
+    out, so the lock never lapses while its leader is still fetching.
+    """
+    return math.ceil(worst_case_request_time()) + LOCK_MARGIN
+
+
+def follower_wait():
+    """
+    How long a follower waits for the leader's result: as long as the
+    leader's fetch may take, so a slow upstream still gets a single call.
+    """
+    return worst_case_request_time()
+
+
+def lock_key(key):
+    return f'{key}:lock'
+
+
+def last_value_key(key):
+    return f'{key}:last'
+
+
+def _get_local_lock(key):
+    with _local_locks_guard:
+        lock = _local_locks.get(key)
+        if lock is None:
+            lock = _local_locks[key] = threading.Lock()
+        return lock
+
+
+def _release(key, token):
+    # Only drop the lock if we still own it (it may have expired and been re-taken)
+    if cache.get(lock_key(key)) == token:
+        cache.delete(lock_key(key))
+
+
+def _remember(key, value):
+    if value is not None:
+        cache.set(last_value_key(key), value, LAST_VALUE_TIMEOUT)
+
+
+def single_flight(key, fetch, wait_timeout=None):
+    """
+    Coalesce cache misses on `key` so only one fetch() runs at a time.
+
+    fetch() does the upstream call and writes `key` itself (it knows the
+    right TTL). Within a worker, threads queue on a local lock and re-check
+    the cache; across workers, a short cache.add() lock elects one leader
+    while the others poll for its result. Followers that time out get the
+    previous good value, and only fetch themselves if there is none.
+    wait_timeout defaults to follower_wait().
+    """
+    cached = cache.get(key)
+    if cached:
+        return cached
+    wait_timeout = wait_timeout or follower_wait()
+
+    local_lock = _get_local_lock(key)
+    if not local_lock.acquire(timeout=wait_timeout):
+        logger.warning(f"Timed out waiting for local fetch of {key}")
+        return cache.get(key) or cache.get(last_value_key(key))
+
+    try:
+        # Another thread in this worker may have filled it while we waited
+        cached = cache.get(key)
+        if cached:
+            return cached
+
+        token = uuid.uuid4().hex
+        if cache.add(lock_key(key), token, lock_timeout()):
+            try:
+                value = fetch()
+                _remember(key, value)
+                return value
+            finally:
+                _release(key, token)
+
+        # Another worker is fetching - wait for it to publish
+        logger.debug(f"Waiting on in-flight fetch of {key}")
+        deadline = time.monotonic() + wait_timeout
+        while time.monotonic() < deadline:
+            time.sleep(POLL_INTERVAL)
+            cached = cache.get(key)
+            if cached:
+                return cached
+            if cache.get(lock_key(key)) is None:
+                break
+
+        previous = cache.get(last_value_key(key))
+        if previous is not None:
+            logger.info(f"Serving previous value for {key}")
+            return previous
+
+        value = fetch()
+        _remember(key, value)
+        return value
+    finally:
+        local_lock.release()
+
+
+async def _async_lead(key, fetch, wait_timeout):
+    token = uuid.uuid4().hex
+    if await cache.aadd(lock_key(key), token, lock_timeout()):
+        try:
+            value = await fetch()
+            if value is not None:
+                await cache.aset(last_value_key(key), value, LAST_VALUE_TIMEOUT)
+            return value
+        finally:
+            if await cache.aget(lock_key(key)) == token:
+                await cache.adelete(lock_key(key))
+
+    deadline = time.monotonic() + wait_timeout
+    while time.monotonic() < deadline:
+        await asyncio.sleep(POLL_INTERVAL)
+        cached = await cache.aget(key)
+        if cached:
+            return cached
+        if await cache.aget(lock_key(key)) is None:
+            break
+
+    previous = await cache.aget(last_value_key(key))
+    if previous is not None:
+        return previous
+
+    value = await fetch()
+    if value is not None:
+        await cache.aset(last_value_key(key), value, LAST_VALUE_TIMEOUT)
+    return value
+
+
+async def asingle_flight(key, fetch, wait_timeout=None):
+    """
+    asyncio flavour of single_flight: coroutines on the same loop share one
+    task per key, and workers coordinate through the same cache lock.
+    """
+    cached = await cache.aget(key)
+    if cached:
+        return cached
+    wait_timeout = wait_timeout or follower_wait()
+
+    loop = asyncio.get_running_loop()
+    inflight = _async_inflight.setdefault(loop, {})
+    task = inflight.get(key)
+    if task is None:
+        task = loop.create_task(_async_lead(key, fetch, wait_timeout))
+        inflight[key] = task
+        task.add_done_callback(lambda t: inflight.pop(key, None))
+
+    # shield() so one cancelled waiter doesn't cancel the shared fetch
+    return await asyncio.shield(task)
+
+
+# === Stale-while-revalidate ===
+#
+# Entries are stored as envelopes {'value', 'source', 'fetched_at',
+# 'soft_ttl', 'hard_expires_at', 'next_refresh_at'} with the *hard* TTL as
+# the cache timeout. Between soft and hard expiry the stale value is served
+# immediately and a single background refresh is kicked off. fetch()
+# returns (value, source) or None on failure; it must not fall back to mock
+# data itself, so a real-but-old value always wins over mock.
+
+
+def _envelope(value, source, soft_ttl, hard_ttl):
+    now = time.time()
+    return {
+        'value': value,
+        'source': source,
+        'fetched_at': now,
+        'soft_ttl': soft_ttl,
+        'hard_expires_at': now + hard_ttl,
+        'next_refresh_at': now + soft_ttl,
+    }
+
+
+def _to_result(envelope):
+    age = max(0.0, time.time() - envelope['fetched_at'])
+    return SWRResult(envelope['value'], envelope['source'], age, age > envelope['soft_ttl'])
+
+
+def _remaining(envelope):
+    return max(1, int(envelope['hard_expires_at'] - time.time()))
+
+
+def swr_set(key, value, source, soft_ttl, hard_ttl):
+    """Store a value as a fresh envelope"""
+    envelope = _envelope(value, source, soft_ttl, hard_ttl)
+    cache.set(key, envelope, hard_ttl)
+    return envelope
+
+
+def _swr_fetch(key, fetch, soft_ttl, hard_ttl):
+    try:
+        fetched = fetch()
+    except Exception as e:
+        logger.error(f"Refresh of {key} failed: {e}")
+        fetched = None
+
+    if fetched is None:
+        # Keep the stale copy, but don't retry on every request
+        envelope = cache.get(key)
+        if envelope:
+            envelope['next_refresh_at'] = time.time() + min(soft_ttl, 30)
+            cache.set(key, envelope, _remaining(envelope))
+        return None
+
+    value, source = fetched
+    return swr_set(key, value, source, soft_ttl, hard_ttl)
+
+
+def _get_refresh_executor():
+    """Shared pool for background refreshes, rebuilt after a fork like the HTTP session"""
+    global _refresh_executor, _refresh_executor_pid
+    pid = os.getpid()
+    if _refresh_executor is None or _refresh_executor_pid != pid:
+        with _local_locks_guard:
+            if _refresh_executor is None or _refresh_executor_pid != pid:
+                _refresh_executor = ThreadPoolExecutor(max_workers=REFRESH_WORKERS, thread_name_prefix='swr-refresh')
+                _refresh_executor_pid = pid
+    return _refresh_executor
+
+
+def _background_refresh(key, fetch, soft_ttl, hard_ttl):
+    token = uuid.uuid4().hex
+    if not cache.add(lock_key(key), token, lock_timeout()):
+        return  # someone (here or in another worker) is already refreshing
+
+    def run():
+        try:
+            _swr_fetch(key, fetch, soft_ttl, hard_ttl)
+        finally:
+            _release(key, token)
+            # fetch() may touch the DB; don't leave the pool thread holding a connection
+            close_old_connections()
+
+    _get_refresh_executor().submit(run)
+
+
+def swr_get(key, fetch, soft_ttl, hard_ttl):
+    """
+    Read-through cache with stale-while-revalidate.
+    Returns an SWRResult, or None when there is no data at all and the
+    upstream fetch failed (callers decide on their own fallback).
+    """
+    envelope = cache.get(key)
+    if envelope is None:
+        envelope = single_flight(key, lambda: _swr_fetch(key, fetch, soft_ttl, hard_ttl))
+        return _to_result(envelope) if envelope else None
+
+    result = _to_result(envelope)
+    if result.stale and time.time() >= envelope.get('next_refresh_at', 0):
+        logger.debug(f"Serving stale {key} ({result.age:.0f}s old), refreshing in background")
+        _background_refresh(key, fetch, soft_ttl, hard_ttl)
+    return result
+
+
+async def aswr_set(key, value, source, soft_ttl, hard_ttl):
+    envelope = _envelope(value, source, soft_ttl, hard_ttl)
+    await cache.aset(key, envelope, hard_ttl)
+    return envelope
+
+
+async def _aswr_fetch(key, fetch, soft_ttl, hard_ttl):
+    try:
+        fetched = await fetch()
+    except Exception as e:
+        logger.error(f"Refresh of {key} failed: {e}")
+        fetched = None
+
+    if fetched is None:
+        envelope = await cache.aget(key)
+        if envelope:
+            envelope['next_refresh_at'] = time.time() + min(soft_ttl, 30)
+            await cache.aset(key, envelope, _remaining(envelope))
+        return None
+
+    value, source = fetched
+    return await aswr_set(key, value, source, soft_ttl, hard_ttl)
+
+
+_background_tasks = set()
+
+
+async def _abackground_refresh(key, fetch, soft_ttl, hard_ttl):
+    token = uuid.uuid4().hex
+    if not await cache.aadd(lock_key(key), token, lock_timeout()):
+        return
+
+    async def run():
+        try:
+            await _aswr_fetch(key, fetch, soft_ttl, hard_ttl)
+        finally:
+            if await cache.aget(lock_key(key)) == token:
+                await cache.adelete(lock_key(key))
+
+    # Keep a reference so the task isn't garbage-collected mid-flight
+    task = asyncio.get_running_loop().create_task(run())
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
+async def aswr_get(key, fetch, soft_ttl, hard_ttl):
+    """asyncio flavour of swr_get"""
+    envelope = await cache.aget(key)
+    if envelope is None:
+        envelope = await asingle_flight(key, lambda: _aswr_fetch(key, fetch, soft_ttl, hard_ttl))
+        return _to_result(envelope) if envelope else None
+
+    result = _to_result(envelope)
+    if result.stale and time.time() >= envelope.get('next_refresh_at', 0):
+        await _abackground_refresh(key, fetch, soft_ttl, hard_ttl)
+    return result
+
+
+def swr_peek(key):
+    """Read an envelope as an SWRResult without ever fetching or refreshing"""
+    envelope = cache.get(key)
+    return _to_result(envelope) if envelope else None
+
+
+async def aswr_peek(key):
+    envelope = await cache.aget(key)
+    return _to_result(envelope) if envelope else None
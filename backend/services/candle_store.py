@@ -0,0 +1,248 @@
+# services/candle_store.py
+import logging
+from datetime import datetime
+import pytz
+from django.core.cache import cache
+from services.cache import (
+    swr_get, aswr_get, single_flight, asingle_flight, SWRResult,
+)
+
+logger = logging.getLogger(__name__)
+
+# Intraday candles are kept per symbol as one segment per trading session:
+#   candles_<SYM>_<YYYY-MM-DD>  a completed session, immutable, cached forever
+#   candles_<SYM>_live          the latest session, grown by appending new bars
+#   candles_<SYM>_sessions      sorted dates of the completed segments we hold
+# A `days` window is the live segment plus the days-1 sessions before it, so
+# every window size shares the same cached bars and the same upstream polls.
+
+NEPAL_TZ = pytz.timezone('Asia/Kathmandu')
+# Completed segments and the session index never expire
+FOREVER = None
+BACKFILL_TIMEOUT = 60 * 60 * 24
+
+
+def segment_key(symbol, day):
+    return f'candles_{symbol}_{day}'
+
+
+def live_key(symbol):
+    return f'candles_{symbol}_live'
+
+
+def sessions_key(symbol):
+    return f'candles_{symbol}_sessions'
+
+
+def backfill_key(symbol, live_day, days):
+    # Set once a window was backfilled, so a symbol with less history than
+    # asked for doesn't refetch on every request
+    return f'candles_{symbol}_backfill_{live_day}_{days}'
+
+
+def today():
+    return datetime.now(NEPAL_TZ).date().isoformat()
+
+
+def bar_time(item):
+    # Handle different possible date formats
+    return item.get('date') or item.get('time') or item.get('timestamp')
+
+
+def format_bar(item):
+    """One /stockIntraday row as a chart candle"""
+    return {
+        'time': bar_time(item),
+        'open': float(item.get('open', 0)),
+        'high': float(item.get('high', 0)),
+        'low': float(item.get('low', 0)),
+        'close': float(item.get('close', 0)),
+        'volume': int(item.get('volume', 0))
+    }
+
+
+def bar_day(candle):
+    return str(candle['time'])[:10]
+
+
+def merge_bars(candles, rows):
+    """
+    Append the upstream rows at or after our last bar. Only those rows are
+    parsed and sorted; the last bar is replaced since it may still be forming.
+    Returns (candles, number of bars added or revised).
+    """
+    last_time = candles[-1]['time'] if candles else ''
+    fresh = [format_bar(row) for row in rows if str(bar_time(row) or '') >= str(last_time)]
+    if not fresh:
+        return candles, 0
+
+    fresh.sort(key=lambda x: x['time'])
+    if candles and fresh[0]['time'] == last_time:
+        candles = candles[:-1]
+    return candles + fresh, len(fresh)
+
+
+def split_sessions(candles):
+    """Sorted candles -> [(day, candles)] in day order"""
+    sessions = []
+    for candle in candles:
+        day = bar_day(candle)
+        if not sessions or sessions[-1][0] != day:
+            sessions.append((day, []))
+        sessions[-1][1].append(candle)
+    return sessions
+
+
+def _advance_live(live, rows):
+    """
+    Merge new rows into the live segment. When bars for a newer session
+    show up, the old live segment is complete: it is returned in `finished`
+    so the caller can freeze it.
+    """
+    candles, added = merge_bars(live['candles'] if live else [], rows)
+    sessions = split_sessions(candles)
+    if not sessions:
+        return live, [], added
+
+    finished = sessions[:-1]
+    day, current = sessions[-1]
+    return {'day': day, 'candles': current}, finished, added
+
+
+def _freeze(symbol, finished):
+    """Store completed sessions forever and record them in the session index"""
+    if not finished:
+        return
+    cache.set_many({segment_key(symbol, day): candles for day, candles in finished}, FOREVER)
+    known = set(cache.get(sessions_key(symbol), []))
+    known.update(day for day, _ in finished)
+    cache.set(sessions_key(symbol), sorted(known), FOREVER)
+    logger.info(f"Froze {len(finished)} completed intraday session(s) for {symbol}")
+
+
+async def _afreeze(symbol, finished):
+    if not finished:
+        return
+    await cache.aset_many({segment_key(symbol, day): candles for day, candles in finished}, FOREVER)
+    known = set(await cache.aget(sessions_key(symbol), []))
+    known.update(day for day, _ in finished)
+    await cache.aset(sessions_key(symbol), sorted(known), FOREVER)
+
+
+def _past_days(sessions, live_day, days):
+    """The completed sessions a `days` window needs, oldest first"""
+    if days <= 1:
+        return []
+    return [day for day in sessions if day < live_day][-(days - 1):]
+
+
+class CandleStore:
+    """
+    Per-symbol intraday candles, refreshed incrementally.
+    fetch(days) returns raw /stockIntraday rows or None on failure; the
+    store never falls back to mock data itself.
+    """
+
+    @classmethod
+    def _refresh_live(cls, symbol, fetch):
+        envelope = cache.get(live_key(symbol))
+        live = envelope['value'] if envelope else None
+
+        rows = fetch(1)
+        if rows is None:
+            return None
+
+        live, finished, added = _advance_live(live, rows)
+        _freeze(symbol, finished)
+        if live is None:
+            return None
+        logger.debug(f"{symbol}: {added} new/revised bars, {len(live['candles'])} in session {live['day']}")
+
+        # A session from an earlier date is over even if nothing newer arrived yet
+        if live['day'] < today():
+            _freeze(symbol, [(live['day'], live['candles'])])
+        return live, 'live'
+
+    @classmethod
+    def _backfill(cls, symbol, days, fetch, marker):
+        """Fetch a multi-day window once and freeze every completed session in it"""
+        rows = fetch(days)
+        if rows is None:
+            return None
+        candles = sorted((format_bar(row) for row in rows), key=lambda x: x['time'])
+        # The newest session belongs to the live segment
+        _freeze(symbol, split_sessions(candles)[:-1])
+        cache.set(marker, True, BACKFILL_TIMEOUT)
+        return True
+
+    @classmethod
+    def get_window(cls, symbol, days, fetch, soft_ttl, hard_ttl):
+        """Candles for the last `days` sessions as an SWRResult, or None if we have nothing"""
+        result = swr_get(live_key(symbol), lambda: cls._refresh_live(symbol, fetch), soft_ttl, hard_ttl)
+        if result is None:
+            return None
+        live = result.value
+
+        past = _past_days(cache.get(sessions_key(symbol), []), live['day'], days)
+        marker = backfill_key(symbol, live['day'], days)
+        if len(past) < days - 1 and not cache.get(marker):
+            single_flight(marker, lambda: cls._backfill(symbol, days, fetch, marker))
+            past = _past_days(cache.get(sessions_key(symbol), []), live['day'], days)
+
+        segments = cache.get_many([segment_key(symbol, day) for day in past])
+        candles = []
+        for day in past:
+            candles.extend(segments.get(segment_key(symbol, day), []))
+        candles.extend(live['candles'])
+        return SWRResult(candles, result.source, result.age, result.stale)
+
+    # --- asyncio flavour (same keys, same segments) ---
+
+    @classmethod
+    async def _arefresh_live(cls, symbol, fetch):
+        envelope = await cache.aget(live_key(symbol))
+        live = envelope['value'] if envelope else None
+
+        rows = await fetch(1)
+        if rows is None:
+            return None
+
+        live, finished, added = _advance_live(live, rows)
+        await _afreeze(symbol, finished)
+        if live is None:
+            return None
+        if live['day'] < today():
+            await _afreeze(symbol, [(live['day'], live['candles'])])
+        return live, 'live'
+
+    @classmethod
+    async def _abackfill(cls, symbol, days, fetch, marker):
+        rows = await fetch(days)
+        if rows is None:
+            return None
+        candles = sorted((format_bar(row) for row in rows), key=lambda x: x['time'])
+        await _afreeze(symbol, split_sessions(candles)[:-1])
+        await cache.aset(marker, True, BACKFILL_TIMEOUT)
+        return True
+
+    @classmethod
+    async def aget_window(cls, symbol, days, fetch, soft_ttl, hard_ttl):
+        result = await aswr_get(
+            live_key(symbol), lambda: cls._arefresh_live(symbol, fetch), soft_ttl, hard_ttl
+        )
+        if result is None:
+            return None
+        live = result.value
+
+        past = _past_days(await cache.aget(sessions_key(symbol), []), live['day'], days)
+        marker = backfill_key(symbol, live['day'], days)
+        if len(past) < days - 1 and not await cache.aget(marker):
+            await asingle_flight(marker, lambda: cls._abackfill(symbol, days, fetch, marker))
+            past = _past_days(await cache.aget(sessions_key(symbol), []), live['day'], days)
+
+        segments = await cache.aget_many([segment_key(symbol, day) for day in past])
+        candles = []
+        for day in past:
+            candles.extend(segments.get(segment_key(symbol, day), []))
+        candles.extend(live['candles'])
+        return SWRResult(candles, result.source, result.age, result.stale)
@@ -0,0 +1,145 @@
+# services/circuit_breaker.py
+import time
+import logging
+import threading
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling upstream while a circuit is open"""
+
+    def __init__(self, name, retry_in):
+        self.name = name
+        self.retry_in = retry_in
+        super().__init__(f"Circuit open for {name}, retry in {retry_in:.0f}s")
+
+
+class CircuitBreaker:
+    """
+    Closed -> open when the failure rate over the last WINDOW calls reaches
+    FAILURE_RATE (after at least MIN_CALLS). Open -> half-open after
+    COOL_DOWN seconds; the next probe call closes it again on success or
+    re-opens it on failure. State is per process.
+    """
+
+    def __init__(self, name, window=20, min_calls=5, failure_rate=0.5,
+                 cool_down=30, half_open_calls=1):
+        self.name = name
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.cool_down = cool_down
+        self.half_open_calls = half_open_calls
+
+        self._lock = threading.Lock()
+        self._outcomes = deque(maxlen=window)   # True = success
+        self._state = CLOSED
+        self._opened_at = None
+        self._probes = 0
+        self._rejected = 0
+
+    @property
+    def state(self):
+        with self._lock:
+            self._maybe_half_open()
+            return self._state
+
+    def _maybe_half_open(self):
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.cool_down:
+            self._state = HALF_OPEN
+            self._probes = 0
+            logger.info(f"Circuit {self.name} half-open, probing upstream")
+
+    def _open(self):
+        self._state = OPEN
+        self._opened_at = time.monotonic()
+        logger.warning(
+            f"Circuit {self.name} opened ({self._failures()}/{len(self._outcomes)} "
+            f"recent calls failed), failing fast for {self.cool_down}s"
+        )
+
+    def _failures(self):
+        return sum(1 for ok in self._outcomes if not ok)
+
+    def before_call(self):
+        """Raise CircuitOpenError if this call should not go upstream"""
+        with self._lock:
+            self._maybe_half_open()
+            if self._state == CLOSED:
+                return
+            if self._state == HALF_OPEN and self._probes < self.half_open_calls:
+                self._probes += 1
+                return
+            self._rejected += 1
+            if self._state == OPEN:
+                retry_in = self.cool_down - (time.monotonic() - self._opened_at)
+            else:
+                retry_in = 0  # a probe is already in flight
+            raise CircuitOpenError(self.name, max(0, retry_in))
+
+    def record_success(self):
+        with self._lock:
+            if self._state == HALF_OPEN:
+                logger.info(f"Circuit {self.name} closed, upstream recovered")
+                self._state = CLOSED
+                self._outcomes.clear()
+            self._outcomes.append(True)
+
+    def record_failure(self):
+        with self._lock:
+            self._outcomes.append(False)
+            if self._state == HALF_OPEN:
+                self._open()
+            elif self._state == CLOSED and len(self._outcomes) >= self.min_calls:
+                if self._failures() / len(self._outcomes) >= self.failure_rate:
+                    self._open()
+
+    def reset(self):
+        with self._lock:
+            self._state = CLOSED
+            self._outcomes.clear()
+            self._opened_at = None
+            self._probes = 0
+            self._rejected = 0
+
+    def to_dict(self):
+        with self._lock:
+            self._maybe_half_open()
+            calls = len(self._outcomes)
+            failures = self._failures()
+            retry_in = None
+            if self._state == OPEN:
+                retry_in = round(max(0, self.cool_down - (time.monotonic() - self._opened_at)), 1)
+            return {
+                'name': self.name,
+                'state': self._state,
+                'recent_calls': calls,
+                'recent_failures': failures,
+                'failure_rate': round(failures / calls, 2) if calls else 0.0,
+                'rejected_calls': self._rejected,
+                'retry_in': retry_in,
+            }
+
+
+_breakers = {}
+_breakers_guard = threading.Lock()
+
+
+def get_breaker(name, **options):
+    """Shared breaker for `name`, created on first use"""
+    breaker = _breakers.get(name)
+    if breaker is None:
+        with _breakers_guard:
+            breaker = _breakers.get(name)
+            if breaker is None:
+                breaker = _breakers[name] = CircuitBreaker(name, **options)
+    return breaker
+
+
+def all_breakers():
+    return [breaker.to_dict() for _, breaker in sorted(_breakers.items())]
@@ -0,0 +1,183 @@
+# services/columnar_snapshot.py
+import numpy as np
+
+# Numeric columns, in the order they are built
+COLUMNS = ('ltp', 'open', 'high', 'low', 'prev_close', 'volume', 'pct_change')
+
+# column -> /LiveMarket field
+UPSTREAM_FIELDS = {
+    'ltp': 'lastTradedPrice',
+    'open': 'openPrice',
+    'high': 'highPrice',
+    'low': 'lowPrice',
+    'prev_close': 'previousClose',
+    'pct_change': 'percentageChange',
+    'volume': 'totalTradeQuantity',
+}
+
+
+def _as_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan  # missing or garbage upstream value
+
+
+def _float_column(values):
+    return np.fromiter((_as_float(v) for v in values), dtype=np.float64)
+
+
+def _priced(items):
+    """symbol -> upstream row for rows with a usable price (last row wins)"""
+    rows = {}
+    for item in items:
+        symbol = item.get('symbol')
+        if symbol and not np.isnan(_as_float(item.get('lastTradedPrice'))):
+            rows[symbol] = item
+    return rows
+
+
+class ColumnarSnapshot:
+    """
+    The market as typed arrays, one row per symbol.
+    Market-wide work (ranking, filtering, breadth) becomes a handful of
+    vector ops instead of a Python loop over quote dicts. Rows without a
+    price are left out; other missing prices are NaN, a missing % change
+    is 0 and volume is int64 with missing as 0.
+    """
+
+    __slots__ = ('symbols', 'names', 'sectors', 'updated_at', '_index') + COLUMNS
+
+    def __init__(self, items):
+        """items: /LiveMarket rows"""
+        rows = _priced(items)
+        values = list(rows.values())
+        self.symbols = np.array(list(rows), dtype=str)
+        self.names = [v.get('companyName', v.get('securityName')) or s for s, v in rows.items()]
+        self.sectors = [v.get('sectorName') for v in values]
+        self.updated_at = [v.get('lastUpdatedDateTime') for v in values]
+        self._index = {symbol: row for row, symbol in enumerate(rows)}
+
+        for column, field in UPSTREAM_FIELDS.items():
+            setattr(self, column, _float_column(v.get(field) for v in values))
+        self.pct_change = np.nan_to_num(self.pct_change, nan=0)
+        self.volume = np.nan_to_num(self.volume, nan=0).astype(np.int64)
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def __contains__(self, symbol):
+        return symbol in self._index
+
+    def __getstate__(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
+
+    # --- lookups ---
+
+    def row(self, symbol):
+        """Row index for symbol, or None"""
+        return self._index.get(symbol)
+
+    def rows_for(self, symbols):
+        """Row index per symbol as an int array, -1 where we have no quote"""
+        index = self._index
+        return np.fromiter((index.get(s, -1) for s in symbols), dtype=np.int64, count=len(symbols))
+
+    def column(self, name):
+        if name not in COLUMNS:
+            raise KeyError(f"Unknown column {name!r}, expected one of {COLUMNS}")
+        return getattr(self, name)
+
+    def quote(self, row):
+        """One row back as a plain dict"""
+        return {
+            'symbol': str(self.symbols[row]),
+            'name': self.names[row],
+            **{column: self._scalar(column, row) for column in COLUMNS},
+        }
+
+    def as_lists(self, *columns):
+        """Plain Python lists per column (NaN -> None), for building JSON rows"""
+        lists = []
+        for name in columns:
+            values = self.column(name)
+            if values.dtype.kind == 'f':
+                lists.append(np.where(np.isnan(values), None, values).tolist())
+            else:
+                lists.append(values.tolist())
+        return lists
+
+    def _scalar(self, column, row):
+        value = getattr(self, column)[row].item()
+        return None if value != value else value  # NaN -> None
+
+    # --- vectorized helpers ---
+
+    def mask(self, min_price=None, max_price=None, min_volume=None, symbols=None):
+        """Boolean row mask; every given condition must hold"""
+        mask = ~np.isnan(self.ltp)
+        if min_price is not None:
+            mask &= self.ltp >= min_price
+        if max_price is not None:
+            mask &= self.ltp <= max_price
+        if min_volume is not None:
+            mask &= self.volume >= min_volume
+        if symbols is not None:
+            mask &= np.isin(self.symbols, list(symbols))
+        return mask
+
+    def rank(self, column='pct_change', limit=None, descending=True, mask=None):
+        """Row indices ordered by column (NaNs and masked-out rows dropped)"""
+        values = self.column(column).astype(np.float64)
+        keep = ~np.isnan(values)
+        if mask is not None:
+            keep &= mask
+        rows = np.flatnonzero(keep)
+        keys = -values[rows] if descending else values[rows]
+
+        if limit is not None and limit < len(rows):
+            # Partial selection first, then sort just the winners
+            top = np.argpartition(keys, limit)[:limit]
+            rows, keys = rows[top], keys[top]
+        return rows[np.argsort(keys, kind='stable')]
+
+    def top_movers(self, limit=5, gainers=True):
+        """Biggest % gainers (or losers), shaped like /Summary's topGainers"""
+        mask = self.pct_change > 0 if gainers else self.pct_change < 0
+        rows = self.rank('pct_change', limit=limit, descending=gainers, mask=mask)
+        return [
+            {
+                'symbol': str(self.symbols[row]),
+                'companyName': self.names[row],
+                'lastTradedPrice': self.ltp[row].item(),
+                'percentageChange': self.pct_change[row].item(),
+                'volume': int(self.volume[row]),
+            }
+            for row in rows
+        ]
+
+    def breadth(self):
+        """Advancing / declining / unchanged symbol counts"""
+        change = self.pct_change
+        return {
+            'advances': int(np.count_nonzero(change > 0)),
+            'declines': int(np.count_nonzero(change < 0)),
+            'unchanged': int(np.count_nonzero(change == 0)),
+        }
+
+    def aggregate(self):
+        """Market-wide totals and averages"""
+        priced = ~np.isnan(self.ltp)
+        change = self.pct_change[~np.isnan(self.pct_change)]
+        return {
+            'symbols': len(self),
+            **self.breadth(),
+            'total_volume': int(self.volume.sum()),
+            'turnover': round(float(np.dot(self.ltp[priced], self.volume[priced])), 2),
+            'mean_change': round(float(change.mean()), 2) if change.size else 0.0,
+            'median_change': round(float(np.median(change)), 2) if change.size else 0.0,
+        }
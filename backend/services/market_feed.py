@@ -0,0 +1,145 @@
+# services/market_feed.py
+import time
+import uuid
+import logging
+from django.core.cache import cache
+from services.cache import swr_set
+from services.nepse_http import get_cache_ttls, get_feed_config
+from services.nepse_client import NepseClient, is_market_inactive
+from services.snapshot_diff import DiffEngine
+from services.price_updater import apply_price_deltas
+from services.price_history import record_price_deltas
+from trading.services.order_book import execute_triggered_orders
+from trading.services.opening_batch import execute_pending_at_open
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_KEY = 'nepse_live_prices'
+LEADER_KEY = 'nepse_feed_leader'
+HEARTBEAT_KEY = 'nepse_feed_heartbeat'
+
+
+def default_listeners():
+    """
+    What every feed poller runs on a new snapshot: the market-on-open batch,
+    then the diff engine and its consumers
+    """
+    # Imported here so web workers that only read the heartbeat don't need channels
+    from services.price_broadcast import broadcast_diff
+    return [
+        execute_pending_at_open,
+        DiffEngine(consumers=[apply_price_deltas, execute_triggered_orders, record_price_deltas, broadcast_diff]),
+    ]
+
+
+def get_heartbeat():
+    """Last poll published by the feed: {'at', 'version', 'source', 'count'} or None"""
+    return cache.get(HEARTBEAT_KEY)
+
+
+class MarketFeedPoller:
+    """
+    Polls the upstream at a fixed cadence and publishes each snapshot under
+    the same cache key the clients read, so upstream QPS is bounded by the
+    poll interval no matter how much web traffic there is.
+
+    Only one poller publishes at a time: a cache lock elects the leader and
+    any other instance idles until the lock lapses.
+    """
+
+    def __init__(self, interval=None, closed_interval=None, token=None):
+        config = get_feed_config()
+        self.interval = interval or config['INTERVAL']
+        self.closed_interval = closed_interval or config['CLOSED_INTERVAL']
+        # Pass a per-process token when each poll is a fresh instance (Celery tasks)
+        self.token = token or uuid.uuid4().hex
+        self.listeners = default_listeners()
+
+    @property
+    def lease(self):
+        # Outlive a slow poll, but let a standby take over soon after a crash
+        return int(self.closed_interval * 2 + 10)
+
+    def add_listener(self, callback):
+        """callback(snapshot, previous) runs after every published snapshot"""
+        self.listeners.append(callback)
+
+    def acquire_leadership(self):
+        if cache.get(LEADER_KEY) == self.token:
+            cache.touch(LEADER_KEY, self.lease)
+            return True
+        return cache.add(LEADER_KEY, self.token, self.lease)
+
+    def release_leadership(self):
+        if cache.get(LEADER_KEY) == self.token:
+            cache.delete(LEADER_KEY)
+
+    def poll_due(self):
+        """
+        For one-shot schedulers that fire at the open-market cadence: skip
+        polls that would exceed the closed-market cadence.
+        """
+        heartbeat = get_heartbeat()
+        if heartbeat is None or not is_market_inactive(cache.get('nepse_market_status')):
+            return True
+        return time.time() - heartbeat['at'] >= self.closed_interval
+
+    def poll_once(self):
+        """
+        Fetch and publish one snapshot. Returns the market status so the
+        caller can pick the next interval.
+        """
+        # Refresh the status on every poll so requests never fetch it either
+        market_status = NepseClient._fetch_market_status() or NepseClient.get_market_status()
+
+        fetched = NepseClient._fetch_snapshot()
+        if fetched is None:
+            # Keep whatever is published; it will age and show up as stale
+            logger.warning("Feed poll failed, keeping the last published snapshot")
+            return market_status
+
+        snapshot, source = fetched
+        previous = cache.get(SNAPSHOT_KEY)
+        previous = previous['value'] if previous else None
+        soft_ttl, hard_ttl = get_cache_ttls('live_prices')
+        # A healthy feed must never look stale between two polls
+        soft_ttl = max(soft_ttl, self.closed_interval * 2)
+        swr_set(SNAPSHOT_KEY, snapshot, source, soft_ttl, hard_ttl)
+        cache.set(HEARTBEAT_KEY, {
+            'at': time.time(),
+            'version': snapshot.version,
+            'source': source,
+            'count': len(snapshot),
+        }, hard_ttl)
+        logger.debug(f"Published snapshot v{snapshot.version} ({len(snapshot)} quotes, {source})")
+
+        for callback in self.listeners:
+            try:
+                callback(snapshot, previous)
+            except Exception as e:
+                logger.error(f"Feed listener {callback!r} failed: {e}")
+
+        return market_status
+
+    def next_interval(self, market_status):
+        return self.closed_interval if is_market_inactive(market_status) else self.interval
+
+    def run(self, max_polls=None):
+        """Poll until interrupted (or max_polls published)"""
+        polls = 0
+        logger.info(f"Market feed starting: every {self.interval}s open, {self.closed_interval}s closed")
+        try:
+            while max_polls is None or polls < max_polls:
+                started = time.monotonic()
+                if self.acquire_leadership():
+                    market_status = self.poll_once()
+                    polls += 1
+                    if max_polls is not None and polls >= max_polls:
+                        break
+                    delay = self.next_interval(market_status)
+                else:
+                    logger.debug("Another feed poller is leading, standing by")
+                    delay = self.interval
+                time.sleep(max(0, delay - (time.monotonic() - started)))
+        finally:
+            self.release_leadership()
@@ -0,0 +1,407 @@
+# services/market_simulator.py
+import time
+import zlib
+import logging
+import threading
+from datetime import datetime, timedelta
+import numpy as np
+import pytz
+
+logger = logging.getLogger(__name__)
+
+NEPAL_TZ = pytz.timezone('Asia/Kathmandu')
+
+SESSION_SECONDS = 4 * 60 * 60               # 11:00 - 15:00 NPT
+SESSION_OPEN = (11, 0)
+TRADING_DAYS_PER_YEAR = 230
+TICK_SIZE = 0.1
+# Largest block of seconds simulated in one go (bounds memory to chunk x symbols)
+MAX_CHUNK = 900
+# Most wall-clock seconds advance_to_now() replays; a longer idle gap is skipped
+MAX_CATCH_UP = 900
+# Price every past-session chain starts from; intraday() rescales it to the live close
+HISTORY_BASE = 100.0
+
+DEFAULTS = {
+    'annual_vol': 0.30,         # median annualised volatility
+    'drift': 0.0,               # annualised drift
+    'market_weight': 0.30,      # share of variance from the market factor
+    'sector_weight': 0.30,      # ... from the symbol's sector factor
+    'circuit_limit': 0.10,      # +/- band around previous close
+    'median_daily_volume': 20000,
+    'warmup': 30 * 60,          # seconds of history simulated on start
+}
+
+
+def round_tick(values):
+    return np.round(np.asarray(values) / TICK_SIZE) * TICK_SIZE
+
+
+def volume_curve(seconds):
+    """U-shaped intraday activity (busy open and close), mean 1 over a session"""
+    x = np.asarray(seconds, dtype=np.float64) / SESSION_SECONDS
+    return (1 + 2 * (2 * x - 1) ** 2) / (5 / 3)
+
+
+def stable_key(name):
+    """Seed component for a symbol or sector name, the same in every process"""
+    return zlib.crc32(name.encode())
+
+
+def previous_trading_days(before, count):
+    """The `count` NEPSE trading days (Sun-Thu) before `before`, oldest first"""
+    days = []
+    day = before
+    while len(days) < count:
+        day -= timedelta(days=1)
+        if day.weekday() not in (4, 5):  # Friday, Saturday
+            days.append(day)
+    return days[::-1]
+
+
+def ohlc(prices, starts):
+    """
+    Reduce (T, n) second-level prices into bars that begin at the row
+    offsets in `starts`. Returns open, high, low, close arrays of shape
+    (len(starts), n).
+    """
+    ends = np.r_[starts[1:], len(prices)] - 1
+    return (
+        prices[starts],
+        np.maximum.reduceat(prices, starts, axis=0),
+        np.minimum.reduceat(prices, starts, axis=0),
+        prices[ends],
+    )
+
+
+class MarketSimulator:
+    """
+    Seeded, vectorised market: every symbol follows a geometric Brownian
+    motion whose shocks mix a market factor, a per-sector factor and its own
+    noise, so sectors move together. Volume follows a U-shaped intraday curve
+    and prices are clipped to the circuit band around the previous close.
+
+    The live session advances with step()/advance_to_now() and records
+    minute bars; past sessions are regenerated deterministically from
+    (seed, date, symbol), so any symbol's history is stable across calls,
+    workers and restarts, whatever else is in the universe or its prices.
+    """
+
+    def __init__(self, universe, seed=0, **options):
+        """universe: iterable of {'symbol', 'name', 'sector', 'price'}"""
+        config = dict(DEFAULTS)
+        config.update(options)
+        self.config = config
+        self.seed = seed
+        self.lock = threading.RLock()
+
+        universe = list(universe)
+        self.symbols = [u['symbol'] for u in universe]
+        self.names = [u.get('name') or u['symbol'] for u in universe]
+        self.index = {symbol: i for i, symbol in enumerate(self.symbols)}
+        sectors = sorted({u.get('sector') or 'Others' for u in universe})
+        self.sector_names = sectors
+        self.sectors = [u.get('sector') or 'Others' for u in universe]
+        self.sector_idx = np.array([sectors.index(s) for s in self.sectors], dtype=np.int64)
+        self.base = np.array([float(u['price']) for u in universe], dtype=np.float64)
+
+        # Per-symbol character: some names are jumpier / more liquid than others
+        self.keys = [stable_key(symbol) for symbol in self.symbols]
+        character = np.array([
+            np.random.default_rng([seed, 0, key]).lognormal(0, [0.25, 0.8]) for key in self.keys
+        ]).reshape(len(self), 2)
+        self.vol = config['annual_vol'] * character[:, 0]
+        self.adv = config['median_daily_volume'] * character[:, 1]
+
+        self._live_rng = np.random.default_rng([seed, 1])
+        now = time.time()
+        self._start_session(self.base.copy(), started_at=now - config['warmup'])
+        self.step(config['warmup'])
+        self._last_wall = now
+
+    def __len__(self):
+        return len(self.symbols)
+
+    # --- core maths ---
+
+    def _correlate(self, z_market, z_sector, z_idio, cols):
+        wm, ws = self.config['market_weight'], self.config['sector_weight']
+        return (np.sqrt(wm) * z_market[:, None]
+                + np.sqrt(ws) * z_sector[:, self.sector_idx[cols]]
+                + np.sqrt(1 - wm - ws) * z_idio)
+
+    def _prices(self, shocks, start_log, prev_close, cols):
+        """
+        GBM path from latent log prices start_log. Returns the clipped
+        (T, n) prices and the unclipped latent log price at the end.
+        """
+        dt = 1 / (TRADING_DAYS_PER_YEAR * SESSION_SECONDS)
+        sigma = self.vol[cols]
+        log_returns = (self.config['drift'] - 0.5 * sigma ** 2) * dt + sigma * np.sqrt(dt) * shocks
+        log_path = start_log + np.cumsum(log_returns, axis=0)
+        band = self.config['circuit_limit']
+        prices = np.clip(np.exp(log_path), prev_close * (1 - band), prev_close * (1 + band))
+        return prices, log_path[-1]
+
+    def _intensity(self, t0, steps, cols):
+        """Expected shares traded per second, (steps, n)"""
+        curve = volume_curve(t0 + np.arange(steps))
+        return curve[:, None] * (self.adv[cols] / SESSION_SECONDS)[None, :]
+
+    # --- live session ---
+
+    def _start_session(self, prev_close, started_at):
+        self.session_start = started_at
+        self.t = 0
+        self.prev_close = prev_close
+        self.open = prev_close.copy()
+        self.price = prev_close.copy()
+        self.high = prev_close.copy()
+        self.low = prev_close.copy()
+        self.volume = np.zeros(len(self), dtype=np.int64)
+        self._latent = np.log(prev_close)
+        self._bars = []  # [minute, open, high, low, close, volume] with (n,) arrays
+
+    def _roll(self):
+        """Close the session and open the next one from today's closes"""
+        close = round_tick(self.price)
+        self._start_session(close, started_at=self.session_start + SESSION_SECONDS)
+        logger.debug(f"Simulator rolled to a new session ({len(self)} symbols)")
+
+    def step(self, seconds=1):
+        """Advance the live session by `seconds` one-second ticks"""
+        with self.lock:
+            seconds = int(seconds)
+            while seconds > 0:
+                if self.t >= SESSION_SECONDS:
+                    self._roll()
+                chunk = min(seconds, SESSION_SECONDS - self.t, MAX_CHUNK)
+                self._advance(chunk)
+                seconds -= chunk
+
+    def _advance(self, steps):
+        rng = self._live_rng
+        cols = slice(None)
+        shocks = self._correlate(
+            rng.standard_normal(steps),
+            rng.standard_normal((steps, len(self.sector_names))),
+            rng.standard_normal((steps, len(self))),
+            cols,
+        )
+        prices, self._latent = self._prices(shocks, self._latent, self.prev_close, cols)
+        volumes = rng.poisson(self._intensity(self.t, steps, cols))
+
+        self._record_bars(prices, volumes)
+        self.price = prices[-1]
+        self.high = np.maximum(self.high, prices.max(axis=0))
+        self.low = np.minimum(self.low, prices.min(axis=0))
+        self.volume += volumes.sum(axis=0)
+        self.t += steps
+
+    def _record_bars(self, prices, volumes):
+        minutes = (self.t + np.arange(len(prices))) // 60
+        starts = np.flatnonzero(np.r_[True, minutes[1:] != minutes[:-1]])
+        o, h, l, c = ohlc(prices, starts)
+        v = np.add.reduceat(volumes, starts, axis=0)
+
+        first = 0
+        if self._bars and self._bars[-1][0] == minutes[0]:
+            # Chunk continues a minute that's already open
+            bar = self._bars[-1]
+            bar[2] = np.maximum(bar[2], h[0])
+            bar[3] = np.minimum(bar[3], l[0])
+            bar[4] = c[0]
+            bar[5] = bar[5] + v[0]
+            first = 1
+        for k in range(first, len(starts)):
+            self._bars.append([int(minutes[starts[k]]), o[k], h[k], l[k], c[k], v[k]])
+
+    def advance_to_now(self):
+        """
+        Catch the live session up with the wall clock. At most MAX_CATCH_UP
+        seconds are simulated; after a longer idle gap the session carries on
+        from where it stopped instead of replaying the whole gap.
+        """
+        with self.lock:
+            now = time.time()
+            elapsed = min(int(now - self._last_wall), MAX_CATCH_UP)
+            if elapsed > 0:
+                self.step(elapsed)
+                self._last_wall = now
+
+    # --- live views ---
+
+    def pct_change(self):
+        return np.round((self.price - self.prev_close) / self.prev_close * 100, 2)
+
+    def live_rows(self):
+        """/LiveMarket-shaped rows for the whole universe"""
+        with self.lock:
+            price, high, low = round_tick(self.price), round_tick(self.high), round_tick(self.low)
+            prev, opening = round_tick(self.prev_close), round_tick(self.open)
+            change, volume = self.pct_change(), self.volume
+            stamp = datetime.fromtimestamp(self.session_start + self.t, NEPAL_TZ).isoformat()
+            return [
+                {
+                    'symbol': symbol,
+                    'securityName': self.names[i],
+                    'companyName': self.names[i],
+                    'sectorName': self.sectors[i],
+                    'lastTradedPrice': round(float(price[i]), 1),
+                    'percentageChange': float(change[i]),
+                    'openPrice': round(float(opening[i]), 1),
+                    'highPrice': round(float(high[i]), 1),
+                    'lowPrice': round(float(low[i]), 1),
+                    'previousClose': round(float(prev[i]), 1),
+                    'totalTradeQuantity': int(volume[i]),
+                    'lastUpdatedDateTime': stamp,
+                }
+                for i, symbol in enumerate(self.symbols)
+            ]
+
+    def quote(self, symbol):
+        """{'price', 'change'} for one symbol, or None"""
+        i = self.index.get(symbol)
+        if i is None:
+            return None
+        with self.lock:
+            return {
+                'price': round(float(round_tick(self.price[i])), 1),
+                'change': float(self.pct_change()[i]),
+            }
+
+    def _bar_dicts(self, bars, col, start_ts):
+        return [
+            {
+                'date': datetime.fromtimestamp(start_ts + minute * 60, NEPAL_TZ).strftime('%Y-%m-%d %H:%M:%S'),
+                'open': round(float(o[col]), 1),
+                'high': round(float(h[col]), 1),
+                'low': round(float(l[col]), 1),
+                'close': round(float(c[col]), 1),
+                'volume': int(v[col]),
+            }
+            for minute, o, h, l, c, v in bars
+        ]
+
+    def live_bars(self, symbol):
+        """Minute bars of the live session for one symbol"""
+        i = self.index.get(symbol)
+        if i is None:
+            return []
+        with self.lock:
+            return self._bar_dicts(list(self._bars), i, self.session_start)
+
+    # --- deterministic past sessions ---
+
+    def session(self, day, symbols, prev_close, interval=60):
+        """
+        One full past session for `symbols` on `day`, as OHLCV arrays of
+        shape (SESSION_SECONDS // interval, n). Seeded per (seed, day,
+        symbol) and (seed, day, sector), so a symbol's session is the same
+        whichever others are simulated with it.
+        """
+        cols = np.array([self.index[s] for s in symbols], dtype=np.int64)
+        key = [self.seed, day.toordinal()]
+        steps = SESSION_SECONDS
+
+        z_market = np.random.default_rng(key + [0]).standard_normal(steps)
+        z_sector = np.column_stack([
+            np.random.default_rng(key + [1, stable_key(sector)]).standard_normal(steps) for sector in self.sector_names
+        ])
+        z_idio = np.column_stack([
+            np.random.default_rng(key + [2, self.keys[c]]).standard_normal(steps) for c in cols
+        ])
+        prev_close = np.asarray(prev_close, dtype=np.float64)
+        prices, _ = self._prices(self._correlate(z_market, z_sector, z_idio, cols),
+                                 np.log(prev_close), prev_close, cols)
+
+        # Volume is only needed per bar, and a sum of Poisson draws is Poisson
+        # with the summed intensity - one draw per bar instead of per second
+        starts = np.arange(0, steps, interval)
+        intensity = np.add.reduceat(self._intensity(0, steps, cols), starts, axis=0)
+        volumes = np.column_stack([
+            np.random.default_rng(key + [3, self.keys[c]]).poisson(intensity[:, j]) for j, c in enumerate(cols)
+        ])
+        return (*ohlc(prices, starts), volumes)
+
+    def sessions(self, days, symbols, interval=60):
+        """
+        Chain sessions over `days` (oldest first) starting from HISTORY_BASE,
+        not the stored price, so the paths don't shift as prices update.
+        Returns [(day, (open, high, low, close, volume))].
+        """
+        prev_close = np.full(len(symbols), HISTORY_BASE)
+        out = []
+        for day in days:
+            bars = self.session(day, symbols, prev_close, interval)
+            out.append((day, bars))
+            prev_close = round_tick(bars[3][-1])
+        return out
+
+    def intraday(self, symbol, days=1, interval=60):
+        """
+        /stockIntraday-shaped bars: days-1 past sessions (rescaled so they
+        lead into today's previous close) followed by the live session.
+        """
+        i = self.index.get(symbol)
+        if i is None:
+            return None
+        with self.lock:
+            live_start = self.session_start
+            live_prev_close = float(self.prev_close[i])
+            live = self._bar_dicts(list(self._bars), i, live_start)
+
+        live_day = datetime.fromtimestamp(live_start, NEPAL_TZ).date()
+        past = self.sessions(previous_trading_days(live_day, days - 1), [symbol], interval)
+        if not past:
+            return live
+
+        scale = live_prev_close / float(past[-1][1][3][-1][0])
+        history = []
+        for day, (o, h, l, c, v) in past:
+            opened = NEPAL_TZ.localize(datetime(day.year, day.month, day.day, *SESSION_OPEN)).timestamp()
+            bars = [[k * interval // 60, *(round_tick(a[k] * scale) for a in (o, h, l, c)), v[k]]
+                    for k in range(len(o))]
+            history.extend(self._bar_dicts(bars, 0, opened))
+        return history + live
+
+
+_simulator = None
+_simulator_lock = threading.Lock()
+
+
+def get_simulator():
+    """
+    Process-wide simulator for the mock data path, over every stock we know
+    (the Stock table plus NepseClient.MOCK_PRICES), seeded from
+    NEPSE_API['SIMULATOR']['SEED'].
+    """
+    global _simulator
+    if _simulator is None:
+        with _simulator_lock:
+            if _simulator is None:
+                from services.nepse_http import get_config, DEFAULTS as HTTP_DEFAULTS
+                options = dict(HTTP_DEFAULTS['SIMULATOR'])
+                options.update(get_config().get('SIMULATOR', {}))
+                seed = options['SEED']
+                _simulator = MarketSimulator(_known_universe(), seed=seed)
+                logger.info(f"Market simulator started with {len(_simulator)} symbols (seed {seed})")
+    _simulator.advance_to_now()
+    return _simulator
+
+
+def _known_universe():
+    from services.nepse_client import NepseClient
+    universe = {
+        symbol: {'symbol': symbol, 'name': f'{symbol} Company', 'sector': 'Others', 'price': data['price']}
+        for symbol, data in NepseClient.MOCK_PRICES.items()
+    }
+    try:
+        from trading.models import Stock
+        for symbol, name, sector, price in Stock.objects.filter(current_price__gt=0).values_list(
+            'symbol', 'name', 'sector', 'current_price'
+        ):
+            universe[symbol] = {'symbol': symbol, 'name': name, 'sector': sector or 'Others', 'price': float(price)}
+    except Exception as e:
+        logger.warning(f"Simulator universe limited to mock symbols, Stock table unavailable: {e}")
+    return [universe[symbol] for symbol in sorted(universe)]
@@ -0,0 +1,159 @@
+import logging
+from collections.abc import Mapping
+from types import MappingProxyType
+from django.core.cache import cache
+from django.utils import timezone
+from services.columnar_snapshot import ColumnarSnapshot, UPSTREAM_FIELDS
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_VERSION_KEY = 'nepse_snapshot_version'
+
+
+def _nan_to_none(value):
+    return None if value != value else value
+
+
+def next_counter(key):
+    """Monotonic counter shared by every worker through the cache"""
+    cache.add(key, 0, None)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # Key was evicted between add() and incr()
+        cache.set(key, 1, None)
+        return 1
+
+
+def next_snapshot_version():
+    return next_counter(SNAPSHOT_VERSION_KEY)
+
+
+async def anext_snapshot_version():
+    """Async flavour of next_snapshot_version for the asyncio client"""
+    await cache.aadd(SNAPSHOT_VERSION_KEY, 0, None)
+    try:
+        return await cache.aincr(SNAPSHOT_VERSION_KEY)
+    except ValueError:
+        await cache.aset(SNAPSHOT_VERSION_KEY, 1, None)
+        return 1
+
+
+class Quotes(Mapping):
+    """
+    Read-only symbol -> quote mapping over a snapshot's columns. Quotes are
+    built on lookup, so a snapshot holds one copy of the market, not one
+    dict per symbol as well.
+    """
+    __slots__ = ('_snapshot',)
+
+    def __init__(self, snapshot):
+        self._snapshot = snapshot
+
+    def __getitem__(self, symbol):
+        row = self._snapshot.columns.row(symbol)
+        if row is None:
+            raise KeyError(symbol)
+        return MappingProxyType(self._snapshot.quote(row))
+
+    def __contains__(self, symbol):
+        return symbol in self._snapshot.columns
+
+    def __iter__(self):
+        return iter(self._snapshot.columns.symbols.tolist())
+
+    def __len__(self):
+        return len(self._snapshot.columns)
+
+
+class MarketSnapshot:
+    """
+    Immutable view of one /LiveMarket fetch.
+    The rows are parsed once into a ColumnarSnapshot indexed by symbol, so
+    lookups are O(1); quotes and upstream-shaped rows are read back from it.
+    """
+    __slots__ = ('version', 'fetched_at', 'source', '_columns')
+
+    def __init__(self, items, source='live', version=None, fetched_at=None):
+        object.__setattr__(self, '_columns', ColumnarSnapshot(items))
+        object.__setattr__(self, 'source', source)
+        object.__setattr__(self, 'version', version if version is not None else next_snapshot_version())
+        object.__setattr__(self, 'fetched_at', fetched_at or timezone.now())
+
+    def __setattr__(self, name, value):
+        raise AttributeError("MarketSnapshot is immutable")
+
+    def __getstate__(self):
+        return (self.version, self.fetched_at, self.source, self._columns)
+
+    def __setstate__(self, state):
+        version, fetched_at, source, columns = state
+        object.__setattr__(self, 'version', version)
+        object.__setattr__(self, 'fetched_at', fetched_at)
+        object.__setattr__(self, 'source', source)
+        object.__setattr__(self, '_columns', columns)
+
+    def __len__(self):
+        return len(self._columns)
+
+    def __contains__(self, symbol):
+        return symbol in self._columns
+
+    def __repr__(self):
+        return f"<MarketSnapshot v{self.version} {self.source} {len(self)} symbols @ {self.fetched_at.isoformat()}>"
+
+    @property
+    def quotes(self):
+        """Read-only symbol -> quote mapping"""
+        return Quotes(self)
+
+    @property
+    def columns(self):
+        """The quotes as typed NumPy arrays (see ColumnarSnapshot)"""
+        return self._columns
+
+    @property
+    def symbols(self):
+        return self.quotes.keys()
+
+    @property
+    def age_seconds(self):
+        return (timezone.now() - self.fetched_at).total_seconds()
+
+    def quote(self, row):
+        """Quote dict for a column row"""
+        columns = self._columns
+        return {
+            'price': columns.ltp[row].item(),
+            'change': columns.pct_change[row].item(),
+            'high': _nan_to_none(columns.high[row].item()),
+            'low': _nan_to_none(columns.low[row].item()),
+            'volume': columns.volume[row].item(),
+            'open': _nan_to_none(columns.open[row].item()),
+            'prev_close': _nan_to_none(columns.prev_close[row].item()),
+            'company_name': columns.names[row],
+            'source': self.source,
+        }
+
+    def get(self, symbol):
+        """Return a mutable copy of the quote for symbol, or None"""
+        row = self._columns.row(symbol)
+        return self.quote(row) if row is not None else None
+
+    def to_list(self):
+        """
+        /LiveMarket-shaped rows (shape returned by get_live_prices), for the
+        priced symbols and the fields the snapshot keeps
+        """
+        columns = self._columns
+        numbers = columns.as_lists(*UPSTREAM_FIELDS)
+        rows = []
+        for row, symbol in enumerate(columns.symbols.tolist()):
+            item = {'symbol': symbol, 'companyName': columns.names[row], 'securityName': columns.names[row]}
+            item.update((field, values[row]) for field, values in zip(UPSTREAM_FIELDS.values(), numbers))
+            item['sectorName'] = columns.sectors[row]
+            item['lastUpdatedDateTime'] = columns.updated_at[row]
+            if self.source != 'live':
+                item['source'] = self.source
+            rows.append(item)
+        return rows
@@ -0,0 +1,250 @@
+# services/nepse_http.py
+import os
+import random
+import asyncio
+import logging
+import threading
+import weakref
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from django.conf import settings
+from services.circuit_breaker import get_breaker
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'BASE_URL': 'http://localhost:8003',
+    'POOL_SIZE': 20,
+    'MAX_RETRIES': 2,
+    'BACKOFF_FACTOR': 0.2,
+    'BACKOFF_JITTER': 0.1,
+    'TIMEOUTS': {'default': (2, 5)},
+    'CACHE_TTLS': {
+        'live_prices': (30, 900),
+        'stock_list': (3600, 86400),
+        'intraday_open': (30, 900),
+        'intraday_closed': (300, 3600),
+    },
+    'CIRCUIT_BREAKER': {
+        'WINDOW': 20,
+        'MIN_CALLS': 5,
+        'FAILURE_RATE': 0.5,
+        'COOL_DOWN': 30,
+        'HALF_OPEN_CALLS': 1,
+    },
+    'FEED': {
+        'ENABLED': False,
+        'INTERVAL': 5,
+        'CLOSED_INTERVAL': 30,
+    },
+    'SIMULATOR': {
+        'SEED': 0,
+    },
+}
+
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+
+# One AsyncClient per event loop (httpx clients are bound to the loop they were created on)
+_async_clients = weakref.WeakKeyDictionary()
+
+RETRY_STATUSES = (502, 503, 504)
+
+
+def get_config():
+    """NEPSE_API settings merged over the defaults"""
+    config = dict(DEFAULTS)
+    config.update(getattr(settings, 'NEPSE_API', {}))
+    return config
+
+
+def base_url():
+    return get_config()['BASE_URL'].rstrip('/')
+
+
+def get_cache_ttls(name):
+    """(soft, hard) cache TTLs for a dataset name like 'live_prices'"""
+    ttls = dict(DEFAULTS['CACHE_TTLS'])
+    ttls.update(get_config().get('CACHE_TTLS', {}))
+    return ttls[name]
+
+
+def get_feed_config():
+    """Market feed poller settings (NEPSE_API['FEED'] over the defaults)"""
+    feed = dict(DEFAULTS['FEED'])
+    feed.update(get_config().get('FEED', {}))
+    return feed
+
+
+def feed_enabled():
+    """True when the feed poller owns the snapshot and requests must not fetch it"""
+    return bool(get_feed_config()['ENABLED'])
+
+
+def breaker_for(path):
+    """Per-endpoint circuit breaker, configured from NEPSE_API['CIRCUIT_BREAKER']"""
+    options = dict(DEFAULTS['CIRCUIT_BREAKER'])
+    options.update(get_config().get('CIRCUIT_BREAKER', {}))
+    return get_breaker(
+        path,
+        window=options['WINDOW'],
+        min_calls=options['MIN_CALLS'],
+        failure_rate=options['FAILURE_RATE'],
+        cool_down=options['COOL_DOWN'],
+        half_open_calls=options['HALF_OPEN_CALLS'],
+    )
+
+
+def get_timeout(path):
+    """(connect, read) timeout for an endpoint path like '/LiveMarket'"""
+    timeouts = get_config()['TIMEOUTS']
+    return timeouts.get(path, timeouts.get('default', DEFAULTS['TIMEOUTS']['default']))
+
+
+def worst_case_request_time():
+    """
+    Seconds one nepse_get/anepse_get can take at most: every attempt runs
+    into the slowest configured (connect, read) timeout, plus the longest
+    backoff between attempts.
+    """
+    config = get_config()
+    timeouts = [DEFAULTS['TIMEOUTS']['default'], *config['TIMEOUTS'].values()]
+    attempt = max(connect + read for connect, read in timeouts)
+    backoff = sum(
+        config['BACKOFF_FACTOR'] * (2 ** retry) + config['BACKOFF_JITTER']
+        for retry in range(config['MAX_RETRIES'])
+    )
+    return attempt * (config['MAX_RETRIES'] + 1) + backoff
+
+
+def _build_session():
+    config = get_config()
+    retry = Retry(
+        total=config['MAX_RETRIES'],
+        connect=config['MAX_RETRIES'],
+        read=config['MAX_RETRIES'],
+        status=config['MAX_RETRIES'],
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=frozenset(['GET']),
+        backoff_factor=config['BACKOFF_FACTOR'],
+        backoff_jitter=config['BACKOFF_JITTER'],
+        raise_on_status=False,  # hand the last response back to the caller
+    )
+    adapter = HTTPAdapter(
+        pool_connections=1,     # a single upstream host
+        pool_maxsize=config['POOL_SIZE'],
+        max_retries=retry,
+    )
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers.update({'Accept': 'application/json', 'Connection': 'keep-alive'})
+    return session
+
+
+def get_session():
+    """
+    Shared keep-alive session for the NEPSE upstream.
+    Rebuilt after a fork so Celery/gunicorn children never share sockets.
+    """
+    global _session, _session_pid
+    pid = os.getpid()
+    if _session is None or _session_pid != pid:
+        with _session_lock:
+            if _session is None or _session_pid != pid:
+                _session = _build_session()
+                _session_pid = pid
+                logger.debug(f"Created NEPSE HTTP session for pid {pid} -> {base_url()}")
+    return _session
+
+
+def _record(breaker, response):
+    if response.status_code >= 500:
+        breaker.record_failure()
+    else:
+        breaker.record_success()
+
+
+def nepse_get(path, params=None, timeout=None):
+    """
+    GET an upstream endpoint through the pooled session.
+    Raises CircuitOpenError straight away while the endpoint's circuit is open.
+    """
+    breaker = breaker_for(path)
+    breaker.before_call()
+    try:
+        response = get_session().get(
+            f"{base_url()}{path}",
+            params=params,
+            timeout=timeout or get_timeout(path),
+        )
+    except requests.exceptions.RequestException:
+        breaker.record_failure()
+        raise
+    _record(breaker, response)
+    return response
+
+
+def get_async_client():
+    """Shared keep-alive httpx.AsyncClient for the running event loop"""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None or client.is_closed:
+        config = get_config()
+        client = httpx.AsyncClient(
+            base_url=base_url(),
+            headers={'Accept': 'application/json'},
+            limits=httpx.Limits(
+                max_connections=config['POOL_SIZE'],
+                max_keepalive_connections=config['POOL_SIZE'],
+            ),
+        )
+        _async_clients[loop] = client
+        logger.debug(f"Created async NEPSE client -> {base_url()}")
+    return client
+
+
+async def anepse_get(path, params=None, timeout=None):
+    """
+    Non-blocking GET with the same retry/backoff policy as nepse_get.
+    Raises the last transport error once retries are exhausted, or
+    CircuitOpenError straight away while the endpoint's circuit is open.
+    """
+    breaker = breaker_for(path)
+    breaker.before_call()
+    try:
+        response = await _aget_with_retries(path, params, timeout)
+    except httpx.HTTPError:
+        breaker.record_failure()
+        raise
+    _record(breaker, response)
+    return response
+
+
+async def _aget_with_retries(path, params, timeout):
+    config = get_config()
+    connect_timeout, read_timeout = timeout or get_timeout(path)
+    client = get_async_client()
+    if params:
+        params = {k: v for k, v in params.items() if v is not None}
+
+    attempt = 0
+    while True:
+        try:
+            response = await client.get(
+                path,
+                params=params,
+                timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            )
+            if response.status_code not in RETRY_STATUSES or attempt >= config['MAX_RETRIES']:
+                return response
+        except httpx.TransportError:
+            if attempt >= config['MAX_RETRIES']:
+                raise
+        delay = config['BACKOFF_FACTOR'] * (2 ** attempt) + random.uniform(0, config['BACKOFF_JITTER'])
+        attempt += 1
+        logger.debug(f"Retrying {path} in {delay:.2f}s (attempt {attempt})")
+        await asyncio.sleep(delay)
@@ -0,0 +1,357 @@
+# services/nepse_standin.py
+"""
+Local stand-in for the NEPSE upstream (BASE_URL), for offline development
+and reproducible load tests. Serves the endpoints NepseClient uses with
+payloads in the same shape, from a MarketSimulator that ticks in the
+background. Latency, error rate and market state are configurable, and can
+be changed while it runs via POST /_standin.
+
+    python manage.py run_nepse_standin --symbols 300 --latency lognormal:20:0.5
+"""
+import json
+import math
+import time
+import random
+import logging
+import threading
+from datetime import datetime
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+import numpy as np
+import pytz
+from services.market_hours import is_market_open
+from services.market_snapshot import MarketSnapshot
+from services.market_simulator import MarketSimulator
+
+logger = logging.getLogger(__name__)
+
+NEPAL_TZ = pytz.timezone('Asia/Kathmandu')
+
+DEFAULTS = {
+    'symbols': 300,         # universe size
+    'tick_interval': 1.0,   # seconds between price ticks
+    'latency': 'fixed:0',   # fixed:<ms> | uniform:<min_ms>:<max_ms> | lognormal:<median_ms>:<sigma>
+    'error_rate': 0.0,      # share of requests answered with error_status
+    'error_status': 503,
+    'state': 'OPEN',        # OPEN | CLOSE | HALT | auto (follow NEPSE trading hours)
+    'seed': None,
+}
+
+# Real symbols first so the usual watchlist/charts have data, then synthetic ones
+SEED_SYMBOLS = {
+    'NABIL': ('Nabil Bank Limited', 'Commercial Banks', 1850.50),
+    'NIC': ('NIC Asia Bank Limited', 'Commercial Banks', 420.75),
+    'NMB': ('NMB Bank Limited', 'Commercial Banks', 210.30),
+    'SCB': ('Standard Chartered Bank Nepal Limited', 'Commercial Banks', 650.25),
+    'NTC': ('Nepal Doorsanchar Company Limited', 'Others', 720.00),
+    'HDL': ('Himalayan Distillery Limited', 'Manufacturing And Processing', 1500.50),
+    'PCBL': ('Prime Commercial Bank Limited', 'Commercial Banks', 180.25),
+    'SBI': ('Nepal SBI Bank Limited', 'Commercial Banks', 450.00),
+    'EBL': ('Everest Bank Limited', 'Commercial Banks', 550.75),
+    'PRVU': ('Prabhu Bank Limited', 'Commercial Banks', 300.50),
+}
+
+SECTORS = [
+    'Commercial Banks', 'Development Banks', 'Finance', 'Hydro Power',
+    'Life Insurance', 'Non Life Insurance', 'Microfinance', 'Hotels And Tourism',
+    'Manufacturing And Processing', 'Investment', 'Trading', 'Others',
+]
+
+MARKET_STATES = ('OPEN', 'CLOSE', 'HALT', 'auto')
+
+
+def parse_latency(spec):
+    """'lognormal:20:0.5' -> callable returning a delay in seconds"""
+    kind, *args = str(spec).split(':')
+    args = [float(a) for a in args]
+    if kind == 'fixed':
+        ms = args[0] if args else 0
+        return lambda rng: ms / 1000
+    if kind == 'uniform':
+        low, high = args
+        return lambda rng: rng.uniform(low, high) / 1000
+    if kind == 'lognormal':
+        median, sigma = args
+        return lambda rng: rng.lognormvariate(math.log(median), sigma) / 1000
+    raise ValueError(f"Unknown latency spec {spec!r}, expected fixed|uniform|lognormal")
+
+
+def _error_rate(value):
+    rate = float(value)
+    if not 0 <= rate <= 1:
+        raise ValueError("must be between 0 and 1")
+    return rate
+
+
+def _error_status(value):
+    if isinstance(value, bool) or int(value) != value or not 400 <= int(value) <= 599:
+        raise ValueError("must be an HTTP error status (400-599)")
+    return int(value)
+
+
+def _state(value):
+    if value not in MARKET_STATES:
+        raise ValueError(f"must be one of {MARKET_STATES}")
+    return value
+
+
+def _tick_interval(value):
+    interval = float(value)
+    if not interval > 0:
+        raise ValueError("must be positive")
+    return interval
+
+
+def _latency(value):
+    parse_latency(value)
+    return str(value)
+
+
+# Settings POST /_standin may change, and how each value is checked/coerced.
+# symbols and seed shape the universe and are fixed once it's built.
+RUNTIME_OPTIONS = {
+    'latency': _latency,
+    'error_rate': _error_rate,
+    'error_status': _error_status,
+    'state': _state,
+    'tick_interval': _tick_interval,
+}
+
+
+class StandinMarket:
+    """Synthetic universe driven by MarketSimulator, advanced one tick at a time"""
+
+    def __init__(self, symbols=DEFAULTS['symbols'], seed=None):
+        self.rng = random.Random(seed)
+        self.companies = self._build_universe(symbols)
+        self.simulator = MarketSimulator(
+            [{**c, 'price': c['base']} for c in self.companies],
+            seed=seed if seed is not None else self.rng.randrange(2 ** 32),
+        )
+        self.index_base = 2100.0
+
+    def _build_universe(self, size):
+        companies = []
+        for symbol, (name, sector, price) in list(SEED_SYMBOLS.items())[:size]:
+            companies.append({'symbol': symbol, 'name': name, 'sector': sector, 'base': price})
+        for n in range(size - len(companies)):
+            symbol = f'SYN{n + 1:03d}'
+            companies.append({
+                'symbol': symbol,
+                'name': f'Synthetic Company {n + 1}',
+                'sector': SECTORS[n % len(SECTORS)],
+                'base': round(self.rng.uniform(100, 2000), 1),
+            })
+        return companies
+
+    def step(self, seconds=1):
+        """Advance every symbol by `seconds` of simulated trading"""
+        self.simulator.step(max(1, round(seconds)))
+
+    @staticmethod
+    def _pct(price, prev_close):
+        return round((price - prev_close) / prev_close * 100, 2) if prev_close else 0.0
+
+    # --- payloads ---
+
+    def live_market(self):
+        return self.simulator.live_rows()
+
+    def company_list(self):
+        return [
+            {
+                'symbol': r['symbol'],
+                'companyName': r['companyName'],
+                'securityName': r['securityName'],
+                'sectorName': r['sectorName'],
+                'lastTradedPrice': r['lastTradedPrice'],
+                'status': 'A',
+            }
+            for r in self.live_market()
+        ]
+
+    def summary(self, limit=10):
+        columns = MarketSnapshot(self.live_market(), version=0).columns
+        stats = columns.aggregate()
+        return {
+            'totalTurnover': stats['turnover'],
+            'totalTradedShares': stats['total_volume'],
+            'totalScripsTraded': int(np.count_nonzero(columns.volume)),
+            'topGainers': columns.top_movers(limit, gainers=True),
+            'topLosers': columns.top_movers(limit, gainers=False),
+        }
+
+    def nepse_index(self):
+        # Price-weighted over the universe, rebased to index_base
+        sim = self.simulator
+        with sim.lock:
+            base = sim.base.sum()
+            value = round(self.index_base * float(sim.price.sum() / base), 2)
+            prev = round(self.index_base * float(sim.prev_close.sum() / base), 2)
+        return {
+            'index': 'NEPSE Index',
+            'currentValue': value,
+            'previousClose': prev,
+            'change': round(value - prev, 2),
+            'perChange': self._pct(value, prev),
+            'asOf': datetime.now(NEPAL_TZ).isoformat(),
+        }
+
+    def intraday(self, symbol, days=1):
+        """Minute bars: the live session plus deterministic earlier sessions"""
+        return self.simulator.intraday(symbol, days)
+
+
+class StandinServer:
+    """The HTTP side: routing, latency/error injection and the tick thread"""
+
+    def __init__(self, host='127.0.0.1', port=8003, **options):
+        config = dict(DEFAULTS)
+        config.update({k: v for k, v in options.items() if v is not None})
+        self.config = config
+        self.rng = random.Random(config['seed'])
+        self.latency = parse_latency(config['latency'])
+        self.market = StandinMarket(config['symbols'], seed=config['seed'])
+        self.requests = 0
+        self.errors = 0
+        # Handler threads share the counters and config
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # keep-alive, like the real upstream
+
+            def do_GET(self):
+                server.handle(self, 'GET')
+
+            def do_POST(self):
+                server.handle(self, 'POST')
+
+            def log_message(self, format, *args):
+                logger.debug(format % args)
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+
+    @property
+    def address(self):
+        host, port = self.httpd.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def market_state(self):
+        state = self.config['state']
+        if state == 'auto':
+            return 'OPEN' if is_market_open() else 'CLOSE'
+        return state
+
+    def update(self, **changes):
+        """
+        Change latency/error rate/state on the fly. Every value is checked
+        before any is applied; raises ValueError on an unknown setting or a
+        bad value.
+        """
+        unknown = sorted(set(changes) - set(RUNTIME_OPTIONS))
+        if unknown:
+            raise ValueError(f"Cannot change {', '.join(unknown)}; settable: {', '.join(RUNTIME_OPTIONS)}")
+        cleaned = {}
+        for name, value in changes.items():
+            try:
+                cleaned[name] = RUNTIME_OPTIONS[name](value)
+            except (TypeError, ValueError) as e:
+                raise ValueError(f"Invalid {name} {value!r}: {e}")
+
+        with self._lock:
+            if 'latency' in cleaned:
+                self.latency = parse_latency(cleaned['latency'])
+            self.config.update(cleaned)
+
+    # --- request handling ---
+
+    def handle(self, request, method):
+        url = urlparse(request.path)
+        params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        with self._lock:
+            self.requests += 1
+
+        if url.path == '/_standin':
+            return self._control(request, method)
+
+        time.sleep(self.latency(self.rng))
+        if self.rng.random() < self.config['error_rate']:
+            with self._lock:
+                self.errors += 1
+            return self._send(request, self.config['error_status'], {'error': 'injected failure'})
+
+        routes = {
+            '/IsNepseOpen': lambda: {'isOpen': self.market_state(), 'asOf': datetime.now(NEPAL_TZ).isoformat()},
+            '/LiveMarket': self.market.live_market,
+            '/CompanyList': self.market.company_list,
+            '/Summary': self.market.summary,
+            '/NepseIndex': self.market.nepse_index,
+            '/stockIntraday': lambda: self._intraday(params),
+        }
+        route = routes.get(url.path)
+        if route is None:
+            return self._send(request, 404, {'error': f'Unknown endpoint {url.path}'})
+
+        payload = route()
+        if payload is None:
+            return self._send(request, 404, {'error': 'Unknown symbol'})
+        return self._send(request, 200, payload)
+
+    def _intraday(self, params):
+        symbol = params.get('symbol', '').upper()
+        try:
+            days = max(1, int(params.get('days') or 1))
+        except ValueError:
+            days = 1
+        return self.market.intraday(symbol, days)
+
+    def _control(self, request, method):
+        if method == 'POST':
+            length = int(request.headers.get('Content-Length') or 0)
+            try:
+                changes = json.loads(request.rfile.read(length) or b'{}')
+                if not isinstance(changes, dict):
+                    raise ValueError("Expected a JSON object of settings")
+                self.update(**changes)
+            except ValueError as e:
+                return self._send(request, 400, {'error': str(e)})
+        with self._lock:
+            state = {**self.config, 'requests': self.requests, 'injected_errors': self.errors}
+        return self._send(request, 200, {**state, 'market_state': self.market_state()})
+
+    def _send(self, request, status_code, payload):
+        body = json.dumps(payload).encode()
+        request.send_response(status_code)
+        request.send_header('Content-Type', 'application/json')
+        request.send_header('Content-Length', str(len(body)))
+        request.end_headers()
+        request.wfile.write(body)
+
+    # --- lifecycle ---
+
+    def _tick_loop(self):
+        while not self._stop.wait(self.config['tick_interval']):
+            if self.market_state() == 'OPEN':
+                self.market.step(self.config['tick_interval'])
+
+    def start(self):
+        """Serve and tick in background threads (for tests and benchmarks)"""
+        threading.Thread(target=self._tick_loop, name='standin-ticks', daemon=True).start()
+        threading.Thread(target=self.httpd.serve_forever, name='standin-http', daemon=True).start()
+        return self
+
+    def serve_forever(self):
+        threading.Thread(target=self._tick_loop, name='standin-ticks', daemon=True).start()
+        try:
+            self.httpd.serve_forever()
+        finally:
+            self.stop()
+
+    def stop(self):
+        self._stop.set()
+        self.httpd.shutdown()
+        self.httpd.server_close()
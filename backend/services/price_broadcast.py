@@ -0,0 +1,22 @@
+# services/price_broadcast.py
+import logging
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+
+logger = logging.getLogger(__name__)
+
+# Every PortfolioConsumer joins this group to hear about price changes
+MARKET_GROUP = 'market_prices'
+
+
+def broadcast_diff(diff):
+    """Diff consumer: fan a SnapshotDiff out to connected websocket clients"""
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        logger.debug("No channel layer configured, skipping price broadcast")
+        return
+    
+    async_to_sync(channel_layer.group_send)(MARKET_GROUP, {
+        'type': 'price.deltas',
+        'diff': diff.to_dict(),
+    })
@@ -0,0 +1,145 @@
+# services/price_history.py
+import logging
+from collections import namedtuple
+from decimal import Decimal
+import pytz
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
+from trading.models import Stock, PriceTick, DailyBar
+
+logger = logging.getLogger(__name__)
+
+NEPAL_TZ = pytz.timezone('Asia/Kathmandu')
+
+# Rows per multi-row INSERT
+BATCH_SIZE = 1000
+
+# One observed price. volume is the session's cumulative volume.
+Tick = namedtuple('Tick', ['symbol', 'timestamp', 'price', 'volume'])
+
+
+def _price(value):
+    return Decimal(str(value)).quantize(Decimal('0.01'))
+
+
+def record_ticks(ticks, batch_size=BATCH_SIZE):
+    """
+    Append ticks to PriceTick and roll them into today's DailyBar rows.
+    Inserts are multi-row and skip (stock, timestamp) pairs already stored,
+    and only the ticks actually added are rolled up, so replaying the same
+    ticks is harmless. Symbols missing from the Stock table are dropped.
+    Returns the number of ticks written.
+    """
+    ticks = [t for t in ticks if t.price]
+    if not ticks:
+        return 0
+
+    stock_ids = dict(
+        Stock.objects.filter(symbol__in={t.symbol for t in ticks}).values_list('symbol', 'id')
+    )
+    rows = {}
+    for t in ticks:
+        if t.symbol in stock_ids:
+            rows.setdefault((stock_ids[t.symbol], t.timestamp), PriceTick(
+                stock_id=stock_ids[t.symbol], timestamp=t.timestamp, price=_price(t.price), volume=t.volume or 0
+            ))
+    if not rows:
+        return 0
+
+    with transaction.atomic():
+        stored = set(PriceTick.objects.filter(
+            stock_id__in={stock_id for stock_id, _ in rows},
+            timestamp__in={timestamp for _, timestamp in rows},
+        ).values_list('stock_id', 'timestamp'))
+        rows = [row for key, row in rows.items() if key not in stored]
+        if not rows:
+            return 0
+        PriceTick.objects.bulk_create(rows, batch_size=batch_size, ignore_conflicts=True)
+        _roll_daily_bars(rows, batch_size)
+
+    logger.debug(f"Recorded {len(rows)} price ticks")
+    return len(rows)
+
+
+def _roll_daily_bars(ticks, batch_size):
+    """
+    Merge new ticks into their (stock, day) bars: one SELECT and one upsert.
+    The close only moves to a tick later than the one it came from.
+    """
+    bars = {}
+    for tick in sorted(ticks, key=lambda t: t.timestamp):
+        key = (tick.stock_id, tick.timestamp.astimezone(NEPAL_TZ).date())
+        bar = bars.get(key)
+        if bar is None:
+            bars[key] = DailyBar(
+                stock_id=key[0], date=key[1], open=tick.price, high=tick.price, low=tick.price,
+                close=tick.price, close_at=tick.timestamp, volume=tick.volume,
+            )
+        else:
+            bar.high = max(bar.high, tick.price)
+            bar.low = min(bar.low, tick.price)
+            bar.close, bar.close_at = tick.price, tick.timestamp
+            bar.volume = max(bar.volume, tick.volume)
+
+    stock_ids = {stock_id for stock_id, _ in bars}
+    days = {day for _, day in bars}
+    for stored in DailyBar.objects.filter(stock_id__in=stock_ids, date__in=days):
+        bar = bars.get((stored.stock_id, stored.date))
+        if bar is None:
+            continue
+        # Earlier ticks of the day already shaped this bar
+        bar.open = stored.open
+        bar.high = max(bar.high, stored.high)
+        bar.low = min(bar.low, stored.low)
+        bar.volume = max(bar.volume, stored.volume)
+        if stored.close_at is not None and stored.close_at >= bar.close_at:
+            bar.close, bar.close_at = stored.close, stored.close_at
+
+    DailyBar.objects.bulk_create(
+        bars.values(),
+        batch_size=batch_size,
+        update_conflicts=True,
+        unique_fields=['stock', 'date'],
+        update_fields=['open', 'high', 'low', 'close', 'close_at', 'volume'],
+    )
+
+
+def record_price_deltas(diff):
+    """Diff consumer: store every moved price as a tick"""
+    ticks = [
+        Tick(d.symbol, diff.created_at, d.new_price, d.new_volume)
+        for d in diff.changes if d.old_price != d.new_price
+    ]
+    count = record_ticks(ticks)
+    logger.info(f"Diff #{diff.seq}: recorded {count} price ticks")
+    return count
+
+
+# --- reads ---
+
+def tick_history(symbol, start, end=None):
+    """(timestamp, price, volume) rows for one symbol, oldest first"""
+    ticks = PriceTick.objects.filter(stock__symbol=symbol, timestamp__gte=start)
+    if end is not None:
+        ticks = ticks.filter(timestamp__lt=end)
+    return list(ticks.order_by('timestamp').values_list('timestamp', 'price', 'volume'))
+
+
+def closing_prices(stock_ids, start, end):
+    """
+    stock_id -> {date: close} for bars in [start, end], plus each stock's
+    last close before start so callers can carry it forward.
+    """
+    closes = {stock_id: {} for stock_id in stock_ids}
+    bars = DailyBar.objects.filter(stock_id__in=stock_ids, date__gte=start, date__lte=end)
+    for stock_id, day, close in bars.values_list('stock_id', 'date', 'close'):
+        closes[stock_id][day] = close
+
+    # Each stock's latest bar before start, in one query: a correlated
+    # subquery per stock that walks the (stock, date) unique index
+    last_date = (DailyBar.objects.filter(stock_id=OuterRef('stock_id'), date__lt=start)
+                 .order_by('-date').values('date')[:1])
+    before = DailyBar.objects.filter(stock_id__in=stock_ids, date=Subquery(last_date))
+    for stock_id, day, close in before.values_list('stock_id', 'date', 'close'):
+        closes[stock_id][day] = close
+    return closes
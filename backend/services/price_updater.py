@@ -1,87 +1,204 @@
+from collections import namedtuple, defaultdict
+from decimal import Decimal
+from django.core.exceptions import ValidationError
+from django.db import models, transaction
+from django.utils import timezone
 from trading.models import Stock
 from services.nepse_client import NepseClient
+from services.nepse_http import feed_enabled
+from services.price_history import Tick, record_ticks
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Rows per SELECT / INSERT / UPDATE statement
+BATCH_SIZE = 500
+
+# Columns the writer compares and updates
+STOCK_FIELDS = ('name', 'current_price', 'sector')
+
+# repriced: symbols whose current_price was written (created or changed)
+UpsertResult = namedtuple('UpsertResult', ['created', 'updated', 'unchanged', 'skipped', 'repriced'])
+
+
+def _clean(name, value):
+    """Incoming value as the model stores it, so comparisons are exact"""
+    field = Stock._meta.get_field(name)
+    value = field.to_python(value)
+    if isinstance(field, models.DecimalField) and value is not None:
+        value = value.quantize(Decimal(1).scaleb(-field.decimal_places))
+    return value
+
+
+def _incoming(rows):
+    """symbol -> {field: cleaned value} for the fields each row actually has"""
+    incoming = {}
+    for row in rows:
+        symbol = row.get('symbol')
+        if not symbol:
+            continue
+        values = {}
+        for name in STOCK_FIELDS:
+            if row.get(name) in (None, ''):
+                continue
+            try:
+                values[name] = _clean(name, row[name])
+            except ValidationError:
+                logger.warning(f"Ignoring invalid {name} for {symbol}: {row[name]!r}")
+        incoming[symbol] = values
+    return incoming
+
+
+def upsert_stocks(rows, create=True, batch_size=BATCH_SIZE):
+    """
+    Apply rows of {'symbol', 'name', 'current_price', 'sector'} to the Stock
+    table with set-based statements: one SELECT per batch of symbols, one
+    bulk INSERT for new symbols and one bulk UPDATE per set of changed
+    columns. Fields missing from a row are left alone, and a column is only
+    written when its value differs from what's stored.
+    With create=False unknown symbols are skipped instead of inserted.
+    A symbol another writer inserted since the SELECT is updated in place
+    (INSERT ... ON CONFLICT (symbol) DO UPDATE) rather than failing the batch.
+    """
+    incoming = _incoming(rows)
+    if not incoming:
+        return UpsertResult(0, 0, 0, 0, ())
+
+    now = timezone.now()
+    symbols = list(incoming)
+    new_by_fields = defaultdict(list)
+    changed_by_fields = defaultdict(list)
+    unchanged = skipped = 0
+
+    with transaction.atomic():
+        existing = {}
+        for i in range(0, len(symbols), batch_size):
+            batch = Stock.objects.filter(symbol__in=symbols[i:i + batch_size]).only('id', 'symbol', *STOCK_FIELDS)
+            existing.update((stock.symbol, stock) for stock in batch)
+
+        for symbol, values in incoming.items():
+            stock = existing.get(symbol)
+            if stock is None:
+                if not create:
+                    skipped += 1
+                    continue
+                stock = Stock(symbol=symbol, **{'name': symbol, 'current_price': 0, 'sector': 'Unknown', **values})
+                new_by_fields[tuple(values)].append(stock)
+                continue
+
+            changed = tuple(name for name, value in values.items() if getattr(stock, name) != value)
+            if not changed:
+                unchanged += 1
+                continue
+            for name in changed:
+                setattr(stock, name, values[name])
+            stock.last_updated = now
+            changed_by_fields[changed].append(stock)
+
+        # On a conflict only the row's own fields are written over, never the placeholders
+        for fields, stocks in new_by_fields.items():
+            Stock.objects.bulk_create(
+                stocks,
+                batch_size=batch_size,
+                update_conflicts=True,
+                unique_fields=['symbol'],
+                update_fields=[*fields, 'last_updated'],
+            )
+        for fields, stocks in changed_by_fields.items():
+            Stock.objects.bulk_update(stocks, [*fields, 'last_updated'], batch_size=batch_size)
+
+    new = [stock for stocks in new_by_fields.values() for stock in stocks]
+    result = UpsertResult(
+        created=len(new),
+        updated=sum(len(stocks) for stocks in changed_by_fields.values()),
+        unchanged=unchanged,
+        skipped=skipped,
+        repriced=tuple(
+            [stock.symbol for stock in new]
+            + [stock.symbol for fields, stocks in changed_by_fields.items()
+               if 'current_price' in fields for stock in stocks]
+        ),
+    )
+    logger.debug(f"Stock upsert: {result.created} created, {result.updated} updated, "
+                 f"{result.unchanged} unchanged, {result.skipped} skipped")
+    return result
+
+
 def update_all_prices():
     """Update prices for all stocks"""
     
     # Get live market data
-    live_data = NepseClient.get_live_prices()
+    snapshot = NepseClient.get_snapshot()
+    # Simulated prices must never reach Stock.current_price: they would
+    # be traded at, and would seed the simulator again on the next start
+    if snapshot.source != 'live':
+        logger.info(f"No live prices ({snapshot.source} snapshot), leaving stored prices alone")
+        return 0
+    live_data = snapshot.to_list()
     
     if not live_data:
         logger.warning("Could not fetch live prices")
         return 0
     
-    updated_count = 0
-    created_count = 0
+    # API uses lastTradedPrice; names/sectors only when the feed carries them
+    rows = [
+        {
+            'symbol': item.get('symbol'),
+            'current_price': item.get('lastTradedPrice'),
+            'name': item.get('companyName', item.get('securityName')),
+            'sector': item.get('sectorName'),
+        }
+        for item in live_data
+        if item.get('lastTradedPrice')
+    ]
     
-    # Create a set of existing symbols for quick lookup
-    existing_symbols = set(Stock.objects.values_list('symbol', flat=True))
+    try:
+        result = upsert_stocks(rows)
+    except Exception as e:
+        logger.error(f"Error updating prices: {e}")
+        return 0
     
-    # Update each stock in database
-    for item in live_data:
-        symbol = item.get('symbol')
-        
-        # API uses lastTradedPrice
-        price = item.get('lastTradedPrice')
-        
-        if not symbol or not price:
-            continue
-        
+    logger.info(f"Updated {result.updated} stocks, created {result.created} new stocks, "
+                f"{result.unchanged} unchanged")
+    
+    # With the feed enabled its diff engine records ticks as they happen
+    if not feed_enabled():
+        quotes = snapshot.quotes
         try:
-            if symbol in existing_symbols:
-                # Update existing stock
-                Stock.objects.filter(symbol=symbol).update(
-                    current_price=price,
-                    name=item.get('companyName', item.get('securityName', symbol)),
-                    sector=item.get('sectorName', 'Unknown')
-                )
-                updated_count += 1
-                logger.debug(f"Updated {symbol}: ₹{price}")
-            else:
-                # Create new stock
-                Stock.objects.create(
-                    symbol=symbol,
-                    name=item.get('companyName', item.get('securityName', symbol)),
-                    current_price=price,
-                    sector=item.get('sectorName', 'Unknown')
-                )
-                created_count += 1
-                logger.info(f"Created new stock: {symbol} at ₹{price}")
-                
+            record_ticks(
+                Tick(symbol, snapshot.fetched_at, quotes[symbol]['price'], quotes[symbol]['volume'])
+                for symbol in result.repriced
+            )
         except Exception as e:
-            logger.error(f"Error updating {symbol}: {e}")
-    
-    logger.info(f"Updated {updated_count} stocks, created {created_count} new stocks")
-    return updated_count + created_count
+            logger.error(f"Error recording price ticks: {e}")
+    return result.updated + result.created
 
 def update_stock_price(symbol):
-    """Update single stock price"""
+    """Update single stock price (live quotes only)"""
     price_data = NepseClient.get_stock_price(symbol)
     
-    if price_data and price_data.get('price'):
+    if price_data and price_data.get('source') == 'live' and price_data.get('price'):
         try:
-            stock = Stock.objects.get(symbol=symbol)
-            stock.current_price = price_data['price']
-            stock.save()
-            logger.info(f"Updated {symbol} to ₹{price_data['price']}")
+            result = upsert_stocks([{'symbol': symbol, 'current_price': price_data['price']}])
+            logger.info(f"{symbol} at ₹{price_data['price']}: {result}")
             return True
-        except Stock.DoesNotExist:
-            # Create the stock if it doesn't exist
-            try:
-                Stock.objects.create(
-                    symbol=symbol,
-                    name=f"{symbol} (NEPSE)",
-                    current_price=price_data['price'],
-                    sector="Unknown"
-                )
-                logger.info(f"Created {symbol} with price ₹{price_data['price']}")
-                return True
-            except Exception as e:
-                logger.error(f"Failed to create {symbol}: {e}")
         except Exception as e:
             logger.error(f"Error updating {symbol}: {e}")
     
-    return False
\ No newline at end of file
+    return False
+
+def apply_price_deltas(diff):
+    """
+    Diff consumer: write only the symbols whose price moved.
+    New listings are left to the periodic full sync, which knows their names.
+    """
+    moved = [
+        {'symbol': d.symbol, 'current_price': d.new_price}
+        for d in diff.changes if d.old_price != d.new_price
+    ]
+    if not moved:
+        return 0
+    
+    result = upsert_stocks(moved, create=False)
+    logger.info(f"Diff #{diff.seq}: updated {result.updated} of {len(moved)} moved stocks")
+    return result.updated
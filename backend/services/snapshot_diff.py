@@ -0,0 +1,162 @@
+# services/snapshot_diff.py
+import logging
+from collections import namedtuple
+import numpy as np
+from django.core.cache import cache
+from django.utils import timezone
+from services.market_snapshot import next_counter
+
+logger = logging.getLogger(__name__)
+
+DIFF_SEQ_KEY = 'nepse_diff_seq'
+RECENT_DIFFS_KEY = 'nepse_recent_diffs'
+# Enough history for a reconnecting client to catch up on a few minutes of ticks
+RECENT_DIFFS_LIMIT = 120
+
+# One changed symbol. old_* are None for a symbol that just appeared.
+PriceDelta = namedtuple('PriceDelta', [
+    'symbol',
+    'old_price', 'new_price',
+    'old_volume', 'new_volume',
+    'old_change', 'new_change',
+])
+
+
+class SnapshotDiff:
+    """What changed between two consecutive snapshots"""
+
+    __slots__ = ('seq', 'from_version', 'to_version', 'changes', 'removed', 'created_at')
+
+    def __init__(self, seq, from_version, to_version, changes, removed=(), created_at=None):
+        self.seq = seq
+        self.from_version = from_version
+        self.to_version = to_version
+        self.changes = tuple(changes)
+        self.removed = tuple(removed)
+        self.created_at = created_at or timezone.now()
+
+    def __len__(self):
+        return len(self.changes)
+
+    def __bool__(self):
+        return bool(self.changes or self.removed)
+
+    def __repr__(self):
+        return (f"<SnapshotDiff #{self.seq} v{self.from_version}->v{self.to_version} "
+                f"{len(self.changes)} changed, {len(self.removed)} removed>")
+
+    @property
+    def symbols(self):
+        return [delta.symbol for delta in self.changes]
+
+    def to_dict(self):
+        """JSON-friendly form used for websocket messages and the cache"""
+        return {
+            'seq': self.seq,
+            'from_version': self.from_version,
+            'to_version': self.to_version,
+            'changes': [delta._asdict() for delta in self.changes],
+            'removed': list(self.removed),
+            'created_at': self.created_at.isoformat(),
+        }
+
+
+def compute_changes(old, new):
+    """
+    (changes, removed) between two MarketSnapshots. old may be None (first
+    poll), in which case every symbol in new counts as changed. Compares
+    the snapshots' columns, so only changed symbols cost Python work.
+    """
+    after = new.columns
+    symbols = after.symbols.tolist()
+    before = old.columns if old is not None else None
+
+    if before is None or not len(before):
+        changed = np.ones(len(after), dtype=bool)
+        rows = np.full(len(after), -1, dtype=np.int64)
+    else:
+        rows = before.rows_for(symbols)
+        known = rows >= 0
+        prior = np.where(known, rows, 0)
+        changed = (~known
+                   | (before.ltp[prior] != after.ltp)
+                   | (before.volume[prior] != after.volume)
+                   | (before.pct_change[prior] != after.pct_change))
+
+    changes = []
+    for i in np.flatnonzero(changed).tolist():
+        j = int(rows[i])
+        changes.append(PriceDelta(
+            symbols[i],
+            before.ltp[j].item() if j >= 0 else None, after.ltp[i].item(),
+            before.volume[j].item() if j >= 0 else None, after.volume[i].item(),
+            before.pct_change[j].item() if j >= 0 else None, after.pct_change[i].item(),
+        ))
+
+    removed = []
+    if before is not None and len(before):
+        gone = after.rows_for(before.symbols.tolist()) < 0
+        removed = before.symbols[gone].tolist()
+    return changes, removed
+
+
+def diff_snapshots(old, new):
+    """
+    Diff two snapshots and stamp the result with the next sequence number.
+    An empty diff gets seq None and takes no number, so the published
+    sequence has no gaps for clients to mistake for trimmed history.
+    """
+    changes, removed = compute_changes(old, new)
+    return SnapshotDiff(
+        seq=next_counter(DIFF_SEQ_KEY) if changes or removed else None,
+        from_version=old.version if old is not None else None,
+        to_version=new.version,
+        changes=changes,
+        removed=removed,
+    )
+
+
+def recent_diffs(since_seq=0):
+    """Cached diffs newer than since_seq, oldest first (dicts, see to_dict)"""
+    return [d for d in cache.get(RECENT_DIFFS_KEY, []) if d['seq'] > since_seq]
+
+
+def _remember(diff):
+    history = cache.get(RECENT_DIFFS_KEY, [])
+    history.append(diff.to_dict())
+    cache.set(RECENT_DIFFS_KEY, history[-RECENT_DIFFS_LIMIT:], None)
+
+
+class DiffEngine:
+    """
+    Feed listener that turns consecutive snapshots into SnapshotDiffs and
+    hands non-empty ones to each consumer(diff). Mock snapshots are skipped
+    so simulated prices never reach the database or clients as real ticks.
+    """
+
+    def __init__(self, consumers=()):
+        self.consumers = list(consumers)
+
+    def add_consumer(self, consumer):
+        self.consumers.append(consumer)
+
+    def __call__(self, snapshot, previous=None):
+        if snapshot.source != 'live':
+            return None
+        if previous is not None and previous.source != 'live':
+            previous = None
+
+        diff = diff_snapshots(previous, snapshot)
+        if not diff:
+            logger.debug(f"Snapshot v{snapshot.version}: no changes")
+            return diff
+
+        logger.info(f"{diff!r} ({len(diff)}/{len(snapshot)} symbols)")
+        _remember(diff)
+
+        for consumer in self.consumers:
+            try:
+                consumer(diff)
+            except Exception as e:
+                logger.error(f"Diff consumer {getattr(consumer, '__name__', consumer)} failed: {e}")
+        return diff
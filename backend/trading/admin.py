@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Stock, Portfolio, Trade
+from .models import Stock, Portfolio, Trade, DailyBar, Order
 
 @admin.register(Stock)
 class StockAdmin(admin.ModelAdmin):
@@ -15,4 +15,16 @@ class PortfolioAdmin(admin.ModelAdmin):
 class TradeAdmin(admin.ModelAdmin):
     list_display = ['user', 'stock', 'order_type', 'quantity', 'total_amount', 'timestamp']
     list_filter = ['order_type', 'status']
-    search_fields = ['user__email', 'stock__symbol']
\ No newline at end of file
+    search_fields = ['user__email', 'stock__symbol']
+@admin.register(DailyBar)
+class DailyBarAdmin(admin.ModelAdmin):
+    list_display = ['stock', 'date', 'open', 'high', 'low', 'close', 'volume']
+    list_select_related = ['stock']
+    search_fields = ['stock__symbol']
+
+@admin.register(Order)
+class OrderAdmin(admin.ModelAdmin):
+    list_display = ['user', 'stock', 'side', 'order_type', 'quantity', 'limit_price', 'stop_price', 'status', 'created_at']
+    list_filter = ['status', 'order_type', 'side']
+    list_select_related = ['user', 'stock']
+    search_fields = ['user__email', 'stock__symbol']
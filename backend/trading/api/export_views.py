@@ -0,0 +1,158 @@
+import csv
+import zlib
+from decimal import Decimal
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from rest_framework.views import APIView
+from rest_framework.response import Response
+from rest_framework.permissions import IsAuthenticated
+from rest_framework import status
+from trading.models import Holding, RealizedGain, Trade
+
+# Rows fetched per round trip from the server-side cursor
+CHUNK_SIZE = 2000
+# Bytes gathered before handing a piece of the body to the server
+FLUSH_BYTES = 64 * 1024
+
+OUTPUTS = {
+    'csv': ('text/csv', 'csv'),
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+}
+
+
+class _Line:
+    """File-like target for csv.writer that just hands back the line"""
+    def write(self, value):
+        return value
+
+
+def _csv_lines(columns, rows):
+    writer = csv.writer(_Line())
+    yield writer.writerow(columns)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def _ndjson_lines(columns, rows):
+    encoder = DjangoJSONEncoder()
+    for row in rows:
+        yield encoder.encode(dict(zip(columns, row))) + '\n'
+
+
+def _body(lines, compress):
+    """Encode lines and group them into FLUSH_BYTES pieces, gzipped if asked"""
+    gzip = zlib.compressobj(wbits=16 + zlib.MAX_WBITS) if compress else None
+    buffer = []
+    size = 0
+    for line in lines:
+        data = line.encode()
+        buffer.append(data)
+        size += len(data)
+        if size >= FLUSH_BYTES:
+            piece = b''.join(buffer)
+            buffer, size = [], 0
+            if gzip:
+                piece = gzip.compress(piece)
+            if piece:
+                yield piece
+    piece = b''.join(buffer)
+    if gzip:
+        yield gzip.compress(piece) + gzip.flush()
+    elif piece:
+        yield piece
+
+
+class ExportView(APIView):
+    """
+    Base for streaming exports. Subclasses define `name`, `columns` and
+    rows(user), a generator of tuples. Rows are read through a server-side
+    cursor and written out as they come, so memory stays flat however long
+    the history is.
+    Query params: ?output=csv|ndjson (default csv), ?gzip=true
+    """
+    permission_classes = [IsAuthenticated]
+    name = None
+    columns = ()
+
+    def rows(self, user):
+        raise NotImplementedError
+
+    def get(self, request):
+        output = request.GET.get('output', 'csv').lower()
+        if output not in OUTPUTS:
+            return Response(
+                {"error": f"output must be one of {', '.join(OUTPUTS)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        compress = request.GET.get('gzip', '').lower() in ('1', 'true', 'yes')
+
+        content_type, extension = OUTPUTS[output]
+        lines = (_csv_lines if output == 'csv' else _ndjson_lines)(self.columns, self.rows(request.user))
+        response = StreamingHttpResponse(
+            _body(lines, compress),
+            content_type='application/gzip' if compress else content_type,
+        )
+
+        filename = f"{self.name}_{timezone.localdate():%Y%m%d}.{extension}" + ('.gz' if compress else '')
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+
+class TradeExportView(ExportView):
+    """Every trade of the user, oldest first"""
+    name = 'trades'
+    columns = ('id', 'timestamp', 'symbol', 'order_type', 'quantity', 'price_per_share',
+               'total_amount', 'status', 'price_source')
+
+    def rows(self, user):
+        trades = (
+            Trade.objects.filter(user=user)
+            .order_by('timestamp', 'id')
+            .values_list('id', 'timestamp', 'stock__symbol', 'order_type', 'quantity',
+                         'price_per_share', 'total_amount', 'status', 'price_source')
+        )
+        for row in trades.iterator(chunk_size=CHUNK_SIZE):
+            yield (row[0], row[1].isoformat(), *row[2:])
+
+
+class HoldingExportView(ExportView):
+    """Current holdings valued at the latest stock prices"""
+    name = 'holdings'
+    columns = ('symbol', 'company_name', 'sector', 'quantity', 'average_buy_price',
+               'total_invested', 'current_price', 'current_value', 'profit_loss')
+
+    def rows(self, user):
+        holdings = (
+            Holding.objects.filter(user=user)
+            .order_by('stock__symbol')
+            .values_list('stock__symbol', 'stock__name', 'stock__sector', 'quantity',
+                         'average_buy_price', 'total_invested', 'stock__current_price')
+        )
+        for symbol, name, sector, quantity, average, invested, price in holdings.iterator(chunk_size=CHUNK_SIZE):
+            value = quantity * price
+            yield (symbol, name, sector, quantity, average, invested, price, value, value - invested)
+
+
+class RealizedPnLExportView(ExportView):
+    """
+    What each sell realised, one row per lot it drew from (FIFO), read
+    straight from the RealizedGain rows written when the sell executed.
+    """
+    name = 'realized_pnl'
+    columns = ('trade_id', 'sold_at', 'symbol', 'lot_id', 'acquired_at', 'days_held', 'quantity',
+               'sell_price', 'proceeds', 'cost_per_share', 'cost_basis', 'realized_pnl')
+
+    def rows(self, user):
+        gains = (
+            RealizedGain.objects.filter(user=user)
+            .order_by('sold_at', 'id')
+            .values_list('sell_trade_id', 'sold_at', 'stock__symbol', 'lot_id', 'acquired_at', 'quantity',
+                         'proceeds', 'cost_basis', 'realized_pnl')
+        )
+        cent = Decimal('0.01')
+        for row in gains.iterator(chunk_size=CHUNK_SIZE):
+            trade_id, sold_at, symbol, lot_id, acquired_at, quantity, proceeds, basis, realized = row
+            yield (trade_id, sold_at.isoformat(), symbol, lot_id, acquired_at.isoformat(),
+                   (sold_at - acquired_at).days, quantity, (proceeds / quantity).quantize(cent), proceeds,
+                   (basis / quantity).quantize(cent), basis, realized)
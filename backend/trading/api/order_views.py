@@ -0,0 +1,263 @@
+from decimal import Decimal, InvalidOperation
+from django.utils import timezone
+from rest_framework.views import APIView
+from rest_framework.response import Response
+from rest_framework.permissions import IsAuthenticated
+from rest_framework import status
+from trading.models import Holding, Order, Stock, Trade
+from trading.pagination import page_size, PaginationError
+from trading.idempotency import idempotent
+from trading.services.order_execution import execute_basket, Leg, OrderRejected
+from services.nepse_client import NepseClient
+
+MAX_ORDER_QUANTITY = 10000
+MAX_BASKET_LEGS = 50
+
+
+class OrderError(ValueError):
+    pass
+
+
+def _positive_price(data, name):
+    try:
+        value = Decimal(str(data.get(name))).quantize(Decimal('0.01'))
+    except (InvalidOperation, ValueError):
+        raise OrderError(f"{name} must be a positive number")
+    if value <= 0:
+        raise OrderError(f"{name} must be a positive number")
+    return value
+
+
+def _quantity(value):
+    try:
+        quantity = int(value)
+    except (TypeError, ValueError):
+        quantity = 0
+    if quantity <= 0:
+        raise OrderError("Quantity must be a positive number")
+    if quantity > MAX_ORDER_QUANTITY:
+        raise OrderError(f"Maximum {MAX_ORDER_QUANTITY:,} shares per order")
+    return quantity
+
+
+def _side(value):
+    side = str(value or '').upper()
+    if side not in Trade.OrderType.values:
+        raise OrderError(f"side must be one of {', '.join(Trade.OrderType.values)}")
+    return side
+
+
+def parse_order(data):
+    """Validate a resting order request -> dict of Order fields (stock still a symbol)"""
+    symbol = str(data.get('symbol', '')).upper()
+    if not symbol:
+        raise OrderError("Stock symbol is required")
+
+    side = _side(data.get('side'))
+
+    order_type = str(data.get('order_type', '')).upper()
+    resting = [t for t in Order.OrderType.values if t != Order.OrderType.MARKET]
+    if order_type not in resting:
+        raise OrderError(f"order_type must be one of {', '.join(resting)} (market orders go through buy/sell)")
+
+    quantity = _quantity(data.get('quantity'))
+
+    uses_limit = order_type in (Order.OrderType.LIMIT, Order.OrderType.STOP_LIMIT)
+    uses_stop = order_type in (Order.OrderType.STOP, Order.OrderType.STOP_LIMIT)
+    return {
+        'symbol': symbol,
+        'side': side,
+        'order_type': order_type,
+        'quantity': quantity,
+        'limit_price': _positive_price(data, 'limit_price') if uses_limit else None,
+        'stop_price': _positive_price(data, 'stop_price') if uses_stop else None,
+    }
+
+
+def parse_basket(data):
+    """Validate a basket request -> [(symbol, side, quantity)]"""
+    legs = data.get('legs')
+    if not isinstance(legs, list) or not legs:
+        raise OrderError("legs must be a non-empty list of {symbol, side, quantity}")
+    if len(legs) > MAX_BASKET_LEGS:
+        raise OrderError(f"Maximum {MAX_BASKET_LEGS} legs per basket")
+
+    parsed = []
+    for number, leg in enumerate(legs, 1):
+        if not isinstance(leg, dict):
+            raise OrderError(f"Leg {number}: expected an object")
+        try:
+            symbol = str(leg.get('symbol', '')).upper()
+            if not symbol:
+                raise OrderError("Stock symbol is required")
+            parsed.append((symbol, _side(leg.get('side')), _quantity(leg.get('quantity'))))
+        except OrderError as e:
+            raise OrderError(f"Leg {number}: {e}")
+    return parsed
+
+
+class OrderListView(APIView):
+    """
+    GET: the user's orders, newest first (?status=OPEN,TRIGGERED&limit=)
+    POST: place a resting order
+    Required data: symbol, side (BUY/SELL), order_type (LIMIT/STOP/STOP_LIMIT),
+    quantity, plus limit_price and/or stop_price as the type needs.
+    The order rests until the live price crosses it and is then executed
+    by the market feed; nothing is reserved up front, so cash or shares
+    are checked when it fills.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        try:
+            limit = page_size(request.GET.get('limit'))
+        except PaginationError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        orders = Order.objects.filter(user=request.user).select_related('stock')
+        statuses = [s for s in request.GET.get('status', '').upper().split(',') if s]
+        if statuses:
+            unknown = set(statuses) - set(Order.Status.values)
+            if unknown:
+                return Response(
+                    {"error": f"Unknown status: {', '.join(sorted(unknown))}"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            orders = orders.filter(status__in=statuses)
+
+        return Response({
+            "orders": [order.to_dict() for order in orders.order_by('-created_at', '-id')[:limit]]
+        })
+
+    @idempotent
+    def post(self, request):
+        user = request.user
+        try:
+            fields = parse_order(request.data)
+        except OrderError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        symbol = fields.pop('symbol')
+        try:
+            stock = Stock.objects.get(symbol=symbol)
+        except Stock.DoesNotExist:
+            return Response({
+                "error": f"Stock with symbol '{symbol}' not found in our database",
+                "suggestion": "Please check the symbol or sync stocks first"
+            }, status=status.HTTP_404_NOT_FOUND)
+
+        if fields['side'] == Trade.OrderType.SELL:
+            # Checked again when the order fills
+            held = Holding.objects.filter(user=user, stock=stock).values_list('quantity', flat=True).first() or 0
+            if held < fields['quantity']:
+                return Response(
+                    {"error": f"Insufficient shares. You own {held} shares"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
+        order = Order.objects.create(user=user, stock=stock, **fields)
+        return Response({
+            "success": True,
+            "message": f"{order.get_order_type_display()} {order.side.lower()} order placed for {order.quantity} shares of {symbol}",
+            "order": order.to_dict()
+        }, status=status.HTTP_201_CREATED)
+
+
+class OrderCancelView(APIView):
+    """DELETE: cancel an order that hasn't filled yet (pending, open or triggered)"""
+    permission_classes = [IsAuthenticated]
+
+    def delete(self, request, order_id):
+        # Guarded UPDATE: loses cleanly to the feed if it is filling the order right now
+        cancelled = Order.objects.filter(pk=order_id, user=request.user, status__in=Order.CANCELLABLE).update(
+            status=Order.Status.CANCELLED, updated_at=timezone.now()
+        )
+        order = Order.objects.filter(pk=order_id, user=request.user).select_related('stock').first()
+        if order is None:
+            return Response({"error": "Order not found"}, status=status.HTTP_404_NOT_FOUND)
+        if not cancelled:
+            return Response(
+                {"error": f"Order is already {order.status.lower()}", "order": order.to_dict()},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return Response({"success": True, "order": order.to_dict()})
+
+
+class BasketOrderView(APIView):
+    """
+    POST: execute several market orders together, all or nothing
+    Required data: legs: [{symbol, side (BUY/SELL), quantity}, ...]
+    Every leg is priced from the same market snapshot, and the basket is
+    checked as a whole: shares per stock, and cash against the net cost,
+    so sells can fund the buys. One transaction writes every trade.
+    """
+    permission_classes = [IsAuthenticated]
+
+    @idempotent
+    def post(self, request):
+        try:
+            requested = parse_basket(request.data)
+        except OrderError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        market_status = NepseClient.get_market_status()
+        if market_status and not market_status.get('is_open', False):
+            return Response({
+                "warning": market_status.get('message') or "Market is not open for trading.",
+                "detail": "Baskets execute only while the market is open.",
+                "market_hours": "NEPSE: Sunday-Thursday, 11:00 AM - 3:00 PM NPT"
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        stocks = Stock.objects.in_bulk({symbol for symbol, _, _ in requested}, field_name='symbol')
+        missing = sorted({symbol for symbol, _, _ in requested} - set(stocks))
+        if missing:
+            return Response({
+                "error": f"Stocks not found in our database: {', '.join(missing)}",
+                "suggestion": "Please check the symbols or sync stocks first"
+            }, status=status.HTTP_404_NOT_FOUND)
+
+        snapshot = NepseClient.get_snapshot()
+        # Only live quotes fill orders; simulated ones, and a 0 last-traded
+        # price, fall back to the stored price
+        quotes = snapshot.quotes if snapshot.source == 'live' else {}
+        legs = []
+        for symbol, side, quantity in requested:
+            quote = quotes.get(symbol)
+            if quote is not None and quote['price'] > 0:
+                legs.append(Leg(stocks[symbol], side, quantity, quote['price'], 'nepse_api_live'))
+            else:
+                legs.append(Leg(stocks[symbol], side, quantity, stocks[symbol].current_price, 'database_cache'))
+
+        try:
+            trades, portfolio = execute_basket(request.user, legs)
+        except OrderRejected as e:
+            return Response(e.to_response(), status=status.HTTP_400_BAD_REQUEST)
+
+        bought = sum((t.total_amount for t in trades if t.order_type == Trade.OrderType.BUY), Decimal('0'))
+        sold = sum((t.total_amount for t in trades if t.order_type == Trade.OrderType.SELL), Decimal('0'))
+        symbols = {stock.id: symbol for symbol, stock in stocks.items()}
+        return Response({
+            "success": True,
+            "message": f"Executed {len(trades)} orders",
+            "trades": [
+                {
+                    "trade_id": trade.id,
+                    "symbol": symbols[trade.stock_id],
+                    "order_type": trade.order_type,
+                    "quantity": trade.quantity,
+                    "price_per_share": float(trade.price_per_share),
+                    "total_amount": float(trade.total_amount),
+                    "price_source": trade.price_source,
+                }
+                for trade in trades
+            ],
+            "summary": {
+                "total_bought": float(bought),
+                "total_sold": float(sold),
+                "net_cash": float(sold - bought),
+                "new_balance": float(portfolio.cash_balance),
+                "total_invested": float(portfolio.total_invested),
+                "holdings_count": portfolio.holdings_count,
+                "snapshot_version": snapshot.version,
+            }
+        }, status=status.HTTP_201_CREATED)
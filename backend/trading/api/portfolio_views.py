@@ -3,9 +3,15 @@ from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from rest_framework import status
 from django.db.models import Sum, Avg, Count
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from datetime import datetime, time
 from decimal import Decimal
 from trading.models import Holding, Trade, Stock
 from trading.serializers import HoldingSerializer, TradeSerializer
+from trading.services.ledger import portfolio_at
+from trading.services.portfolio_services import PortfolioService
+from services.price_history import NEPAL_TZ, closing_prices
 
 class PortfolioDashboardView(APIView):
     """
@@ -97,7 +103,7 @@ class PortfolioDashboardView(APIView):
                     (total_profit_loss / total_invested * 100) if total_invested > 0 else 0, 2
                 ),
                 'holdings_count': len(holdings_data),
-                'total_trades': Trade.objects.filter(user=user).count(),
+                'total_trades': portfolio.total_trades,
                 'diversification_score': len(holdings_data)  # Simple version
             },
             'holdings': holdings_data,
@@ -119,7 +125,7 @@ class PortfolioDashboardView(APIView):
 class PortfolioPerformanceView(APIView):
     """
     Historical performance data for charts
-    Shows portfolio value over time
+    Shows portfolio value over time, from DailyBar closes
     """
     permission_classes = [IsAuthenticated]
     
@@ -127,47 +133,8 @@ class PortfolioPerformanceView(APIView):
         user = request.user
         days = int(request.query_params.get('days', 30))
         
-        # Get trades for the period
-        from datetime import datetime, timedelta
-        start_date = datetime.now() - timedelta(days=days)
-        
-        trades = Trade.objects.filter(
-            user=user, 
-            timestamp__gte=start_date
-        ).order_by('timestamp')
-        
-        # Build timeline data
-        timeline = []
-        current_date = start_date
-        end_date = datetime.now()
-        
-        # This is simplified - you might want to calculate actual portfolio value
-        # on each day based on trades and stock prices
-        balance = user.portfolio.cash_balance
-        
-        # Group trades by date
-        from collections import defaultdict
-        daily_trades = defaultdict(list)
-        for trade in trades:
-            date_key = trade.timestamp.date()
-            daily_trades[date_key].append(trade)
-        
-        # Calculate daily portfolio value
-        for i in range(days):
-            date = start_date + timedelta(days=i)
-            date_key = date.date()
-            
-            # Get trades for this day
-            day_trades = daily_trades.get(date_key, [])
-            
-            # This is a simplified calculation
-            # In reality, you'd need stock prices for each day
-            day_value = float(user.portfolio.cash_balance)  # Simplified
-            
-            timeline.append({
-                'date': date.isoformat(),
-                'value': day_value
-            })
+        # Rebuilt from trades and the local daily price bars
+        timeline = PortfolioService(user).get_value_history(days)
         
         return Response({
             'timeline': timeline,
@@ -230,8 +197,11 @@ class HoldingDetailView(APIView):
                 'profit_loss_percentage': round(
                     ((holding.quantity * stock.current_price) - holding.total_invested) /
                     holding.total_invested * 100 if holding.total_invested > 0 else 0, 2
-                )
+                ),
+                'realized_profit_loss': float(holding.get_realized_profit_loss())
             },
+            # Open tax lots, oldest first: the order sells consume them in
+            'lots': holding.get_breakdown_by_purchase(),
             'trade_summary': {
                 'total_buys': buy_trades.count(),
                 'total_buy_value': float(buy_trades.aggregate(Sum('total_amount'))['total_amount__sum'] or 0),
@@ -245,4 +215,62 @@ class HoldingDetailView(APIView):
             'recent_trades': trades_data[:10]
         }
         
-        return Response(response_data)
\ No newline at end of file
+        return Response(response_data)
+
+
+class PortfolioAtView(APIView):
+    """
+    The portfolio as it stood at a past moment, rebuilt from the nearest
+    snapshot plus the ledger entries after it, valued at that day's close
+    GET ?at=2026-10-01 (end of that day, NPT) or ?at=2026-10-01T11:30:00+05:45
+    """
+    permission_classes = [IsAuthenticated]
+    
+    def get(self, request):
+        raw = request.query_params.get('at', '')
+        try:
+            # A bare date first: parse_datetime would read it as midnight
+            day = parse_date(raw)
+            when = parse_datetime(raw) if day is None else None
+        except ValueError:
+            when = day = None
+        if when is None and day is None:
+            return Response(
+                {"error": "at must be a date (YYYY-MM-DD) or an ISO 8601 datetime"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if day is not None:
+            when = NEPAL_TZ.localize(datetime.combine(day, time.max))
+        elif timezone.is_naive(when):
+            when = NEPAL_TZ.localize(when)
+        day = when.astimezone(NEPAL_TZ).date()
+        
+        state = portfolio_at(request.user.pk, when)
+        stocks = Stock.objects.in_bulk(list(state.positions))
+        closes = closing_prices(list(state.positions), day, day)
+        
+        holdings = []
+        for stock_id, (quantity, cost) in sorted(state.positions.items(), key=lambda item: stocks[item[0]].symbol):
+            known = closes[stock_id]
+            # That day's close, else the last one before it, else today's price
+            price = known[max(known)] if known else stocks[stock_id].current_price
+            holdings.append({
+                'symbol': stocks[stock_id].symbol,
+                'quantity': quantity,
+                'cost': float(cost),
+                'price': float(price),
+                'value': float(quantity * price),
+            })
+        holdings_value = sum(h['value'] for h in holdings)
+        
+        return Response({
+            'as_of': when.isoformat(),
+            'cash_balance': float(state.cash_balance),
+            'total_invested': float(state.total_invested),
+            'holdings_value': holdings_value,
+            'total_portfolio_value': float(state.cash_balance) + holdings_value,
+            'realized_profit_loss': float(state.realized_pnl),
+            'holdings': holdings,
+            'snapshot_taken_at': state.snapshot_taken_at.isoformat() if state.snapshot_taken_at else None,
+            'entries_replayed': state.replayed,
+        })
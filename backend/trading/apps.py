@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class TradingConfig(AppConfig):
     name = 'trading'
+    
+    def ready(self):
+        import trading.signals  # Trade counters on Portfolio, opening ledger entry
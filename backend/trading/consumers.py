@@ -1,7 +1,10 @@
 import json
+import asyncio
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
 from .models import Holding, Portfolio
+from services.async_nepse_client import AsyncNepseClient
+from services.price_broadcast import MARKET_GROUP
 
 class PortfolioConsumer(AsyncWebsocketConsumer):
     async def connect(self):
@@ -11,12 +14,14 @@ class PortfolioConsumer(AsyncWebsocketConsumer):
             await self.close()
         else:
             self.group_name = f'user_{self.user.id}_portfolio'
+            self.held_symbols = set()
             
-            # Join room group
+            # Join room group, plus the market-wide price delta feed
             await self.channel_layer.group_add(
                 self.group_name,
                 self.channel_name
             )
+            await self.channel_layer.group_add(MARKET_GROUP, self.channel_name)
             
             await self.accept()
             
@@ -29,6 +34,7 @@ class PortfolioConsumer(AsyncWebsocketConsumer):
             self.group_name,
             self.channel_name
         )
+        await self.channel_layer.group_discard(MARKET_GROUP, self.channel_name)
     
     async def receive(self, text_data):
         """Handle messages from frontend"""
@@ -37,19 +43,57 @@ class PortfolioConsumer(AsyncWebsocketConsumer):
         if data.get('action') == 'refresh':
             await self.send_portfolio_update()
     
+    async def price_deltas(self, event):
+        """Market feed diff: only react if one of our holdings moved"""
+        diff = event['diff']
+        changes = [c for c in diff['changes'] if c['symbol'] in self.held_symbols]
+        if not changes:
+            return
+        
+        await self.send(text_data=json.dumps({
+            'type': 'price_deltas',
+            'seq': diff['seq'],
+            'changes': changes
+        }))
+        await self.send_portfolio_update()
+    
     async def send_portfolio_update(self):
         """Send portfolio data to frontend"""
-        portfolio_data = await self.get_portfolio_data()
+        # DB read and live snapshot fetch run concurrently
+        portfolio_data, snapshot = await asyncio.gather(
+            self.get_portfolio_data(),
+            AsyncNepseClient.get_snapshot(),
+        )
+        self.apply_live_prices(portfolio_data, snapshot)
+        self.held_symbols = {h['symbol'] for h in portfolio_data['holdings']}
         
         await self.send(text_data=json.dumps({
             'type': 'portfolio_update',
             'data': portfolio_data
         }))
     
+    def apply_live_prices(self, portfolio_data, snapshot):
+        """Re-price holdings from the live snapshot where a quote exists"""
+        if snapshot.source != 'live':
+            return
+        
+        total_value = portfolio_data['cash_balance']
+        for holding in portfolio_data['holdings']:
+            quote = snapshot.quotes.get(holding['symbol'])
+            if quote:
+                holding['current_price'] = quote['price']
+                holding['current_value'] = quote['price'] * holding['quantity']
+                holding['profit_loss'] = holding['current_value'] - holding['total_invested']
+                holding['price_source'] = 'live'
+            total_value += holding['current_value']
+        
+        portfolio_data['total_value'] = total_value
+        portfolio_data['snapshot_version'] = snapshot.version
+    
     @database_sync_to_async
     def get_portfolio_data(self):
         """Get portfolio data from database"""
-        holdings = Holding.objects.filter(user=self.user)
+        holdings = Holding.objects.filter(user=self.user).select_related('stock')
         
         holdings_data = []
         total_value = self.user.portfolio.cash_balance
@@ -63,7 +107,9 @@ class PortfolioConsumer(AsyncWebsocketConsumer):
                 'quantity': holding.quantity,
                 'current_price': float(holding.stock.current_price),
                 'current_value': float(current_value),
-                'profit_loss': float(current_value - holding.total_invested)
+                'total_invested': float(holding.total_invested),
+                'profit_loss': float(current_value - holding.total_invested),
+                'price_source': 'database'
             })
         
         return {
@@ -0,0 +1,125 @@
+import json
+import time
+import hashlib
+from datetime import timedelta
+from functools import wraps
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework.response import Response
+from rest_framework import status
+from .models import IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+
+# How long a duplicate waits for the first request to finish before a 409
+IN_FLIGHT_WAIT = 10.0
+POLL_INTERVAL = 0.25
+# An unfinished key this old belongs to a request that died; a retry takes it over
+STALE_AFTER = timedelta(minutes=2)
+# Finished keys are kept this long (purge_idempotency_keys)
+KEEP_FOR = timedelta(hours=24)
+
+
+def request_fingerprint(request):
+    body = json.dumps(request.data, sort_keys=True, default=str)
+    return hashlib.sha256(f"{request.method} {request.path}\n{body}".encode()).hexdigest()
+
+
+def _replay(record):
+    response = Response(record.response_body, status=record.status_code)
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def _claim(user, key, endpoint, fingerprint):
+    """
+    Wait until this request owns the key (returns the new IdempotencyKey)
+    or an earlier request with the same key has an answer (returns the
+    Response to send back).
+    """
+    deadline = time.monotonic() + IN_FLIGHT_WAIT
+    while True:
+        try:
+            with transaction.atomic():
+                return IdempotencyKey.objects.create(
+                    user=user, key=key, endpoint=endpoint, request_hash=fingerprint
+                )
+        except IntegrityError:
+            record = IdempotencyKey.objects.filter(user=user, key=key).first()
+        if record is None:
+            continue  # the first request failed and released the key
+
+        if record.endpoint != endpoint or record.request_hash != fingerprint:
+            return Response(
+                {"error": f"{HEADER} was already used for a different request"},
+                status=status.HTTP_422_UNPROCESSABLE_ENTITY
+            )
+        if record.status_code is not None:
+            return _replay(record)
+
+        now = timezone.now()
+        if record.created_at < now - STALE_AFTER:
+            taken = IdempotencyKey.objects.filter(
+                pk=record.pk, status_code__isnull=True, created_at=record.created_at
+            ).update(created_at=now)
+            if taken:
+                record.created_at = now
+                return record
+
+        if time.monotonic() >= deadline:
+            response = Response(
+                {"error": f"A request with this {HEADER} is still being processed"},
+                status=status.HTTP_409_CONFLICT
+            )
+            response['Retry-After'] = '1'
+            return response
+        time.sleep(POLL_INTERVAL)
+
+
+def idempotent(view_method):
+    """
+    Make a POST handler safe to retry. With an Idempotency-Key header the
+    first request runs and its response is stored under (user, key); a
+    repeat gets that response back with Idempotent-Replayed: true, and a
+    repeat arriving while the first is still running waits for it.
+    The handler runs in one transaction with the stored response (the
+    order paths' own atomic blocks become savepoints), so a server error
+    or exception rolls back the order too and the key is released.
+    Requests without the header run as before.
+    """
+    @wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if key is None:
+            return view_method(self, request, *args, **kwargs)
+        key = key.strip()
+        if not key or len(key) > MAX_KEY_LENGTH:
+            return Response(
+                {"error": f"{HEADER} must be 1 to {MAX_KEY_LENGTH} characters"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        claimed = _claim(request.user, key, request.path, request_fingerprint(request))
+        if isinstance(claimed, Response):
+            return claimed
+
+        try:
+            # The order's writes and the stored response commit together:
+            # either a retry finds the response, or nothing was written
+            with transaction.atomic():
+                response = view_method(self, request, *args, **kwargs)
+                if response.status_code >= 500:
+                    transaction.set_rollback(True)
+                else:
+                    claimed.status_code = response.status_code
+                    claimed.response_body = response.data
+                    claimed.completed_at = timezone.now()
+                    claimed.save(update_fields=['status_code', 'response_body', 'completed_at'])
+        except Exception:
+            claimed.delete()
+            raise
+        if response.status_code >= 500:
+            claimed.delete()
+        return response
+    return wrapper
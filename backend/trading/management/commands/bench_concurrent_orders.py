@@ -0,0 +1,174 @@
+import random
+import threading
+import time
+from collections import defaultdict
+from decimal import Decimal
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.db.models import Sum
+from django.utils import timezone
+from trading.models import Stock, Portfolio, Holding, LedgerEntry, Lot, RealizedGain, Trade
+from trading.services.ledger import portfolio_at
+from trading.services.order_execution import execute_buy, execute_sell, OrderRejected
+
+BENCH_DOMAIN = 'bench.invalid'
+
+
+class Command(BaseCommand):
+    help = (
+        'Fire buy/sell orders at a few shared portfolios from many threads and check '
+        'that every balance, holding and portfolio total still matches its trades afterwards. '
+        'Meant for PostgreSQL; SQLite serializes writers and may report "database is locked".'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--orders', type=int, default=200, help='Orders per thread (default 200)')
+        parser.add_argument('--users', type=int, default=4,
+                            help='Portfolios the threads share; fewer means more lock contention')
+        parser.add_argument('--stocks', type=int, default=5)
+        parser.add_argument('--cash', type=Decimal, default=Decimal('50000'),
+                            help='Starting cash per portfolio, small enough that some buys get rejected')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--keep', action='store_true', help='Keep the bench users and their trades')
+
+    def handle(self, *args, **options):
+        stocks = list(Stock.objects.filter(current_price__gt=0).order_by('symbol')[:options['stocks']])
+        if not stocks:
+            raise CommandError('No priced stocks; run sync_nepse_stocks first')
+
+        users = self.create_users(options['users'], options['cash'])
+        counts = defaultdict(int)
+        counts_lock = threading.Lock()
+
+        def worker(index):
+            rng = random.Random(options['seed'] * 1000 + index)
+            local = defaultdict(int)
+            try:
+                for _ in range(options['orders']):
+                    user = rng.choice(users)
+                    stock = rng.choice(stocks)
+                    quantity = rng.randint(1, 20)
+                    execute = execute_buy if rng.random() < 0.6 else execute_sell
+                    try:
+                        execute(user, stock, quantity, stock.current_price)
+                        local['executed'] += 1
+                    except OrderRejected:
+                        local['rejected'] += 1
+                    except Exception as e:
+                        local['errors'] += 1
+                        local['last_error'] = str(e)
+            finally:
+                connections.close_all()
+                with counts_lock:
+                    for key, value in local.items():
+                        if key == 'last_error':
+                            counts[key] = value
+                        else:
+                            counts[key] += value
+
+        self.stdout.write(
+            f"{options['threads']} threads x {options['orders']} orders over "
+            f"{len(users)} portfolios and {len(stocks)} stocks ({connection.vendor})"
+        )
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(options['threads'])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        total = options['threads'] * options['orders']
+        self.stdout.write(
+            f"{total} orders in {elapsed:.2f}s: {total / elapsed:.0f} orders/s, "
+            f"{counts['executed']} executed, {counts['rejected']} rejected, {counts['errors']} errors"
+        )
+        if counts['errors']:
+            self.stdout.write(self.style.WARNING(f"Last error: {counts['last_error']}"))
+
+        drift = self.verify(users, options['cash'])
+        if options['keep']:
+            self.stdout.write(f"Kept bench users *@{BENCH_DOMAIN}")
+        else:
+            get_user_model().objects.filter(email__endswith=f'@{BENCH_DOMAIN}').delete()
+
+        if drift:
+            raise CommandError(f"Balance drift found in {drift} portfolio(s)")
+        self.stdout.write(self.style.SUCCESS("Zero balance drift"))
+
+    def create_users(self, count, cash):
+        User = get_user_model()
+        User.objects.filter(email__endswith=f'@{BENCH_DOMAIN}').delete()
+        users = []
+        for i in range(count):
+            email = f'bench{i}@{BENCH_DOMAIN}'
+            user = User.objects.create(username=email, email=email)
+            opening = Portfolio.objects.get(user=user).cash_balance
+            Portfolio.objects.filter(user=user).update(cash_balance=cash)
+            LedgerEntry.objects.create(user=user, kind=LedgerEntry.Kind.ADJUSTMENT, cash_delta=cash - opening)
+            users.append(user)
+        return users
+
+    def verify(self, users, cash):
+        """Replay each portfolio's trades and compare with what's stored"""
+        drift = 0
+        for user in users:
+            trades = Trade.objects.filter(user=user)
+            spent = trades.filter(order_type=Trade.OrderType.BUY).aggregate(s=Sum('total_amount'))['s'] or 0
+            received = trades.filter(order_type=Trade.OrderType.SELL).aggregate(s=Sum('total_amount'))['s'] or 0
+            expected = (cash - spent + received).quantize(Decimal('0.01'))
+            portfolio = Portfolio.objects.get(user=user)
+            actual = portfolio.cash_balance
+
+            shares = defaultdict(int)
+            for stock_id, order_type, quantity in trades.values_list('stock_id', 'order_type', 'quantity'):
+                shares[stock_id] += quantity if order_type == Trade.OrderType.BUY else -quantity
+            held = dict(Holding.objects.filter(user=user).values_list('stock_id', 'quantity'))
+            mismatched = {
+                stock_id for stock_id in set(shares) | set(held)
+                if shares.get(stock_id, 0) != held.get(stock_id, 0)
+            }
+
+            invested = Holding.objects.filter(user=user).aggregate(s=Sum('total_invested'))['s'] or 0
+            realized = RealizedGain.objects.filter(user=user).aggregate(s=Sum('realized_pnl'))['s'] or 0
+            totals_ok = (portfolio.total_invested == invested and portfolio.holdings_count == len(held)
+                         and portfolio.realized_pnl == realized)
+
+            # Open lots must add up to each holding, shares and cost
+            lots = Lot.objects.filter(user=user, remaining_quantity__gt=0).values('stock_id').annotate(
+                shares=Sum('remaining_quantity'), cost=Sum('remaining_cost')
+            )
+            lot_totals = {row['stock_id']: (row['shares'], row['cost']) for row in lots}
+            holding_totals = {
+                stock_id: (quantity, cost)
+                for stock_id, quantity, cost in Holding.objects.filter(user=user).values_list(
+                    'stock_id', 'quantity', 'total_invested'
+                )
+            }
+            mismatched |= {
+                stock_id for stock_id in set(lot_totals) | set(holding_totals)
+                if lot_totals.get(stock_id) != holding_totals.get(stock_id)
+            }
+
+            # The ledger replayed to now must land on the same portfolio
+            replay = portfolio_at(user.pk, timezone.now())
+            ledger_ok = (
+                (replay.cash_balance, replay.total_invested, replay.realized_pnl)
+                == (actual, portfolio.total_invested, portfolio.realized_pnl)
+                and {stock_id: tuple(position) for stock_id, position in replay.positions.items()} == holding_totals
+            )
+
+            ok = actual == expected and actual >= 0 and not mismatched and totals_ok and ledger_ok
+            drift += not ok
+            line = f"  {user.email}: cash {actual} (expected {expected}), {trades.count()} trades"
+            if mismatched:
+                line += f", share or lot mismatch in {len(mismatched)} stock(s)"
+            if not totals_ok:
+                line += (f", portfolio totals {portfolio.total_invested}/{portfolio.holdings_count}/{portfolio.realized_pnl}"
+                         f" vs {invested}/{len(held)}/{realized}")
+            if not ledger_ok:
+                line += f", ledger replay gives cash {replay.cash_balance}, {len(replay.positions)} positions"
+            self.stdout.write(line if ok else self.style.ERROR(line))
+        return drift
@@ -0,0 +1,143 @@
+from datetime import datetime, timezone
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from trading.models import Trade
+
+TABLE = Trade._meta.db_table
+LEGACY = f'{TABLE}_legacy'
+
+
+def month_start(value):
+    return datetime(value.year, value.month, 1, tzinfo=timezone.utc)
+
+
+def next_month(value):
+    return datetime(value.year + value.month // 12, value.month % 12 + 1, 1, tzinfo=timezone.utc)
+
+
+def partition_name(start):
+    return f'{TABLE}_p{start:%Y_%m}'
+
+
+class Command(BaseCommand):
+    help = (
+        'Convert the trades table to monthly range partitions on timestamp (PostgreSQL), '
+        'or, once partitioned, create the partitions for the coming months. '
+        'Run it monthly (cron / beat) so new trades never land in the default partition.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months-ahead', type=int, default=3,
+                            help='Future monthly partitions to keep ready (default 3)')
+        parser.add_argument('--keep-legacy', action='store_true',
+                            help=f'Keep the original table as {LEGACY} after copying (for rollback)')
+        parser.add_argument('--dry-run', action='store_true', help='Print the SQL instead of running it')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('Table partitioning needs PostgreSQL')
+
+        self.dry_run = options['dry_run']
+        with connection.cursor() as cursor:
+            self.cursor = cursor
+            if self.is_partitioned():
+                created = self.ensure_partitions(datetime.now(timezone.utc), options['months_ahead'])
+                self.stdout.write(self.style.SUCCESS(f"{TABLE} is partitioned, {created} new partition(s)"))
+                return
+
+            with transaction.atomic():
+                self.convert(options['months_ahead'], options['keep_legacy'])
+
+        if not self.dry_run:
+            self.stdout.write(self.style.SUCCESS(f"{TABLE} is now partitioned by month"))
+
+    def execute_sql(self, sql, params=None):
+        if self.dry_run:
+            self.stdout.write(f"{sql};" if not params else f"{sql}; -- {params}")
+            return
+        self.cursor.execute(sql, params)
+
+    def fetch(self, sql, params=None):
+        self.cursor.execute(sql, params)
+        return self.cursor.fetchall()
+
+    def is_partitioned(self):
+        return bool(self.fetch(
+            "SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid WHERE c.relname = %s",
+            [TABLE],
+        ))
+
+    def ensure_partitions(self, until, months_ahead, since=None):
+        """Create missing monthly partitions from `since` up to months_ahead past `until`"""
+        existing = {row[0] for row in self.fetch(
+            "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            "JOIN pg_class p ON p.oid = i.inhparent WHERE p.relname = %s",
+            [TABLE],
+        )}
+
+        start = month_start(since or until)
+        end = month_start(until)
+        for _ in range(months_ahead + 1):
+            end = next_month(end)
+
+        created = 0
+        while start < end:
+            name = partition_name(start)
+            if name not in existing:
+                self.execute_sql(
+                    f'CREATE TABLE "{name}" PARTITION OF "{TABLE}" '
+                    f"FOR VALUES FROM ('{start.isoformat()}') TO ('{next_month(start).isoformat()}')"
+                )
+                created += 1
+            start = next_month(start)
+
+        if f'{TABLE}_default' not in existing:
+            self.execute_sql(f'CREATE TABLE "{TABLE}_default" PARTITION OF "{TABLE}" DEFAULT')
+        return created
+
+    def convert(self, months_ahead, keep_legacy):
+        """
+        Swap the plain table for a partitioned one with the same columns,
+        indexes and foreign keys, then copy the rows over. The primary key
+        becomes (id, timestamp), since it must include the partition key.
+        INCLUDING IDENTITY gives the new table its own identity sequence,
+        which is moved past the copied ids once the rows are in.
+        """
+        indexes = self.fetch(
+            "SELECT indexname, indexdef FROM pg_indexes WHERE schemaname = current_schema() AND tablename = %s",
+            [TABLE],
+        )
+        foreign_keys = self.fetch(
+            "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+            "WHERE conrelid = %s::regclass AND contype = 'f'",
+            [TABLE],
+        )
+        first, count = self.fetch(f'SELECT MIN("timestamp"), COUNT(*) FROM "{TABLE}"')[0]
+        self.stdout.write(f"Partitioning {count} trades" + (f" since {first:%Y-%m}" if first else ""))
+
+        # Move the old table (and its index names) out of the way
+        self.execute_sql(f'ALTER TABLE "{TABLE}" RENAME TO "{LEGACY}"')
+        for name, _ in indexes:
+            self.execute_sql(f'ALTER INDEX "{name}" RENAME TO "{name[:56]}_legacy"')
+
+        self.execute_sql(
+            f'CREATE TABLE "{TABLE}" (LIKE "{LEGACY}" INCLUDING DEFAULTS INCLUDING IDENTITY INCLUDING CONSTRAINTS) '
+            f'PARTITION BY RANGE ("timestamp")'
+        )
+        self.execute_sql(f'ALTER TABLE "{TABLE}" ADD PRIMARY KEY ("id", "timestamp")')
+        for name, definition in indexes:
+            if name == f'{TABLE}_pkey' or definition.startswith('CREATE UNIQUE'):
+                continue  # unique indexes must include the partition key
+            self.execute_sql(definition)
+        for name, definition in foreign_keys:
+            self.execute_sql(f'ALTER TABLE "{TABLE}" ADD CONSTRAINT "{name}" {definition}')
+
+        self.ensure_partitions(datetime.now(timezone.utc), months_ahead, since=first)
+
+        self.execute_sql(f'INSERT INTO "{TABLE}" OVERRIDING SYSTEM VALUE SELECT * FROM "{LEGACY}"')
+        self.execute_sql(
+            f"SELECT setval(pg_get_serial_sequence('\"{TABLE}\"', 'id'), "
+            f'COALESCE((SELECT MAX("id") FROM "{TABLE}"), 0) + 1, false)'
+        )
+        if not keep_legacy:
+            self.execute_sql(f'DROP TABLE "{LEGACY}"')
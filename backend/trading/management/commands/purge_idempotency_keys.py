@@ -0,0 +1,18 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from trading.idempotency import KEEP_FOR
+from trading.models import IdempotencyKey
+
+
+class Command(BaseCommand):
+    help = 'Delete stored Idempotency-Key responses older than the replay window (run daily)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=float, default=KEEP_FOR.total_seconds() / 3600,
+                            help=f'Keep keys this many hours (default {KEEP_FOR.total_seconds() / 3600:g})')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(hours=options['hours'])
+        deleted, _ = IdempotencyKey.objects.filter(created_at__lt=cutoff).delete()
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} idempotency keys older than {options['hours']:g}h"))
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from services.market_feed import MarketFeedPoller
+from services.nepse_http import feed_enabled
+
+
+class Command(BaseCommand):
+    help = 'Poll NEPSE /LiveMarket on a fixed cadence and publish snapshots to the cache'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, help='Seconds between polls while the market is open')
+        parser.add_argument('--closed-interval', type=float, help='Seconds between polls while closed/halted')
+        parser.add_argument('--once', action='store_true', help='Publish a single snapshot and exit')
+    
+    def handle(self, *args, **options):
+        poller = MarketFeedPoller(
+            interval=options['interval'],
+            closed_interval=options['closed_interval'],
+        )
+        
+        if not feed_enabled():
+            self.stdout.write(self.style.WARNING(
+                "NEPSE_API['FEED']['ENABLED'] is off - web requests will still fetch upstream themselves"
+            ))
+        
+        self.stdout.write(
+            f"Polling every {poller.interval}s (open) / {poller.closed_interval}s (closed). Ctrl+C to stop."
+        )
+        try:
+            poller.run(max_polls=1 if options['once'] else None)
+        except KeyboardInterrupt:
+            pass
+        
+        self.stdout.write(self.style.SUCCESS("Market feed stopped"))
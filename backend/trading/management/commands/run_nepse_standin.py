@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+from services.nepse_standin import StandinServer, DEFAULTS, MARKET_STATES
+
+
+class Command(BaseCommand):
+    help = 'Run a local stand-in for the NEPSE upstream API (offline development and load tests)'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8003)
+        parser.add_argument('--symbols', type=int, help=f"Universe size (default {DEFAULTS['symbols']})")
+        parser.add_argument('--tick-interval', type=float, help='Seconds between price ticks')
+        parser.add_argument('--latency', help='fixed:<ms> | uniform:<min>:<max> | lognormal:<median_ms>:<sigma>')
+        parser.add_argument('--error-rate', type=float, help='Share of requests that fail (0-1)')
+        parser.add_argument('--error-status', type=int, help='HTTP status for injected failures')
+        parser.add_argument('--state', choices=MARKET_STATES, help='Market state reported by /IsNepseOpen')
+        parser.add_argument('--seed', type=int, help='Seed for a reproducible market')
+    
+    def handle(self, *args, **options):
+        server = StandinServer(
+            host=options['host'],
+            port=options['port'],
+            symbols=options['symbols'],
+            tick_interval=options['tick_interval'],
+            latency=options['latency'],
+            error_rate=options['error_rate'],
+            error_status=options['error_status'],
+            state=options['state'],
+            seed=options['seed'],
+        )
+        config = server.config
+        
+        self.stdout.write(self.style.SUCCESS(f"NEPSE stand-in listening on {server.address}"))
+        self.stdout.write(
+            f"{config['symbols']} symbols, tick {config['tick_interval']}s, latency {config['latency']}, "
+            f"error rate {config['error_rate']}, state {config['state']}"
+        )
+        self.stdout.write(f"Change settings live: curl -X POST {server.address}/_standin -d '{{\"state\": \"HALT\"}}'")
+        
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            self.stdout.write("Stopping stand-in")
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from trading.services.ledger import SETTLE_TIME, take_snapshots
+
+
+class Command(BaseCommand):
+    help = (
+        'Snapshot every portfolio whose ledger moved since the last run (run daily after the close, '
+        'or more often for shorter replays)'
+    )
+
+    def handle(self, *args, **options):
+        as_of = timezone.now() - SETTLE_TIME
+        written = take_snapshots(as_of)
+        self.stdout.write(self.style.SUCCESS(f"Wrote {written} portfolio snapshots as of {as_of.isoformat()}"))
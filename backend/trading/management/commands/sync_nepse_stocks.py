@@ -1,6 +1,6 @@
 from django.core.management.base import BaseCommand
-from trading.models import Stock
 from services.nepse_client import NepseClient
+from services.price_updater import upsert_stocks
 
 class Command(BaseCommand):
     help = 'Sync stocks from NEPSE API to database'
@@ -15,34 +15,18 @@ class Command(BaseCommand):
             self.stdout.write(self.style.ERROR("Failed to fetch stocks"))
             return
         
-        # Counter for stats
-        created = 0
-        updated = 0
-        
-        for item in stocks_data:
-            symbol = item.get('symbol')
-            name = item.get('companyName', '')
-            
-            if not symbol:
-                continue
-            
-            # Update or create
-            stock, is_new = Stock.objects.update_or_create(
-                symbol=symbol,
-                defaults={
-                    'name': name,
-                    'current_price': item.get('lastTradedPrice', 0),
-                    'sector': item.get('sectorName', '')
-                }
-            )
-            
-            if is_new:
-                created += 1
-            else:
-                updated += 1
+        result = upsert_stocks(
+            {
+                'symbol': item.get('symbol'),
+                'name': item.get('companyName'),
+                'current_price': item.get('lastTradedPrice'),
+                'sector': item.get('sectorName'),
+            }
+            for item in stocks_data
+        )
         
         self.stdout.write(
             self.style.SUCCESS(
-                f"Done! Created: {created}, Updated: {updated}"
+                f"Done! Created: {result.created}, Updated: {result.updated}, Unchanged: {result.unchanged}"
             )
         )
\ No newline at end of file
@@ -1,6 +1,7 @@
 from django.core.management.base import BaseCommand
 from trading.models import Stock
-import requests
+from services.nepse_http import nepse_get, base_url
+from services.price_updater import upsert_stocks
 import logging
 
 logger = logging.getLogger(__name__)
@@ -9,14 +10,11 @@ class Command(BaseCommand):
     help = 'Update stock sectors from NEPSE CompanyList API'
     
     def handle(self, *args, **options):
-        self.stdout.write("Fetching company list from NEPSE API...")
+        self.stdout.write(f"Fetching company list from NEPSE API at {base_url()}...")
         
         # Get company list which HAS sector information
         try:
-            response = requests.get(
-                "http://localhost:8000/CompanyList",
-                timeout=10
-            )
+            response = nepse_get("/CompanyList")
             
             if response.status_code != 200:
                 self.stdout.write(self.style.ERROR(f"API returned {response.status_code}"))
@@ -40,26 +38,17 @@ class Command(BaseCommand):
         
         self.stdout.write(f"Found sector info for {len(sector_map)} companies")
         
-        # Update stocks
-        updated = 0
-        skipped = 0
-        
-        for symbol, sector in sector_map.items():
-            try:
-                stock = Stock.objects.get(symbol=symbol)
-                if stock.sector != sector:
-                    stock.sector = sector
-                    stock.save()
-                    updated += 1
-                    self.stdout.write(f"✓ {symbol}: {sector}")
-            except Stock.DoesNotExist:
-                skipped += 1
-                continue
+        # Update stocks (only ones we already track)
+        result = upsert_stocks(
+            ({'symbol': symbol, 'sector': sector} for symbol, sector in sector_map.items()),
+            create=False,
+        )
         
         self.stdout.write(self.style.SUCCESS(
-            f"\n✅ Updated sectors for {updated} stocks"
+            f"\n✅ Updated sectors for {result.updated} stocks"
         ))
-        self.stdout.write(f"Stocks not found in database: {skipped}")
+        self.stdout.write(f"Already up to date: {result.unchanged}")
+        self.stdout.write(f"Stocks not found in database: {result.skipped}")
         
         # Show remaining unknown stocks
         unknown_count = Stock.objects.filter(sector='Unknown').count()
@@ -0,0 +1,46 @@
+# Generated by Django 6.0.2 on 2026-10-18 19:40
+
+import django.contrib.postgres.indexes
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trading', '0006_trade_price_source_alter_trade_status'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyBar',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('open', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('high', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('low', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('close', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('volume', models.BigIntegerField(default=0)),
+                ('stock', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='daily_bars', to='trading.stock')),
+            ],
+            options={
+                'indexes': [django.contrib.postgres.indexes.BrinIndex(fields=['date'], name='dailybar_date_brin')],
+                'constraints': [models.UniqueConstraint(fields=('stock', 'date'), name='unique_bar_per_stock_day')],
+            },
+        ),
+        migrations.CreateModel(
+            name='PriceTick',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('timestamp', models.DateTimeField()),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('volume', models.BigIntegerField(default=0)),
+                ('stock', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='ticks', to='trading.stock')),
+            ],
+            options={
+                'indexes': [django.contrib.postgres.indexes.BrinIndex(fields=['timestamp'], name='pricetick_timestamp_brin')],
+                'constraints': [models.UniqueConstraint(fields=('stock', 'timestamp'), name='unique_tick_per_stock_time')],
+            },
+        ),
+    ]
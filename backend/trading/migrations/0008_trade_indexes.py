@@ -0,0 +1,23 @@
+# Generated by Django 6.0.2 on 2026-10-18 20:05
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trading', '0007_pricetick_dailybar'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='trade',
+            index=models.Index(fields=['user', '-timestamp', '-id'], name='trade_user_ts_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='trade',
+            index=models.Index(fields=['user', 'stock', 'order_type'], name='trade_user_stock_type_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 6.0.2 on 2026-10-18 20:30
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_existing_trades(apps, schema_editor):
+    Portfolio = apps.get_model('trading', 'Portfolio')
+    Trade = apps.get_model('trading', 'Trade')
+    counts = (
+        Trade.objects.filter(user_id=OuterRef('user_id'))
+        .order_by().values('user_id').annotate(n=Count('id')).values('n')
+    )
+    Portfolio.objects.update(total_trades=Coalesce(Subquery(counts), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trading', '0008_trade_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='portfolio',
+            name='total_trades',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(count_existing_trades, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 6.0.2 on 2026-10-18 21:10
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def total_existing_holdings(apps, schema_editor):
+    Portfolio = apps.get_model('trading', 'Portfolio')
+    Holding = apps.get_model('trading', 'Holding')
+    holdings = Holding.objects.filter(user_id=OuterRef('user_id')).order_by().values('user_id')
+    Portfolio.objects.update(
+        total_invested=Coalesce(
+            Subquery(holdings.annotate(s=Sum('total_invested')).values('s')),
+            0,
+            output_field=models.DecimalField(max_digits=14, decimal_places=2),
+        ),
+        holdings_count=Coalesce(Subquery(holdings.annotate(n=Count('id')).values('n')), 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trading', '0009_portfolio_total_trades'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='portfolio',
+            name='holdings_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='portfolio',
+            name='total_invested',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=14),
+        ),
+        migrations.RunPython(total_existing_holdings, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 6.0.2 on 2026-10-18 22:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trading', '0011_order'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='order',
+            name='order_type',
+            field=models.CharField(choices=[('MARKET', 'Market'), ('LIMIT', 'Limit'), ('STOP', 'Stop'), ('STOP_LIMIT', 'Stop limit')], max_length=10),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='status',
+            field=models.CharField(choices=[('PENDING', 'Pending'), ('OPEN', 'Open'), ('TRIGGERED', 'Triggered'), ('FILLED', 'Filled'), ('CANCELLED', 'Cancelled'), ('REJECTED', 'Rejected')], default='OPEN', max_length=10),
+        ),
+    ]
@@ -0,0 +1,155 @@
+# Generated by Django 6.0.2 on 2026-10-18 22:40
+
+import django.db.models.deletion
+from collections import defaultdict
+from decimal import Decimal
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def replay_trades_into_lots(apps, schema_editor):
+    """
+    Rebuild each user's lots and what every past sell realised by replaying
+    their trades oldest first, FIFO. A position the trades don't account
+    for gets a single lot at its average cost instead. Holdings and
+    portfolios are then restated at the cost of the lots still open.
+    """
+    Trade = apps.get_model('trading', 'Trade')
+    Holding = apps.get_model('trading', 'Holding')
+    Portfolio = apps.get_model('trading', 'Portfolio')
+    Lot = apps.get_model('trading', 'Lot')
+    RealizedGain = apps.get_model('trading', 'RealizedGain')
+    cent = Decimal('0.01')
+    now = timezone.now()
+
+    user_ids = set(Trade.objects.values_list('user_id', flat=True).distinct())
+    user_ids |= set(Holding.objects.values_list('user_id', flat=True).distinct())
+    for user_id in sorted(user_ids):
+        lots = defaultdict(list)  # stock_id -> [Lot], oldest first
+        gains = []
+        for trade in Trade.objects.filter(user_id=user_id).order_by('timestamp', 'id').iterator():
+            if trade.order_type == 'BUY':
+                lots[trade.stock_id].append(Lot(
+                    user_id=user_id, stock_id=trade.stock_id, buy_trade_id=trade.id,
+                    quantity=trade.quantity, remaining_quantity=trade.quantity,
+                    price_per_share=trade.price_per_share, remaining_cost=trade.total_amount,
+                    acquired_at=trade.timestamp,
+                ))
+                continue
+            left = trade.quantity
+            for lot in lots[trade.stock_id]:
+                if not left:
+                    break
+                take = min(left, lot.remaining_quantity)
+                if not take:
+                    continue
+                cost = lot.remaining_cost if take == lot.remaining_quantity else lot.price_per_share * take
+                proceeds = (trade.price_per_share * take).quantize(cent)
+                lot.remaining_quantity -= take
+                lot.remaining_cost -= cost
+                if not lot.remaining_quantity:
+                    lot.closed_at = trade.timestamp
+                left -= take
+                gains.append(RealizedGain(
+                    user_id=user_id, stock_id=trade.stock_id, sell_trade_id=trade.id, lot=lot,
+                    quantity=take, cost_basis=cost, proceeds=proceeds, realized_pnl=proceeds - cost,
+                    acquired_at=lot.acquired_at, sold_at=trade.timestamp,
+                ))
+
+        holdings = list(Holding.objects.filter(user_id=user_id))
+        for holding in holdings:
+            stock_lots = lots[holding.stock_id]
+            if sum(lot.remaining_quantity for lot in stock_lots) != holding.quantity:
+                for lot in stock_lots:
+                    if lot.remaining_quantity:
+                        lot.remaining_quantity, lot.remaining_cost, lot.closed_at = 0, Decimal('0.00'), now
+                stock_lots.append(Lot(
+                    user_id=user_id, stock_id=holding.stock_id, quantity=holding.quantity,
+                    remaining_quantity=holding.quantity, price_per_share=holding.average_buy_price,
+                    remaining_cost=holding.total_invested,
+                    acquired_at=holding.first_purchase_date or holding.created_at,
+                ))
+            holding.total_invested = sum((lot.remaining_cost for lot in stock_lots), Decimal('0.00'))
+            if holding.quantity:
+                holding.average_buy_price = (holding.total_invested / holding.quantity).quantize(cent)
+        held = {holding.stock_id for holding in holdings}
+        for stock_id, stock_lots in lots.items():
+            if stock_id not in held:
+                for lot in stock_lots:
+                    if lot.remaining_quantity:
+                        lot.remaining_quantity, lot.remaining_cost, lot.closed_at = 0, Decimal('0.00'), now
+
+        Lot.objects.bulk_create([lot for stock_lots in lots.values() for lot in stock_lots])
+        RealizedGain.objects.bulk_create(gains)
+        Holding.objects.bulk_update(holdings, ['total_invested', 'average_buy_price'])
+        Portfolio.objects.filter(user_id=user_id).update(
+            total_invested=sum((holding.total_invested for holding in holdings), Decimal('0.00')),
+            realized_pnl=sum((gain.realized_pnl for gain in gains), Decimal('0.00')),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trading', '0013_idempotencykey'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='portfolio',
+            name='realized_pnl',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=14),
+        ),
+        migrations.CreateModel(
+            name='Lot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField()),
+                ('remaining_quantity', models.PositiveIntegerField()),
+                ('price_per_share', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('remaining_cost', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('acquired_at', models.DateTimeField()),
+                ('closed_at', models.DateTimeField(blank=True, null=True)),
+                ('buy_trade', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='trading.trade')),
+                ('stock', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='lots', to='trading.stock')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lots', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['acquired_at', 'id'],
+            },
+        ),
+        migrations.CreateModel(
+            name='RealizedGain',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField()),
+                ('cost_basis', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('proceeds', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('realized_pnl', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('acquired_at', models.DateTimeField()),
+                ('sold_at', models.DateTimeField()),
+                ('lot', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='sales', to='trading.lot')),
+                ('sell_trade', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='trading.trade')),
+                ('stock', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='realized_gains', to='trading.stock')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='realized_gains', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['sold_at', 'id'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='lot',
+            index=models.Index(condition=models.Q(('remaining_quantity__gt', 0)), fields=['user', 'stock', 'acquired_at', 'id'], name='lot_open_fifo_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='realizedgain',
+            index=models.Index(fields=['user', 'sold_at', 'id'], name='gain_user_sold_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='realizedgain',
+            index=models.Index(fields=['user', 'stock'], name='gain_user_stock_idx'),
+        ),
+        migrations.RunPython(replay_trades_into_lots, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,116 @@
+# Generated by Django 6.0.2 on 2026-10-18 23:25
+
+import django.contrib.postgres.indexes
+import django.core.serializers.json
+import django.db.models.deletion
+import django.utils.timezone
+from decimal import Decimal
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+
+def journal_existing_portfolios(apps, schema_editor):
+    """
+    Write the ledger the portfolios would have had: an opening entry with
+    the cash before the first trade, then one entry per trade, with sells
+    costed from the realised gains of 0014. Whatever the trades don't
+    explain becomes an ADJUSTMENT, so replaying lands on today's rows.
+    """
+    Portfolio = apps.get_model('trading', 'Portfolio')
+    Trade = apps.get_model('trading', 'Trade')
+    Holding = apps.get_model('trading', 'Holding')
+    RealizedGain = apps.get_model('trading', 'RealizedGain')
+    LedgerEntry = apps.get_model('trading', 'LedgerEntry')
+    zero = Decimal('0.00')
+    now = django.utils.timezone.now()
+
+    for portfolio in Portfolio.objects.order_by('user_id').iterator():
+        user_id = portfolio.user_id
+        sells = {
+            row['sell_trade_id']: (row['basis'], row['realized'])
+            for row in RealizedGain.objects.filter(user_id=user_id).values('sell_trade_id').annotate(
+                basis=Sum('cost_basis'), realized=Sum('realized_pnl')
+            )
+        }
+        entries = []
+        cash = zero
+        positions = {}  # stock_id -> [quantity, cost]
+        for trade in Trade.objects.filter(user_id=user_id).order_by('timestamp', 'id').iterator():
+            buy = trade.order_type == 'BUY'
+            basis, realized = sells.get(trade.id, (zero, zero))
+            entry = LedgerEntry(
+                user_id=user_id, kind=trade.order_type, stock_id=trade.stock_id, trade_id=trade.id,
+                cash_delta=-trade.total_amount if buy else trade.total_amount,
+                quantity_delta=trade.quantity if buy else -trade.quantity,
+                cost_delta=trade.total_amount if buy else -basis,
+                realized_pnl=zero if buy else realized,
+                created_at=trade.timestamp,
+            )
+            entries.append(entry)
+            cash += entry.cash_delta
+            position = positions.setdefault(trade.stock_id, [0, zero])
+            position[0] += entry.quantity_delta
+            position[1] += entry.cost_delta
+
+        opened = min([portfolio.created_at] + [entry.created_at for entry in entries[:1]])
+        entries.insert(0, LedgerEntry(
+            user_id=user_id, kind='OPENING', cash_delta=portfolio.cash_balance - cash, created_at=opened,
+        ))
+
+        held = {h.stock_id: (h.quantity, h.total_invested) for h in Holding.objects.filter(user_id=user_id)}
+        for stock_id in sorted(set(positions) | set(held)):
+            quantity, cost = positions.get(stock_id, (0, zero))
+            target_quantity, target_cost = held.get(stock_id, (0, zero))
+            if (quantity, cost) != (target_quantity, target_cost):
+                entries.append(LedgerEntry(
+                    user_id=user_id, kind='ADJUSTMENT', stock_id=stock_id,
+                    quantity_delta=target_quantity - quantity, cost_delta=target_cost - cost, created_at=now,
+                ))
+        LedgerEntry.objects.bulk_create(entries, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trading', '0014_lots'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LedgerEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('OPENING', 'Opening balance'), ('BUY', 'Buy'), ('SELL', 'Sell'), ('ADJUSTMENT', 'Adjustment')], max_length=10)),
+                ('cash_delta', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('quantity_delta', models.IntegerField(default=0)),
+                ('cost_delta', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('realized_pnl', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('stock', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='trading.stock')),
+                ('trade', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='trading.trade')),
+                ('user', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='ledger_entries', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'created_at', 'id'], name='ledger_user_time_idx'), django.contrib.postgres.indexes.BrinIndex(fields=['created_at'], name='ledger_created_brin')],
+            },
+        ),
+        migrations.CreateModel(
+            name='PortfolioSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('taken_at', models.DateTimeField()),
+                ('cash_balance', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('total_invested', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('realized_pnl', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('positions', models.JSONField(default=dict, encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ('user', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='portfolio_snapshots', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'taken_at'), name='unique_snapshot_per_user_time')],
+            },
+        ),
+        migrations.RunPython(journal_existing_portfolios, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 6.0.2 on 2026-10-18 23:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trading', '0015_ledger'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dailybar',
+            name='close_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -1,5 +1,9 @@
 from django.db import models
+from django.db.models import F, Q, Sum
+from django.core.serializers.json import DjangoJSONEncoder
 from django.conf import settings
+from django.utils import timezone
+from django.contrib.postgres.indexes import BrinIndex
 from decimal import Decimal
 from datetime import datetime, timedelta
 
@@ -15,6 +19,14 @@ class Stock(models.Model):
 class Portfolio(models.Model):
     user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     cash_balance = models.DecimalField(max_digits=12, decimal_places=2, default=100000.00)
+    # Maintained by trading.signals so history totals never need a COUNT(*)
+    total_trades = models.PositiveIntegerField(default=0)
+    # Maintained by trading.services.order_execution inside the order
+    # transaction, so summaries don't walk every holding
+    total_invested = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    holdings_count = models.PositiveIntegerField(default=0)
+    # Sum of RealizedGain.realized_pnl, moved by the same transactions
+    realized_pnl = models.DecimalField(max_digits=14, decimal_places=2, default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -28,20 +40,18 @@ class Portfolio(models.Model):
         return self.user.holdings.all()
     
     def get_total_stock_value(self):
-        """Calculate current value of all stocks owned"""
-        total = Decimal('0.00')
-        for holding in self.get_holdings():
-            # Current market value = quantity * current stock price
-            current_value = holding.quantity * holding.stock.current_price
-            total += current_value
-        return total
+        """Current market value of all stocks owned, summed by the database"""
+        value = Holding.objects.filter(user_id=self.user_id).aggregate(
+            value=Sum(
+                F('quantity') * F('stock__current_price'),
+                output_field=models.DecimalField(max_digits=14, decimal_places=2)
+            )
+        )['value']
+        return value if value is not None else Decimal('0.00')
     
     def get_total_invested(self):
-        """Calculate total money invested in stocks (buy price)"""
-        total = Decimal('0.00')
-        for holding in self.get_holdings():
-            total += holding.total_invested
-        return total
+        """Total money invested in stocks (buy price)"""
+        return self.total_invested
     
     def get_total_portfolio_value(self):
         """Total value = cash + current stock value"""
@@ -61,20 +71,27 @@ class Portfolio(models.Model):
     
     def get_portfolio_summary(self):
         """Get complete portfolio summary as dictionary"""
+        stock_value = self.get_total_stock_value()  # one aggregate, reused below
+        profit_loss = stock_value - self.total_invested
         return {
             'cash_balance': float(self.cash_balance),
-            'total_invested': float(self.get_total_invested()),
-            'total_stock_value': float(self.get_total_stock_value()),
-            'total_portfolio_value': float(self.get_total_portfolio_value()),
-            'total_profit_loss': float(self.get_total_profit_loss()),
-            'profit_loss_percentage': float(self.get_profit_loss_percentage()),
-            'holdings_count': self.get_holdings().count(),
+            'total_invested': float(self.total_invested),
+            'total_stock_value': float(stock_value),
+            'total_portfolio_value': float(self.cash_balance + stock_value),
+            'total_profit_loss': float(profit_loss),
+            'profit_loss_percentage': float(profit_loss / self.total_invested * 100) if self.total_invested else 0.0,
+            'holdings_count': self.holdings_count,
+            'realized_profit_loss': float(self.realized_pnl),
             'last_updated': self.updated_at.isoformat()
         }
         
 class Trade(models.Model):
     """
     Records every buy/sell transaction
+
+    Foreign keys to Trade are declared with db_constraint=False: once
+    partition_trades has run the primary key is (id, timestamp), so there
+    is no single-column key for a constraint to reference.
     """
     class OrderType(models.TextChoices):
         BUY = 'BUY', 'Buy'
@@ -135,6 +152,13 @@ class Trade(models.Model):
     )
     class Meta:
         ordering = ['-timestamp']  # Show newest first
+        indexes = [
+            # History / dashboard: a user's trades newest first; id breaks
+            # timestamp ties so keyset pagination walks the index exactly
+            models.Index(fields=['user', '-timestamp', '-id'], name='trade_user_ts_id_idx'),
+            # Per-holding summaries: a user's buys or sells of one stock
+            models.Index(fields=['user', 'stock', 'order_type'], name='trade_user_stock_type_idx'),
+        ]
         
 class Holding(models.Model):
     """
@@ -268,7 +292,7 @@ class Holding(models.Model):
         """Number of days since first purchase"""
         if not self.first_purchase_date:
             return 0
-        delta = datetime.now() - self.first_purchase_date
+        delta = timezone.now() - self.first_purchase_date
         return delta.days
     
     def get_annualized_return(self):
@@ -288,33 +312,18 @@ class Holding(models.Model):
         return annualized * 100
     
     def get_breakdown_by_purchase(self):
-        """
-        Get breakdown of different purchase lots
-        Requires separate Lot model - advanced feature
-        """
-        from .models import Trade
-        buy_trades = Trade.objects.filter(
-            user=self.user,
-            stock=self.stock,
-            order_type='BUY'
-        ).order_by('timestamp')
-        
-        lots = []
-        remaining_quantity = self.quantity
-        
-        for trade in buy_trades:
-            if remaining_quantity <= 0:
-                break
-            
-            # This is simplified - actual lot tracking needs FIFO logic
-            lots.append({
-                'date': trade.timestamp,
-                'quantity': trade.quantity,
-                'price': float(trade.price_per_share),
-                'total': float(trade.total_amount)
-            })
-        
-        return lots
+        """Open tax lots of this holding, oldest first (the order sells consume them)"""
+        lots = Lot.objects.filter(
+            user_id=self.user_id, stock_id=self.stock_id, remaining_quantity__gt=0
+        ).order_by('acquired_at', 'id')
+        return [lot.to_dict(self.stock.current_price) for lot in lots]
+    
+    def get_realized_profit_loss(self):
+        """Profit realised so far by selling this stock"""
+        realized = RealizedGain.objects.filter(user_id=self.user_id, stock_id=self.stock_id).aggregate(
+            total=Sum('realized_pnl')
+        )['total']
+        return realized if realized is not None else Decimal('0.00')
     
     def to_dict(self):
         """
@@ -356,4 +365,401 @@ class Holding(models.Model):
         """
         if total_portfolio_value == 0:
             return 0
-        return (self.get_current_value() / total_portfolio_value) * 100
\ No newline at end of file
+        return (self.get_current_value() / total_portfolio_value) * 100
+
+
+class Lot(models.Model):
+    """
+    Shares bought by one trade and not yet sold. Sells take shares from
+    the oldest open lots first (FIFO), inside the order transaction, so a
+    holding's total_invested is always the remaining_cost of its open lots.
+    Lots are kept once sold out (closed_at set) for the realised history.
+    """
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='lots'
+    )
+    stock = models.ForeignKey(
+        Stock,
+        on_delete=models.PROTECT,
+        related_name='lots'
+    )
+    # Null for positions opened before lots were tracked (see migration 0014)
+    buy_trade = models.ForeignKey(
+        Trade,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+',
+        db_constraint=False
+    )
+    quantity = models.PositiveIntegerField()
+    remaining_quantity = models.PositiveIntegerField()
+    price_per_share = models.DecimalField(max_digits=10, decimal_places=2)
+    # Cost of the shares still held; the last sell out of a lot takes all of it
+    remaining_cost = models.DecimalField(max_digits=12, decimal_places=2)
+    acquired_at = models.DateTimeField()
+    closed_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['acquired_at', 'id']
+        indexes = [
+            # A sell reads the open lots of one position, oldest first
+            models.Index(
+                fields=['user', 'stock', 'acquired_at', 'id'],
+                condition=Q(remaining_quantity__gt=0),
+                name='lot_open_fifo_idx',
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.stock.symbol} lot {self.remaining_quantity}/{self.quantity} @ Rs.{self.price_per_share}"
+    
+    def days_held(self, now=None):
+        return ((now or timezone.now()) - self.acquired_at).days
+    
+    def to_dict(self, current_price):
+        value = self.remaining_quantity * current_price
+        unrealized = value - self.remaining_cost
+        return_pct = unrealized / self.remaining_cost * 100 if self.remaining_cost else Decimal('0')
+        days = self.days_held()
+        annualized = None
+        if days > 0 and self.remaining_cost:
+            annualized = ((1 + float(unrealized / self.remaining_cost)) ** (365 / days) - 1) * 100
+        return {
+            'lot_id': self.id,
+            'trade_id': self.buy_trade_id,
+            'acquired_at': self.acquired_at.isoformat(),
+            'quantity': self.quantity,
+            'remaining_quantity': self.remaining_quantity,
+            'price': float(self.price_per_share),
+            'cost': float(self.remaining_cost),
+            'current_value': float(value),
+            'unrealized_profit_loss': float(unrealized),
+            'return_percentage': round(float(return_pct), 2),
+            'days_held': days,
+            'annualized_return': round(annualized, 2) if annualized is not None else None,
+        }
+
+
+class RealizedGain(models.Model):
+    """
+    Append-only record of what a sell realised: one row per lot it drew
+    shares from, with that lot's cost and holding period.
+    """
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='realized_gains'
+    )
+    stock = models.ForeignKey(
+        Stock,
+        on_delete=models.PROTECT,
+        related_name='realized_gains'
+    )
+    sell_trade = models.ForeignKey(
+        Trade,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+',
+        db_constraint=False
+    )
+    lot = models.ForeignKey(
+        Lot,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='sales'
+    )
+    quantity = models.PositiveIntegerField()
+    cost_basis = models.DecimalField(max_digits=12, decimal_places=2)
+    proceeds = models.DecimalField(max_digits=12, decimal_places=2)
+    realized_pnl = models.DecimalField(max_digits=12, decimal_places=2)
+    acquired_at = models.DateTimeField()
+    sold_at = models.DateTimeField()
+    
+    class Meta:
+        ordering = ['sold_at', 'id']
+        indexes = [
+            # Export, oldest first; per-stock totals use the (user, stock) prefix below
+            models.Index(fields=['user', 'sold_at', 'id'], name='gain_user_sold_idx'),
+            models.Index(fields=['user', 'stock'], name='gain_user_stock_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.quantity} {self.stock.symbol} sold {self.sold_at:%Y-%m-%d}: Rs.{self.realized_pnl}"
+    
+    @property
+    def holding_days(self):
+        return (self.sold_at - self.acquired_at).days
+
+
+class LedgerEntry(models.Model):
+    """
+    Append-only journal of every change to a portfolio's cash and
+    positions, written in the same transaction as the change. Replaying a
+    user's entries in order rebuilds their portfolio at any moment;
+    PortfolioSnapshot keeps that replay short. Rows are never updated.
+    """
+    class Kind(models.TextChoices):
+        OPENING = 'OPENING', 'Opening balance'
+        BUY = 'BUY', 'Buy'
+        SELL = 'SELL', 'Sell'
+        ADJUSTMENT = 'ADJUSTMENT', 'Adjustment'
+    
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='ledger_entries',
+        db_index=False
+    )
+    kind = models.CharField(max_length=10, choices=Kind.choices)
+    stock = models.ForeignKey(
+        Stock,
+        on_delete=models.PROTECT,
+        null=True,
+        blank=True,
+        related_name='+'
+    )
+    trade = models.ForeignKey(
+        Trade,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+',
+        db_constraint=False
+    )
+    cash_delta = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    quantity_delta = models.IntegerField(default=0)
+    # Change to the position's cost (FIFO lots) and to realised profit
+    cost_delta = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    realized_pnl = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    created_at = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        indexes = [
+            # Replay of one user's entries after a snapshot
+            models.Index(fields=['user', 'created_at', 'id'], name='ledger_user_time_idx'),
+            # Snapshot runs: who had entries since the last run
+            BrinIndex(fields=['created_at'], name='ledger_created_brin'),
+        ]
+    
+    def __str__(self):
+        return f"{self.kind} user {self.user_id}: cash {self.cash_delta:+}, shares {self.quantity_delta:+}"
+
+
+class PortfolioSnapshot(models.Model):
+    """
+    A user's portfolio as the ledger left it at taken_at. positions is
+    {stock_id: [quantity, cost]}, cost as a decimal string.
+    """
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='portfolio_snapshots',
+        db_index=False
+    )
+    taken_at = models.DateTimeField()
+    cash_balance = models.DecimalField(max_digits=14, decimal_places=2)
+    total_invested = models.DecimalField(max_digits=14, decimal_places=2)
+    realized_pnl = models.DecimalField(max_digits=14, decimal_places=2)
+    positions = models.JSONField(default=dict, encoder=DjangoJSONEncoder)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'taken_at'], name='unique_snapshot_per_user_time'),
+        ]
+    
+    def __str__(self):
+        return f"user {self.user_id} @ {self.taken_at}: Rs.{self.cash_balance} cash, {len(self.positions)} positions"
+
+
+class PriceTick(models.Model):
+    """
+    Append-only price history: one row per observed price change.
+    Rows arrive in time order, so a BRIN index on timestamp stays tiny and
+    serves market-wide range scans; per-stock charts use (stock, timestamp).
+    Here and throughout this module, a foreign key that leads a composite
+    constraint or index is declared with db_index=False: that index already
+    serves lookups on the key alone.
+    """
+    stock = models.ForeignKey(
+        Stock,
+        on_delete=models.CASCADE,
+        related_name='ticks',
+        db_index=False
+    )
+    timestamp = models.DateTimeField()
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+    volume = models.BigIntegerField(default=0)  # session volume so far
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['stock', 'timestamp'], name='unique_tick_per_stock_time'),
+        ]
+        indexes = [
+            BrinIndex(fields=['timestamp'], name='pricetick_timestamp_brin'),
+        ]
+    
+    def __str__(self):
+        return f"{self.stock.symbol} @ {self.timestamp}: Rs.{self.price}"
+
+
+class DailyBar(models.Model):
+    """One OHLCV bar per stock per trading day, rolled up from PriceTick"""
+    stock = models.ForeignKey(
+        Stock,
+        on_delete=models.CASCADE,
+        related_name='daily_bars',
+        db_index=False
+    )
+    date = models.DateField()
+    open = models.DecimalField(max_digits=10, decimal_places=2)
+    high = models.DecimalField(max_digits=10, decimal_places=2)
+    low = models.DecimalField(max_digits=10, decimal_places=2)
+    close = models.DecimalField(max_digits=10, decimal_places=2)
+    close_at = models.DateTimeField(null=True, blank=True)  # time of the tick the close came from
+    volume = models.BigIntegerField(default=0)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['stock', 'date'], name='unique_bar_per_stock_day'),
+        ]
+        indexes = [
+            BrinIndex(fields=['date'], name='dailybar_date_brin'),
+        ]
+    
+    def __str__(self):
+        return f"{self.stock.symbol} {self.date}: O{self.open} H{self.high} L{self.low} C{self.close}"
+
+
+class Order(models.Model):
+    """
+    A resting order that executes when the market price crosses its trigger.
+    LIMIT buys fill at or below limit_price, sells at or above it. STOP
+    orders become market orders once the price reaches stop_price (buys
+    rising through it, sells falling through it). STOP_LIMIT orders turn
+    into a LIMIT order at limit_price when their stop is reached.
+    MARKET orders placed while the market is closed wait as PENDING and
+    are filled in one batch at the open.
+    """
+    class OrderType(models.TextChoices):
+        MARKET = 'MARKET', 'Market'
+        LIMIT = 'LIMIT', 'Limit'
+        STOP = 'STOP', 'Stop'
+        STOP_LIMIT = 'STOP_LIMIT', 'Stop limit'
+    
+    class Status(models.TextChoices):
+        PENDING = 'PENDING', 'Pending'  # market order waiting for the open
+        OPEN = 'OPEN', 'Open'
+        TRIGGERED = 'TRIGGERED', 'Triggered'  # stop reached, resting as a limit
+        FILLED = 'FILLED', 'Filled'
+        CANCELLED = 'CANCELLED', 'Cancelled'
+        REJECTED = 'REJECTED', 'Rejected'
+    
+    # Resting in the trigger book
+    ACTIVE = (Status.OPEN, Status.TRIGGERED)
+    CANCELLABLE = (Status.PENDING, Status.OPEN, Status.TRIGGERED)
+    
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='orders'
+    )
+    stock = models.ForeignKey(
+        Stock,
+        on_delete=models.PROTECT,
+        related_name='orders'
+    )
+    side = models.CharField(max_length=4, choices=Trade.OrderType.choices)
+    order_type = models.CharField(max_length=10, choices=OrderType.choices)
+    quantity = models.PositiveIntegerField()
+    limit_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    stop_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.OPEN)
+    
+    # Set once the order is done
+    trade = models.ForeignKey(
+        Trade,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+',
+        db_constraint=False
+    )
+    fill_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    reject_reason = models.CharField(max_length=200, blank=True)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    triggered_at = models.DateTimeField(null=True, blank=True)
+    filled_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            # The order list of a user
+            models.Index(fields=['user', '-created_at'], name='order_user_created_idx'),
+            # Trigger book: a full load of active orders, then changes since the last sync
+            models.Index(fields=['status'], name='order_status_idx'),
+            models.Index(fields=['updated_at'], name='order_updated_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.order_type} {self.side} {self.quantity} {self.stock.symbol} ({self.status})"
+    
+    @property
+    def is_active(self):
+        return self.status in self.ACTIVE
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'symbol': self.stock.symbol,
+            'side': self.side,
+            'order_type': self.order_type,
+            'quantity': self.quantity,
+            'limit_price': float(self.limit_price) if self.limit_price is not None else None,
+            'stop_price': float(self.stop_price) if self.stop_price is not None else None,
+            'status': self.status,
+            'fill_price': float(self.fill_price) if self.fill_price is not None else None,
+            'trade_id': self.trade_id,
+            'reject_reason': self.reject_reason,
+            'created_at': self.created_at.isoformat(),
+            'triggered_at': self.triggered_at.isoformat() if self.triggered_at else None,
+            'filled_at': self.filled_at.isoformat() if self.filled_at else None,
+        }
+
+
+class IdempotencyKey(models.Model):
+    """
+    First response to a POST sent with an Idempotency-Key header, so a
+    retried request gets that response back instead of running again.
+    status_code stays null while the first request is still running.
+    """
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='idempotency_keys',
+        db_index=False
+    )
+    key = models.CharField(max_length=255)
+    endpoint = models.CharField(max_length=200)
+    request_hash = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    response_body = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='unique_idempotency_key_per_user'),
+        ]
+        indexes = [
+            BrinIndex(fields=['created_at'], name='idempotency_created_brin'),
+        ]
+    
+    def __str__(self):
+        return f"{self.key} {self.endpoint} ({self.status_code or 'in flight'})"
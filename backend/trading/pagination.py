@@ -0,0 +1,85 @@
+import json
+import base64
+import binascii
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+# Page size bounds for cursor-paginated lists
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+NEXT = 'next'
+PREV = 'prev'
+
+
+class PaginationError(ValueError):
+    pass
+
+
+def page_size(value, default=DEFAULT_PAGE_SIZE):
+    """?limit= clamped to 1..MAX_PAGE_SIZE"""
+    try:
+        size = int(value) if value not in (None, '') else default
+    except (TypeError, ValueError):
+        raise PaginationError("limit must be a number")
+    return max(1, min(size, MAX_PAGE_SIZE))
+
+
+def encode_cursor(obj, direction):
+    """Opaque token for the (timestamp, id) position of obj"""
+    payload = json.dumps([obj.timestamp.isoformat(), obj.id, direction], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """token -> (timestamp, id, direction)"""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        timestamp, pk, direction = json.loads(base64.urlsafe_b64decode(padded))
+        timestamp = parse_datetime(timestamp)
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError):
+        raise PaginationError("Invalid cursor")
+    if timestamp is None or not isinstance(pk, int) or direction not in (NEXT, PREV):
+        raise PaginationError("Invalid cursor")
+    return timestamp, pk, direction
+
+
+def paginate_newest_first(queryset, cursor=None, limit=DEFAULT_PAGE_SIZE):
+    """
+    Keyset pagination over (timestamp, id), newest first.
+    Each page is a range read that starts right after the cursor row, so
+    its cost doesn't grow with how deep into the history it is - unlike
+    OFFSET, which reads and discards every earlier row.
+    Returns (items, next_cursor, prev_cursor); cursors are None at the ends.
+    """
+    direction = NEXT
+    if cursor:
+        timestamp, pk, direction = decode_cursor(cursor)
+        if direction == NEXT:
+            queryset = queryset.filter(Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, id__lt=pk))
+        else:
+            queryset = queryset.filter(Q(timestamp__gt=timestamp) | Q(timestamp=timestamp, id__gt=pk))
+
+    if direction == NEXT:
+        queryset = queryset.order_by('-timestamp', '-id')
+    else:
+        queryset = queryset.order_by('timestamp', 'id')
+
+    # One extra row tells us whether there is another page
+    items = list(queryset[:limit + 1])
+    more = len(items) > limit
+    items = items[:limit]
+
+    if direction == NEXT:
+        has_next, has_prev = more, bool(cursor)
+    else:
+        items.reverse()
+        has_next, has_prev = True, more
+
+    if not items:
+        return items, None, None
+    return (
+        items,
+        encode_cursor(items[-1], NEXT) if has_next else None,
+        encode_cursor(items[0], PREV) if has_prev else None,
+    )
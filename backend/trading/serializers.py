@@ -67,20 +67,15 @@ class PortfolioSerializer(serializers.ModelSerializer):
     
     def get_total_value(self, obj):
         """Calculate total portfolio value (cash + stocks)"""
-        holdings = Holding.objects.filter(user=obj.user)
-        stock_value = sum(h.quantity * h.stock.current_price for h in holdings)
-        return float(obj.cash_balance + stock_value)
+        return float(obj.cash_balance + obj.get_total_stock_value())
     
     def get_total_profit_loss(self, obj):
         """Calculate total profit/loss"""
-        holdings = Holding.objects.filter(user=obj.user)
-        total_invested = sum(h.total_invested for h in holdings)
-        total_current = sum(h.quantity * h.stock.current_price for h in holdings)
-        return float(total_current - total_invested)
+        return float(obj.get_total_stock_value() - obj.total_invested)
     
     def get_holdings_count(self, obj):
         """Get number of unique holdings"""
-        return Holding.objects.filter(user=obj.user).count()
+        return obj.holdings_count
     
     def get_holdings(self, obj):
         """Get all holdings with details"""
@@ -99,15 +94,10 @@ class PortfolioSummarySerializer(serializers.ModelSerializer):
         ]
     
     def get_total_value(self, obj):
-        holdings = Holding.objects.filter(user=obj.user)
-        stock_value = sum(h.quantity * h.stock.current_price for h in holdings)
-        return obj.cash_balance + stock_value
+        return obj.cash_balance + obj.get_total_stock_value()
     
     def get_total_profit_loss(self, obj):
-        holdings = Holding.objects.filter(user=obj.user)
-        total_invested = sum(h.total_invested for h in holdings)
-        total_current = sum(h.quantity * h.stock.current_price for h in holdings)
-        return total_current - total_invested
+        return obj.get_total_stock_value() - obj.total_invested
     
     def get_holdings_count(self, obj):
-        return Holding.objects.filter(user=obj.user).count()
\ No newline at end of file
+        return obj.holdings_count
\ No newline at end of file
@@ -0,0 +1,122 @@
+import logging
+from datetime import timedelta
+from decimal import Decimal
+from django.db.models import Max
+from django.utils import timezone
+from trading.models import LedgerEntry, PortfolioSnapshot, Trade
+
+logger = logging.getLogger(__name__)
+
+# Entries are stamped when their transaction runs but only show up at commit;
+# snapshots stop this far back so no entry before taken_at is still in flight
+SETTLE_TIME = timedelta(minutes=1)
+
+# Users snapshotted per bulk INSERT
+SNAPSHOT_BATCH = 500
+
+ENTRY_FIELDS = ('cash_delta', 'stock_id', 'quantity_delta', 'cost_delta', 'realized_pnl')
+
+
+def trade_entry(trade, now, basis=None, realized_pnl=Decimal('0.00')):
+    """
+    Unsaved LedgerEntry for a trade. A buy adds its cost to the position;
+    a sell takes off basis, the cost of the lots it drew from.
+    """
+    buy = trade.order_type == Trade.OrderType.BUY
+    return LedgerEntry(
+        user_id=trade.user_id,
+        kind=LedgerEntry.Kind.BUY if buy else LedgerEntry.Kind.SELL,
+        stock_id=trade.stock_id,
+        trade=trade,
+        cash_delta=-trade.total_amount if buy else trade.total_amount,
+        quantity_delta=trade.quantity if buy else -trade.quantity,
+        cost_delta=trade.total_amount if buy else -basis,
+        realized_pnl=realized_pnl,
+        created_at=now,
+    )
+
+
+class PortfolioState:
+    """A portfolio rebuilt from the ledger; positions is {stock_id: [quantity, cost]}"""
+
+    def __init__(self, cash_balance=Decimal('0.00'), total_invested=Decimal('0.00'),
+                 realized_pnl=Decimal('0.00'), positions=None, snapshot_taken_at=None):
+        self.cash_balance = cash_balance
+        self.total_invested = total_invested
+        self.realized_pnl = realized_pnl
+        self.positions = positions or {}
+        self.snapshot_taken_at = snapshot_taken_at
+        self.replayed = 0
+
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        return cls(
+            snapshot.cash_balance,
+            snapshot.total_invested,
+            snapshot.realized_pnl,
+            {int(stock_id): [quantity, Decimal(cost)] for stock_id, (quantity, cost) in snapshot.positions.items()},
+            snapshot.taken_at,
+        )
+
+    def apply(self, cash_delta, stock_id, quantity_delta, cost_delta, realized_pnl):
+        self.cash_balance += cash_delta
+        self.total_invested += cost_delta
+        self.realized_pnl += realized_pnl
+        if stock_id is not None:
+            position = self.positions.setdefault(stock_id, [0, Decimal('0.00')])
+            position[0] += quantity_delta
+            position[1] += cost_delta
+            if not position[0]:
+                del self.positions[stock_id]
+        self.replayed += 1
+
+    def to_snapshot(self, user_id, taken_at):
+        return PortfolioSnapshot(
+            user_id=user_id,
+            taken_at=taken_at,
+            cash_balance=self.cash_balance,
+            total_invested=self.total_invested,
+            realized_pnl=self.realized_pnl,
+            positions={str(stock_id): [quantity, str(cost)] for stock_id, (quantity, cost) in self.positions.items()},
+        )
+
+
+def portfolio_at(user_id, when):
+    """
+    The user's portfolio as of when: the latest snapshot taken at or before
+    it, plus the ledger entries between the two. One indexed lookup and one
+    range scan, however long the history.
+    """
+    snapshot = PortfolioSnapshot.objects.filter(user_id=user_id, taken_at__lte=when).order_by('-taken_at').first()
+    state = PortfolioState.from_snapshot(snapshot) if snapshot else PortfolioState()
+
+    entries = LedgerEntry.objects.filter(user_id=user_id, created_at__lte=when)
+    if snapshot:
+        entries = entries.filter(created_at__gt=snapshot.taken_at)
+    for row in entries.order_by('created_at', 'id').values_list(*ENTRY_FIELDS).iterator():
+        state.apply(*row)
+    return state
+
+
+def take_snapshots(as_of=None):
+    """
+    Snapshot every user whose ledger moved since the last run, as of
+    as_of (default SETTLE_TIME ago). Each snapshot is built from the
+    user's previous one, so a run only reads the entries since then.
+    Returns the number of snapshots written.
+    """
+    as_of = as_of or timezone.now() - SETTLE_TIME
+    since = PortfolioSnapshot.objects.aggregate(last=Max('taken_at'))['last']
+    moved = LedgerEntry.objects.filter(created_at__lte=as_of)
+    if since:
+        moved = moved.filter(created_at__gt=since)
+    user_ids = sorted(set(moved.values_list('user_id', flat=True)))
+
+    written = 0
+    for i in range(0, len(user_ids), SNAPSHOT_BATCH):
+        batch = [portfolio_at(user_id, as_of).to_snapshot(user_id, as_of) for user_id in user_ids[i:i + SNAPSHOT_BATCH]]
+        PortfolioSnapshot.objects.bulk_create(batch, ignore_conflicts=True)
+        written += len(batch)
+
+    logger.info(f"Portfolio snapshots as of {as_of.isoformat()}: {written} users")
+    return written
@@ -0,0 +1,129 @@
+import logging
+from decimal import Decimal
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from trading.models import Order, Portfolio, Trade
+from trading.services.order_execution import apply_fill, Positions
+
+logger = logging.getLogger(__name__)
+
+BUY = Trade.OrderType.BUY
+
+
+def _money(value):
+    return Decimal(str(value)).quantize(Decimal('0.01'))
+
+
+def queue_market_order(user, stock, side, quantity):
+    """Store a market order placed while the market is closed; it fills at the open"""
+    return Order.objects.create(
+        user=user,
+        stock=stock,
+        side=side,
+        order_type=Order.OrderType.MARKET,
+        quantity=quantity,
+        status=Order.Status.PENDING,
+    )
+
+
+def execute_pending_orders(prices, price_source='nepse_api_live'):
+    """
+    Fill every PENDING market order at prices (symbol -> price) in one
+    transaction. The orders, their portfolios, and the holdings and lots
+    involved are each locked with one query (portfolios before holdings
+    before lots, in user order, as on every other order path). Cash and shares are then worked
+    through in memory per user, in the order the orders were placed, so
+    an earlier order can fund or use up a later one. Results go back with
+    bulk inserts and updates instead of one round trip per order.
+    Returns {'filled': n, 'rejected': n}.
+    """
+    now = timezone.now()
+    result = {'filled': 0, 'rejected': 0}
+
+    with transaction.atomic():
+        orders = list(
+            Order.objects.select_for_update(of=('self',)).select_related('stock')
+            .filter(status=Order.Status.PENDING).order_by('user_id', 'id')
+        )
+        if not orders:
+            return result
+
+        user_ids = sorted({order.user_id for order in orders})
+        portfolios = {
+            portfolio.user_id: portfolio
+            for portfolio in Portfolio.objects.select_for_update().filter(user_id__in=user_ids).order_by('user_id')
+        }
+        positions = Positions.lock(user_ids, {order.stock_id for order in orders})
+
+        fills = []  # (order, trade)
+        touched = set()
+        for order in orders:
+            order.updated_at = now
+            price = prices.get(order.stock.symbol)
+            portfolio = portfolios[order.user_id]
+            reason = _check(order, price, portfolio, positions)
+            if reason:
+                order.status = Order.Status.REJECTED
+                order.reject_reason = reason
+                result['rejected'] += 1
+                continue
+
+            trade = apply_fill(portfolio, positions, order.stock_id, order.side, order.quantity, price, price_source, now)
+            fills.append((order, trade))
+            touched.add(order.user_id)
+            order.status = Order.Status.FILLED
+            order.fill_price = trade.price_per_share
+            order.filled_at = now
+            result['filled'] += 1
+
+        # Trades are bulk inserted, so the post_save trade counter doesn't run
+        Trade.objects.bulk_create([trade for _, trade in fills])
+        for order, trade in fills:
+            order.trade = trade
+            portfolios[order.user_id].total_trades += 1
+
+        changed = [portfolios[user_id] for user_id in sorted(touched)]
+        for portfolio in changed:
+            portfolio.updated_at = now
+        Portfolio.objects.bulk_update(
+            changed, ['cash_balance', 'total_invested', 'holdings_count', 'realized_pnl', 'total_trades', 'updated_at']
+        )
+        positions.save(now)
+
+        Order.objects.bulk_update(orders, ['status', 'trade', 'fill_price', 'reject_reason', 'filled_at', 'updated_at'])
+
+    logger.info(f"Opening batch: {result['filled']} orders filled, {result['rejected']} rejected "
+                f"for {len(user_ids)} users")
+    return result
+
+
+def _check(order, price, portfolio, positions):
+    """Reason the order can't fill against the in-memory position, or None"""
+    if not price:
+        return f"No opening price for {order.stock.symbol}"
+    if order.side == BUY:
+        amount = _money(price) * order.quantity
+        if portfolio.cash_balance < amount:
+            return f"Insufficient balance: required {amount}, available {portfolio.cash_balance}"
+        return None
+    held = positions.held(order.user_id, order.stock_id)
+    if held < order.quantity:
+        return f"Insufficient shares. You own {held} shares"
+    return None
+
+
+def execute_pending_at_open(snapshot, previous=None):
+    """
+    Feed listener: on the first live snapshot after the open, fill the
+    orders queued while the market was closed. Later polls find no
+    PENDING rows and stop at one indexed EXISTS query.
+    """
+    if snapshot.source != 'live':
+        return None
+    market_status = cache.get('nepse_market_status')
+    if not (market_status and market_status['is_open']):
+        return None
+    if not Order.objects.filter(status=Order.Status.PENDING).exists():
+        return None
+    return execute_pending_orders({symbol: quote['price'] for symbol, quote in snapshot.quotes.items()})
@@ -0,0 +1,283 @@
+import bisect
+import logging
+import threading
+from collections import namedtuple
+from datetime import timedelta
+from decimal import Decimal
+from django.db import transaction
+from django.utils import timezone
+from trading.models import Order, Trade
+from trading.services.order_execution import execute_buy, execute_sell, OrderRejected
+
+logger = logging.getLogger(__name__)
+
+BUY = Trade.OrderType.BUY
+
+# Orders changed this long before the last sync are read again, so rows that
+# committed after their updated_at was taken aren't missed. Re-adding is harmless.
+SYNC_OVERLAP = timedelta(seconds=30)
+
+# What the book keeps per order; quantity and owner are read at execution
+BookEntry = namedtuple('BookEntry', ['order_id', 'symbol', 'side', 'order_type', 'limit_price', 'stop_price', 'triggered'])
+
+
+def _price(value):
+    return Decimal(str(value)).quantize(Decimal('0.01'))
+
+
+def placement(entry):
+    """
+    (ladder, trigger) an order rests on. 'falling' orders fire once the
+    price drops to their trigger or below, 'rising' ones once it reaches
+    their trigger or above.
+    """
+    buy = entry.side == BUY
+    if entry.order_type == Order.OrderType.LIMIT or entry.triggered:
+        return ('falling' if buy else 'rising'), entry.limit_price
+    # STOP, and STOP_LIMIT before its stop is reached
+    return ('rising' if buy else 'falling'), entry.stop_price
+
+
+class _Ladder:
+    """Order ids of one symbol and direction, sorted by trigger price, then arrival"""
+
+    __slots__ = ('triggers', 'ids')
+
+    def __init__(self):
+        self.triggers = []
+        self.ids = []
+
+    def __len__(self):
+        return len(self.ids)
+
+    def insert(self, trigger, order_id):
+        i = bisect.bisect_right(self.triggers, trigger)
+        self.triggers.insert(i, trigger)
+        self.ids.insert(i, order_id)
+
+    def remove(self, trigger, order_id):
+        i = bisect.bisect_left(self.triggers, trigger)
+        while i < len(self.ids) and self.triggers[i] == trigger:
+            if self.ids[i] == order_id:
+                del self.triggers[i], self.ids[i]
+                return
+            i += 1
+
+    def pop_at_or_above(self, price):
+        """Remove and return the ids with trigger >= price"""
+        i = bisect.bisect_left(self.triggers, price)
+        crossed = self.ids[i:]
+        del self.triggers[i:], self.ids[i:]
+        return crossed
+
+    def pop_at_or_below(self, price):
+        """Remove and return the ids with trigger <= price"""
+        i = bisect.bisect_right(self.triggers, price)
+        crossed = self.ids[:i]
+        del self.triggers[:i], self.ids[:i]
+        return crossed
+
+
+class TriggerBook:
+    """
+    Active orders per symbol, kept in two ladders sorted by trigger price.
+    A new price for a symbol is matched with one binary search per ladder:
+    everything past the cut has crossed and is popped, nothing else is
+    looked at. The book lives in the feed process and follows the Order
+    table through sync(); the table stays the source of truth.
+    """
+
+    def __init__(self):
+        self.entries = {}
+        self.ladders = {}
+        self.last_prices = {}
+        self.synced_at = None
+        self.lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add(self, entry):
+        """Insert entry, replacing the same order if already in the book"""
+        self.discard(entry.order_id)
+        ladder, trigger = placement(entry)
+        if entry.symbol not in self.ladders:
+            self.ladders[entry.symbol] = {'falling': _Ladder(), 'rising': _Ladder()}
+        self.ladders[entry.symbol][ladder].insert(trigger, entry.order_id)
+        self.entries[entry.order_id] = entry
+
+    def discard(self, order_id):
+        entry = self.entries.pop(order_id, None)
+        if entry is not None:
+            ladder, trigger = placement(entry)
+            self.ladders[entry.symbol][ladder].remove(trigger, order_id)
+
+    def reset(self):
+        """Forget everything; the next sync reloads the active orders"""
+        self.entries.clear()
+        self.ladders.clear()
+        self.synced_at = None
+
+    def match(self, symbol, price):
+        """
+        Pop the orders of symbol that the price crosses.
+        Returns (fills, triggered): entries to execute at price, and
+        stop-limits whose stop was reached and now rest on their limit.
+        """
+        self.last_prices[symbol] = price
+        ladders = self.ladders.get(symbol)
+        if ladders is None:
+            return [], []
+
+        fills, triggered = [], {}
+        # A stop-limit reached on the first pass may already cross its limit
+        for _ in range(2):
+            crossed = ladders['falling'].pop_at_or_above(price) + ladders['rising'].pop_at_or_below(price)
+            if not crossed:
+                break
+            for order_id in crossed:
+                entry = self.entries.pop(order_id)
+                if entry.order_type == Order.OrderType.STOP_LIMIT and not entry.triggered:
+                    entry = entry._replace(triggered=True)
+                    self.add(entry)
+                    triggered[order_id] = entry
+                else:
+                    triggered.pop(order_id, None)
+                    fills.append(entry)
+        return fills, list(triggered.values())
+
+    def sync(self):
+        """
+        Bring the book in line with the Order table: a full load the first
+        time, then only the orders changed since the previous sync.
+        Returns the symbols that gained orders.
+        """
+        started = timezone.now()
+        orders = Order.objects.all()
+        if self.synced_at is None:
+            orders = orders.filter(status__in=Order.ACTIVE)
+        else:
+            orders = orders.filter(updated_at__gte=self.synced_at - SYNC_OVERLAP)
+
+        added = set()
+        rows = orders.values_list('id', 'stock__symbol', 'side', 'order_type', 'limit_price',
+                                  'stop_price', 'status', 'stock__current_price')
+        for order_id, symbol, side, order_type, limit_price, stop_price, status, current_price in rows:
+            if status not in Order.ACTIVE:
+                self.discard(order_id)
+                continue
+            entry = BookEntry(order_id, symbol, side, order_type, limit_price, stop_price,
+                              status == Order.Status.TRIGGERED)
+            if self.entries.get(order_id) != entry:
+                self.add(entry)
+                added.add(symbol)
+            self.last_prices.setdefault(symbol, current_price)
+
+        self.synced_at = started
+        return added
+
+
+_book = None
+_book_lock = threading.Lock()
+
+
+def get_trigger_book():
+    """Process-wide trigger book, loaded on first use"""
+    global _book
+    if _book is None:
+        with _book_lock:
+            if _book is None:
+                _book = TriggerBook()
+    return _book
+
+
+def execute_crossed(fills, triggered):
+    """
+    Execute one tick's crossed orders in a single transaction.
+    fills is a list of (entry, price). Orders are locked and re-checked,
+    so one cancelled in the meantime is skipped; each execution runs in
+    its own savepoint, so an order short of cash or shares is marked
+    REJECTED without undoing the rest. Returns the number filled.
+    """
+    now = timezone.now()
+    ids = [entry.order_id for entry, _ in fills] + [entry.order_id for entry in triggered]
+
+    with transaction.atomic():
+        orders = (
+            Order.objects.select_for_update(of=('self',))
+            .select_related('user', 'stock')
+            .filter(pk__in=ids, status__in=Order.ACTIVE)
+            .in_bulk()
+        )
+        changed = []
+
+        for entry in triggered:
+            order = orders.get(entry.order_id)
+            if order is not None and order.status == Order.Status.OPEN:
+                order.status = Order.Status.TRIGGERED
+                order.triggered_at = order.updated_at = now
+                changed.append(order)
+
+        # Portfolios are locked in user order, the same way on every tick
+        fills = sorted(
+            ((orders[entry.order_id], entry, price) for entry, price in fills if entry.order_id in orders),
+            key=lambda fill: (fill[0].user_id, fill[0].id)
+        )
+        filled = 0
+        for order, entry, price in fills:
+            if entry.triggered and order.triggered_at is None:
+                order.triggered_at = now
+            execute = execute_buy if order.side == BUY else execute_sell
+            try:
+                execution = execute(order.user, order.stock, order.quantity, price, 'nepse_api_live')
+            except OrderRejected as e:
+                order.status = Order.Status.REJECTED
+                order.reject_reason = e.message[:200]
+            else:
+                order.status = Order.Status.FILLED
+                order.trade = execution.trade
+                order.fill_price = execution.trade.price_per_share
+                order.filled_at = now
+                filled += 1
+            order.updated_at = now
+            changed.append(order)
+
+        Order.objects.bulk_update(changed, [
+            'status', 'trade', 'fill_price', 'reject_reason', 'triggered_at', 'filled_at', 'updated_at'
+        ])
+    return filled
+
+
+def execute_triggered_orders(diff):
+    """
+    Diff consumer: match every moved price against the trigger book and
+    execute what crossed. Orders placed since the last tick are also
+    matched against their symbol's last known price, so one that was
+    marketable when placed doesn't wait for the next move.
+    """
+    book = get_trigger_book()
+    with book.lock:
+        added = book.sync()
+        prices = {d.symbol: _price(d.new_price) for d in diff.changes if d.new_price}
+        for symbol in added:
+            if symbol not in prices and book.last_prices.get(symbol):
+                prices[symbol] = book.last_prices[symbol]
+
+        fills, triggered = [], []
+        for symbol, price in prices.items():
+            crossed, reached = book.match(symbol, price)
+            fills.extend((entry, price) for entry in crossed)
+            triggered.extend(reached)
+
+        if not fills and not triggered:
+            return 0
+        try:
+            filled = execute_crossed(fills, triggered)
+        except Exception:
+            # Nothing was written; reload so the popped orders come back
+            book.reset()
+            raise
+
+    logger.info(f"Diff #{diff.seq}: {filled} of {len(fills)} crossed orders filled, "
+                f"{len(triggered)} stop-limits triggered, {len(book)} resting")
+    return filled
@@ -0,0 +1,441 @@
+from collections import namedtuple, defaultdict
+from decimal import Decimal
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from trading.models import Portfolio, Holding, LedgerEntry, Lot, RealizedGain, Trade
+from trading.services.ledger import trade_entry
+
+# What an executed order changed; portfolio and holding are re-read after the
+# update (holding is None once a sell closes the position). gains are the
+# RealizedGain rows of a sell, one per lot it drew from.
+Execution = namedtuple('Execution', ['trade', 'portfolio', 'holding', 'is_new_holding', 'gains'])
+
+# One order of a basket; price is already known
+Leg = namedtuple('Leg', ['stock', 'side', 'quantity', 'price', 'price_source'])
+
+
+class OrderRejected(Exception):
+    """A guard failed inside the order transaction; nothing was written"""
+
+    def __init__(self, message, **details):
+        super().__init__(message)
+        self.message = message
+        self.details = details
+
+    def to_response(self):
+        return {"error": self.message, **self.details}
+
+
+def _money(value):
+    return Decimal(str(value)).quantize(Decimal('0.01'))
+
+
+def lock_portfolio(user):
+    """
+    Lock the user's portfolio row for the rest of the transaction.
+    Every order path takes this lock first and only then touches holdings,
+    so two orders of the same user queue up instead of deadlocking, and
+    orders of different users never wait on each other.
+    """
+    return Portfolio.objects.select_for_update().get(user=user)
+
+
+def lock_holding(user, stock):
+    return Holding.objects.select_for_update().filter(user=user, stock=stock).first()
+
+
+def lock_lots(user, stock):
+    """Open lots of one position, oldest first, locked after the holding"""
+    return list(
+        Lot.objects.select_for_update()
+        .filter(user=user, stock=stock, remaining_quantity__gt=0)
+        .order_by('acquired_at', 'id')
+    )
+
+
+def take_from_lots(holding, lots, quantity, price, now):
+    """
+    Sell quantity shares of holding out of its open lots, oldest first,
+    updating the lots in memory. Returns (basis, gains): the cost of the
+    shares sold and one unsaved RealizedGain per lot drawn from; the
+    caller sets their sell_trade. Closing the position takes the whole
+    total_invested, so the portfolio totals stay exact even if the lots
+    and the holding ever disagree; shares no lot covers are costed at
+    the average price.
+    """
+    price = _money(price)
+    basis = Decimal('0.00')
+    gains = []
+    left = quantity
+    for lot in lots:
+        if not left:
+            break
+        take = min(left, lot.remaining_quantity)
+        if not take:
+            continue
+        # The last shares of a lot take what's left of its cost
+        cost = lot.remaining_cost if take == lot.remaining_quantity else lot.price_per_share * take
+        lot.remaining_quantity -= take
+        lot.remaining_cost -= cost
+        if not lot.remaining_quantity:
+            lot.closed_at = now
+        left -= take
+        basis += cost
+        gains.append(RealizedGain(
+            user_id=lot.user_id,
+            stock_id=lot.stock_id,
+            lot=lot,
+            quantity=take,
+            cost_basis=cost,
+            proceeds=price * take,
+            realized_pnl=price * take - cost,
+            acquired_at=lot.acquired_at,
+            sold_at=now,
+        ))
+
+    if holding.quantity == quantity:
+        basis = holding.total_invested
+    elif left:
+        basis += holding.average_buy_price * left
+    return basis, gains
+
+
+def execute_buy(user, stock, quantity, price, price_source='mock_data'):
+    """
+    Debit the cash, record the trade, open a lot and add to the holding
+    in one transaction, moving the portfolio's total_invested and holdings_count
+    along with the cash. The debit is a single UPDATE guarded by
+    cash_balance >= cost, so the balance can't go negative even if a
+    writer slips past the row lock. Raises OrderRejected on short cash.
+    The price must already be known: upstream calls don't belong inside
+    the transaction, where they would hold the locks for their duration.
+    """
+    price = _money(price)
+    cost = price * quantity
+    now = timezone.now()
+
+    with transaction.atomic():
+        portfolio = lock_portfolio(user)
+        holding = lock_holding(user, stock)
+
+        debited = Portfolio.objects.filter(pk=portfolio.pk, cash_balance__gte=cost).update(
+            cash_balance=F('cash_balance') - cost,
+            total_invested=F('total_invested') + cost,
+            holdings_count=F('holdings_count') + (1 if holding is None else 0),
+            updated_at=now,
+        )
+        if not debited:
+            portfolio.refresh_from_db(fields=['cash_balance'])
+            raise OrderRejected(
+                "Insufficient balance",
+                required=float(cost),
+                available=float(portfolio.cash_balance),
+                short_by=float(cost - portfolio.cash_balance),
+            )
+
+        trade = Trade.objects.create(
+            user=user,
+            stock=stock,
+            quantity=quantity,
+            price_per_share=price,
+            order_type=Trade.OrderType.BUY,
+            total_amount=cost,
+            price_source=price_source,
+        )
+        trade_entry(trade, now).save()
+        Lot.objects.create(
+            user=user,
+            stock=stock,
+            buy_trade=trade,
+            quantity=quantity,
+            remaining_quantity=quantity,
+            price_per_share=price,
+            remaining_cost=cost,
+            acquired_at=now,
+        )
+
+        if holding is None:
+            holding = Holding.objects.create(
+                user=user,
+                stock=stock,
+                quantity=quantity,
+                average_buy_price=price,
+                total_invested=cost,
+                first_purchase_date=now,
+            )
+            is_new_holding = True
+        else:
+            # The row is locked, so the average can be taken from what we read
+            average = (holding.total_invested + cost) / (holding.quantity + quantity)
+            Holding.objects.filter(pk=holding.pk).update(
+                quantity=F('quantity') + quantity,
+                total_invested=F('total_invested') + cost,
+                average_buy_price=_money(average),
+                updated_at=now,
+                last_purchase_date=now,
+            )
+            holding.refresh_from_db()
+            is_new_holding = False
+
+        portfolio.refresh_from_db()
+
+    return Execution(trade, portfolio, holding, is_new_holding, [])
+
+
+def execute_sell(user, stock, quantity, price, price_source='mock_data'):
+    """
+    Remove shares from the holding, credit the proceeds and record the
+    trade in one transaction. Shares come out of the open lots oldest
+    first (FIFO): their cost is the basis taken off total_invested, and
+    what the sale made over it is recorded per lot as RealizedGain and
+    added to the portfolio's realized_pnl. The share reduction is guarded
+    by quantity >= sold in the UPDATE; the holding row is deleted when the
+    position is closed. Raises OrderRejected when the user doesn't hold
+    enough shares.
+    """
+    price = _money(price)
+    proceeds = price * quantity
+    now = timezone.now()
+
+    with transaction.atomic():
+        portfolio = lock_portfolio(user)
+        holding = lock_holding(user, stock)
+        if holding is None:
+            raise OrderRejected(f"You don't own any shares of {stock.symbol}")
+        if holding.quantity < quantity:
+            raise OrderRejected(f"Insufficient shares. You own {holding.quantity} shares")
+
+        basis, gains = take_from_lots(holding, lock_lots(user, stock), quantity, price, now)
+        realized = sum((gain.realized_pnl for gain in gains), Decimal('0.00'))
+        closing = holding.quantity == quantity
+        if closing:
+            reduced = Holding.objects.filter(pk=holding.pk, quantity=quantity).delete()[0]
+        else:
+            # The shares left are the newer lots, so the average moves with them
+            average = (holding.total_invested - basis) / (holding.quantity - quantity)
+            reduced = Holding.objects.filter(pk=holding.pk, quantity__gte=quantity).update(
+                quantity=F('quantity') - quantity,
+                total_invested=F('total_invested') - basis,
+                average_buy_price=_money(average),
+                updated_at=now,
+            )
+        if not reduced:
+            raise OrderRejected(f"Insufficient shares. You own {holding.quantity} shares")
+
+        Portfolio.objects.filter(pk=portfolio.pk).update(
+            cash_balance=F('cash_balance') + proceeds,
+            total_invested=F('total_invested') - basis,
+            holdings_count=F('holdings_count') - (1 if closing else 0),
+            realized_pnl=F('realized_pnl') + realized,
+            updated_at=now,
+        )
+
+        trade = Trade.objects.create(
+            user=user,
+            stock=stock,
+            quantity=quantity,
+            price_per_share=price,
+            order_type=Trade.OrderType.SELL,
+            total_amount=proceeds,
+            price_source=price_source,
+        )
+        for gain in gains:
+            gain.sell_trade = trade
+        Lot.objects.bulk_update([gain.lot for gain in gains], ['remaining_quantity', 'remaining_cost', 'closed_at'])
+        RealizedGain.objects.bulk_create(gains)
+        trade_entry(trade, now, basis, realized).save()
+
+        portfolio.refresh_from_db()
+        holding = Holding.objects.filter(pk=holding.pk).first()
+
+    return Execution(trade, portfolio, holding, False, gains)
+
+
+# --- set-wise execution (baskets, the opening batch) ---
+
+class Positions:
+    """
+    Locked holdings ({(user_id, stock_id): Holding}) and open lots
+    ({(user_id, stock_id): [Lot, oldest first]}) of a set of users, for
+    apply_fill to change in memory and save() to write back.
+    """
+
+    def __init__(self, holdings, lots):
+        self.holdings = holdings
+        self.lots = lots
+        self.new_lots = []
+        self.gains = []
+        self.entries = []
+
+    @classmethod
+    def lock(cls, user_ids, stock_ids):
+        """Lock the holdings, then the open lots, in (user, stock) order"""
+        holdings = {
+            (holding.user_id, holding.stock_id): holding
+            for holding in Holding.objects.select_for_update().filter(
+                user_id__in=user_ids, stock_id__in=stock_ids
+            ).order_by('user_id', 'stock_id')
+        }
+        lots = defaultdict(list)
+        for lot in Lot.objects.select_for_update().filter(
+            user_id__in=user_ids, stock_id__in=stock_ids, remaining_quantity__gt=0
+        ).order_by('user_id', 'stock_id', 'acquired_at', 'id'):
+            lots[(lot.user_id, lot.stock_id)].append(lot)
+        return cls(holdings, lots)
+
+    def held(self, user_id, stock_id):
+        holding = self.holdings.get((user_id, stock_id))
+        return holding.quantity if holding else 0
+
+    def save(self, now):
+        """
+        Write back what apply_fill changed, after the trades are inserted:
+        holdings with one INSERT, one DELETE and one UPDATE at most, then
+        the new lots, the lots drawn from, the realised gains and the
+        ledger entries.
+        """
+        touched = [h for h in self.holdings.values() if h.updated_at == now]
+        Holding.objects.bulk_create([h for h in touched if h.pk is None and h.quantity])
+        Holding.objects.filter(pk__in=[h.pk for h in touched if h.pk and not h.quantity]).delete()
+        Holding.objects.bulk_update(
+            [h for h in touched if h.pk and h.quantity],
+            ['quantity', 'average_buy_price', 'total_invested', 'last_purchase_date', 'updated_at']
+        )
+
+        drawn = {gain.lot.pk: gain.lot for gain in self.gains if gain.lot.pk}
+        Lot.objects.bulk_create(self.new_lots)
+        Lot.objects.bulk_update(list(drawn.values()), ['remaining_quantity', 'remaining_cost', 'closed_at'])
+        RealizedGain.objects.bulk_create(self.gains)
+        LedgerEntry.objects.bulk_create(self.entries)
+
+
+def apply_fill(portfolio, positions, stock_id, side, quantity, price, price_source, now):
+    """
+    Apply one fill to a locked portfolio and its locked Positions in
+    memory, with the same arithmetic as execute_buy / execute_sell.
+    The caller has checked cash and shares. Returns the unsaved Trade;
+    positions.save() writes the rest back once the trades are in.
+    """
+    price = _money(price)
+    amount = price * quantity
+    key = (portfolio.user_id, stock_id)
+    holding = positions.holdings.get(key)
+    trade = Trade(
+        user_id=portfolio.user_id,
+        stock_id=stock_id,
+        quantity=quantity,
+        price_per_share=price,
+        total_amount=amount,
+        order_type=side,
+        price_source=price_source,
+    )
+
+    if side == Trade.OrderType.BUY:
+        if holding is None:
+            holding = positions.holdings[key] = Holding(
+                user_id=portfolio.user_id, stock_id=stock_id,
+                quantity=0, total_invested=Decimal('0.00'), first_purchase_date=now,
+            )
+        if not holding.quantity:
+            portfolio.holdings_count += 1
+        holding.average_buy_price = _money((holding.total_invested + amount) / (holding.quantity + quantity))
+        holding.quantity += quantity
+        holding.total_invested += amount
+        holding.last_purchase_date = now
+        portfolio.cash_balance -= amount
+        portfolio.total_invested += amount
+
+        lot = Lot(
+            user_id=portfolio.user_id, stock_id=stock_id, buy_trade=trade,
+            quantity=quantity, remaining_quantity=quantity,
+            price_per_share=price, remaining_cost=amount, acquired_at=now,
+        )
+        positions.lots[key].append(lot)
+        positions.new_lots.append(lot)
+        positions.entries.append(trade_entry(trade, now))
+    else:
+        closing = holding.quantity == quantity
+        basis, gains = take_from_lots(holding, positions.lots[key], quantity, price, now)
+        holding.quantity -= quantity
+        holding.total_invested -= basis
+        if not closing:
+            holding.average_buy_price = _money(holding.total_invested / holding.quantity)
+        portfolio.cash_balance += amount
+        portfolio.total_invested -= basis
+        if closing:
+            portfolio.holdings_count -= 1
+        realized = sum((gain.realized_pnl for gain in gains), Decimal('0.00'))
+        portfolio.realized_pnl += realized
+        for gain in gains:
+            gain.sell_trade = trade
+        positions.gains.extend(gains)
+        positions.entries.append(trade_entry(trade, now, basis, realized))
+    holding.updated_at = now
+
+    return trade
+
+
+def execute_basket(user, legs):
+    """
+    Execute several orders of one user as a unit: all legs fill or none.
+    The portfolio and every position involved are locked once; shares are
+    checked per stock and cash once, against the net cost (sell proceeds
+    fund the buys). Trades go in with one bulk INSERT, holdings and lots
+    with set-based writes, and the portfolio with one guarded UPDATE.
+    Returns (trades, portfolio). Raises OrderRejected.
+    """
+    for leg in legs:
+        if not leg.price or leg.price <= 0:
+            raise OrderRejected(f"No price for {leg.stock.symbol}", symbol=leg.stock.symbol)
+
+    now = timezone.now()
+    with transaction.atomic():
+        portfolio = lock_portfolio(user)
+        positions = Positions.lock([user.pk], {leg.stock.id for leg in legs})
+
+        sold = defaultdict(int)
+        for leg in legs:
+            if leg.side == Trade.OrderType.SELL:
+                sold[leg.stock] += leg.quantity
+        for stock, quantity in sold.items():
+            held = positions.held(user.pk, stock.id)
+            if held < quantity:
+                raise OrderRejected(f"Insufficient shares of {stock.symbol}. You own {held} shares",
+                                    symbol=stock.symbol)
+
+        net_cost = sum(
+            (_money(leg.price) * leg.quantity * (1 if leg.side == Trade.OrderType.BUY else -1) for leg in legs),
+            Decimal('0.00')
+        )
+        if net_cost > portfolio.cash_balance:
+            raise OrderRejected(
+                "Insufficient balance",
+                required=float(net_cost),
+                available=float(portfolio.cash_balance),
+                short_by=float(net_cost - portfolio.cash_balance),
+            )
+
+        before = (portfolio.total_invested, portfolio.holdings_count, portfolio.realized_pnl)
+        # Sells first, so each sell meets the holding the shares check saw
+        trades = [
+            apply_fill(portfolio, positions, leg.stock.id, leg.side, leg.quantity, leg.price, leg.price_source, now)
+            for leg in sorted(legs, key=lambda leg: leg.side != Trade.OrderType.SELL)
+        ]
+
+        # Bulk inserts skip the post_save trade counter; total_trades moves here
+        debited = Portfolio.objects.filter(pk=portfolio.pk, cash_balance__gte=net_cost).update(
+            cash_balance=F('cash_balance') - net_cost,
+            total_invested=F('total_invested') + (portfolio.total_invested - before[0]),
+            holdings_count=F('holdings_count') + (portfolio.holdings_count - before[1]),
+            realized_pnl=F('realized_pnl') + (portfolio.realized_pnl - before[2]),
+            total_trades=F('total_trades') + len(trades),
+            updated_at=now,
+        )
+        if not debited:
+            raise OrderRejected("Insufficient balance")
+        Trade.objects.bulk_create(trades)
+        positions.save(now)
+        portfolio.refresh_from_db()
+
+    return trades, portfolio
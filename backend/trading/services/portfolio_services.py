@@ -1,6 +1,8 @@
 from decimal import Decimal
-from trading.models import Holding, Trade
+from datetime import datetime, time, timedelta
+from trading.models import Holding, Trade, Stock
 from django.db.models import Sum, Avg
+from services.price_history import NEPAL_TZ, closing_prices
 
 class PortfolioService:
     """Service class for complex portfolio calculations"""
@@ -137,4 +139,73 @@ class PortfolioService:
                     'buy_price': float(avg_price)
                 })
         
-        return recommendations
\ No newline at end of file
+        return recommendations
+    
+    def get_value_history(self, days=30):
+        """
+        Daily portfolio value for the last `days` days (oldest first).
+        Starts from today's cash and holdings and unwinds trades backwards,
+        pricing each day's holdings at that day's DailyBar close (carried
+        forward over days without a bar, current price if none yet).
+        """
+        days = max(1, days)
+        today = datetime.now(NEPAL_TZ).date()
+        start = today - timedelta(days=days - 1)
+        
+        cash = self.portfolio.cash_balance
+        quantities = dict(Holding.objects.filter(user=self.user).values_list('stock_id', 'quantity'))
+        trades = list(
+            Trade.objects.filter(
+                user=self.user,
+                timestamp__gte=NEPAL_TZ.localize(datetime.combine(start, time.min)),
+            )
+            .exclude(status__in=['PENDING', 'FAILED', 'CANCELLED'])
+            .order_by('-timestamp')
+            .values_list('stock_id', 'order_type', 'quantity', 'total_amount', 'timestamp')
+        )
+        
+        stock_ids = set(quantities) | {trade[0] for trade in trades}
+        current = dict(Stock.objects.filter(id__in=stock_ids).values_list('id', 'current_price'))
+        closes = closing_prices(stock_ids, start, today)
+        
+        # Forward-fill closes so every day has a price per stock
+        prices = {}
+        for stock_id in stock_ids:
+            known = closes[stock_id]
+            before = [day for day in known if day < start]
+            last = known[max(before)] if before else None
+            prices[stock_id] = {}
+            for offset in range(days):
+                day = start + timedelta(days=offset)
+                last = known.get(day, last)
+                prices[stock_id][day] = last if last is not None else current.get(stock_id, 0)
+        
+        timeline = []
+        pending = iter(trades)
+        trade = next(pending, None)
+        for offset in reversed(range(days)):
+            day = start + timedelta(days=offset)
+            holdings_value = sum(
+                quantity * (current[stock_id] if day == today else prices[stock_id][day])
+                for stock_id, quantity in quantities.items() if quantity
+            )
+            timeline.append({
+                'date': day.isoformat(),
+                'value': float(cash + holdings_value),
+                'cash': float(cash),
+                'holdings_value': float(holdings_value),
+            })
+            
+            # Undo this day's trades to get the position at the previous close
+            while trade and trade[4].astimezone(NEPAL_TZ).date() >= day:
+                stock_id, order_type, quantity, total_amount, _ = trade
+                if order_type == 'BUY':
+                    cash += total_amount
+                    quantities[stock_id] = quantities.get(stock_id, 0) - quantity
+                else:
+                    cash -= total_amount
+                    quantities[stock_id] = quantities.get(stock_id, 0) + quantity
+                trade = next(pending, None)
+        
+        timeline.reverse()
+        return timeline
@@ -0,0 +1,27 @@
+from decimal import Decimal
+from django.db.models import F
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import LedgerEntry, Trade, Portfolio
+
+@receiver(post_save, sender=Trade)
+def count_new_trade(sender, instance, created, **kwargs):
+    """Keep Portfolio.total_trades in step with the user's trades"""
+    if created:
+        Portfolio.objects.filter(user_id=instance.user_id).update(total_trades=F('total_trades') + 1)
+
+@receiver(post_delete, sender=Trade)
+def uncount_deleted_trade(sender, instance, **kwargs):
+    Portfolio.objects.filter(user_id=instance.user_id, total_trades__gt=0).update(
+        total_trades=F('total_trades') - 1
+    )
+
+@receiver(post_save, sender=Portfolio)
+def open_ledger(sender, instance, created, **kwargs):
+    """Start the portfolio's ledger with its opening cash"""
+    if created:
+        LedgerEntry.objects.create(
+            user_id=instance.user_id,
+            kind=LedgerEntry.Kind.OPENING,
+            cash_delta=Decimal(str(instance.cash_balance)),
+        )
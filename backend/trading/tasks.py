@@ -1,13 +1,21 @@
 from celery import shared_task
 from services.price_updater import update_all_prices
 from services.market_hours import is_market_open
+from services.market_feed import MarketFeedPoller
+from services.nepse_http import feed_enabled
 import logging
+import os
+import socket
 
 logger = logging.getLogger(__name__)
 
 @shared_task
 def update_stock_prices_task():
-    """Celery task to update stock prices"""
+    """
+    Celery task to update stock prices.
+    With the market feed enabled this writes the snapshot the feed last
+    published instead of calling /LiveMarket again.
+    """
     
     # Optional: Only update during market hours
     # if not is_market_open():
@@ -15,4 +23,25 @@ def update_stock_prices_task():
     #     return
     
     count = update_all_prices()
-    return f"Updated {count} stocks"
\ No newline at end of file
+    return f"Updated {count} stocks"
+
+@shared_task
+def poll_market_feed_task():
+    """
+    One market feed poll (Celery beat alternative to `run_market_feed`).
+    Runs in the same worker process share a token, so they keep the feed
+    leadership while workers elsewhere stand by. Beat schedules it every
+    FEED['INTERVAL'] seconds; it does nothing unless
+    NEPSE_API['FEED']['ENABLED'] is on.
+    """
+    if not feed_enabled():
+        return "Market feed disabled, skipping poll"
+    # Built per run, not at import: prefork children import this before forking
+    poller = MarketFeedPoller(token=f"{socket.gethostname()}:{os.getpid()}")
+    if not poller.acquire_leadership():
+        return "Another feed poller is leading"
+    if not poller.poll_due():
+        return "Market closed, skipping poll"
+    
+    poller.poll_once()
+    return "Published market snapshot"
@@ -0,0 +1,1146 @@
+import asyncio
+import base64
+import csv
+import gzip
+import json
+import pickle
+import threading
+import unittest
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+import requests
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.conf import settings
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from services import cache as shared_cache
+from services.candle_store import CandleStore, live_key, merge_bars, segment_key, sessions_key
+from services.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError
+from services import nepse_http
+from services.circuit_breaker import get_breaker
+from services.nepse_http import nepse_get, worst_case_request_time
+from services.nepse_standin import StandinServer
+from services.market_snapshot import MarketSnapshot
+from services.nepse_client import NepseClient
+from services.market_simulator import MAX_CATCH_UP, MarketSimulator, previous_trading_days
+from services.price_history import Tick, closing_prices, record_ticks
+from services.price_updater import update_all_prices, upsert_stocks
+from services.snapshot_diff import DiffEngine, PriceDelta, SnapshotDiff, compute_changes, recent_diffs
+from users_authentication.models import CustomUser
+from market_data.views import chart_days
+from trading.models import (
+    DailyBar, Holding, LedgerEntry, Lot, Order, Portfolio, PriceTick, RealizedGain, Stock, Trade,
+)
+from trading.api import export_views
+from trading.management.commands import partition_trades
+from trading.pagination import NEXT, PREV, PaginationError, decode_cursor, encode_cursor, paginate_newest_first
+from trading.services.ledger import portfolio_at, take_snapshots
+from trading.services.opening_batch import execute_pending_orders
+from trading.services.order_book import execute_triggered_orders, get_trigger_book
+from trading.services.order_execution import execute_basket, execute_buy, execute_sell, Leg, OrderRejected
+
+MARKET_OPEN = {'is_open': True, 'is_closed': False, 'is_halted': False, 'message': 'Market is open'}
+MARKET_CLOSED = {'is_open': False, 'is_closed': True, 'is_halted': False, 'message': 'Market is closed'}
+
+
+class TradingTestCase(TestCase):
+    """A user with the default 100,000 cash, an API client and two stocks"""
+
+    def setUp(self):
+        self.user = CustomUser.objects.create(username='trader@example.com', email='trader@example.com')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.nic = Stock.objects.create(symbol='NIC', name='NIC Asia Bank', current_price=Decimal('400.00'))
+        self.nabil = Stock.objects.create(symbol='NABIL', name='Nabil Bank', current_price=Decimal('500.00'))
+
+    def market(self, price=None, status=MARKET_OPEN):
+        """Patch the upstream market status and, if given, the live price of every symbol"""
+        patches = [mock.patch.object(NepseClient, 'get_market_status', return_value=status)]
+        patches.append(mock.patch.object(
+            NepseClient, 'get_stock_price', return_value={'price': price, 'change': 0, 'source': 'live'} if price else None
+        ))
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def portfolio(self):
+        return Portfolio.objects.get(user=self.user)
+
+    def assertPositionsConsistent(self):
+        """Cash, holdings and lots agree with each other and with the trades"""
+        portfolio = self.portfolio()
+        trades = Trade.objects.filter(user=self.user)
+        spent = sum(t.total_amount for t in trades if t.order_type == Trade.OrderType.BUY)
+        received = sum(t.total_amount for t in trades if t.order_type == Trade.OrderType.SELL)
+        self.assertEqual(portfolio.cash_balance, Decimal('100000.00') - spent + received)
+
+        holdings = list(Holding.objects.filter(user=self.user))
+        self.assertEqual(portfolio.holdings_count, len(holdings))
+        self.assertEqual(portfolio.total_invested, sum((h.total_invested for h in holdings), Decimal('0.00')))
+        self.assertEqual(portfolio.total_trades, trades.count())
+        self.assertEqual(
+            portfolio.realized_pnl,
+            sum((g.realized_pnl for g in RealizedGain.objects.filter(user=self.user)), Decimal('0.00'))
+        )
+        for holding in holdings:
+            lots = Lot.objects.filter(user=self.user, stock=holding.stock, remaining_quantity__gt=0)
+            self.assertEqual(sum(lot.remaining_quantity for lot in lots), holding.quantity)
+            self.assertEqual(sum((lot.remaining_cost for lot in lots), Decimal('0.00')), holding.total_invested)
+
+
+class BuySellViewTests(TradingTestCase):
+
+    def test_buy(self):
+        self.market(price=100)
+        response = self.client.post('/trading/buy/', {'symbol': 'NIC', 'quantity': 5}, format='json')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['holding_update']['total_shares_owned'], 5)
+        self.assertEqual(Trade.objects.filter(user=self.user).count(), 1)
+        portfolio = self.portfolio()
+        self.assertEqual(portfolio.cash_balance, Decimal('99500.00'))
+        self.assertEqual(portfolio.total_invested, Decimal('500.00'))
+        self.assertEqual(portfolio.holdings_count, 1)
+        lot = Lot.objects.get(user=self.user, stock=self.nic)
+        self.assertEqual((lot.remaining_quantity, lot.remaining_cost), (5, Decimal('500.00')))
+        self.assertEqual(Holding.objects.get(user=self.user, stock=self.nic).quantity, 5)
+
+    def test_buy_rejected_on_short_cash(self):
+        self.market(price=100)
+        response = self.client.post('/trading/buy/', {'symbol': 'NIC', 'quantity': 1001}, format='json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['error'], 'Insufficient balance')
+        self.assertFalse(Trade.objects.filter(user=self.user).exists())
+        self.assertEqual(self.portfolio().cash_balance, Decimal('100000.00'))
+
+    def test_buy_rejects_bad_quantity(self):
+        self.market(price=100)
+        response = self.client.post('/trading/buy/', {'symbol': 'NIC', 'quantity': 0}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_buy_blocked_while_halted(self):
+        self.market(price=100, status={'is_open': False, 'is_closed': False, 'is_halted': True, 'message': 'Halted'})
+        response = self.client.post('/trading/buy/', {'symbol': 'NIC', 'quantity': 1}, format='json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Trade.objects.filter(user=self.user).exists())
+
+    def test_sell(self):
+        self.market(price=100)
+        self.client.post('/trading/buy/', {'symbol': 'NIC', 'quantity': 10}, format='json')
+        self.market(price=120)
+        response = self.client.post('/trading/sell/', {'symbol': 'NIC', 'quantity': 4}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        data = response.json()['data']
+        self.assertEqual(data['remaining_shares'], 6)
+        self.assertEqual(data['realized_profit_loss'], 80.0)
+        self.assertEqual(self.portfolio().cash_balance, Decimal('99480.00'))
+        self.assertPositionsConsistent()
+
+    def test_sell_closing_the_position(self):
+        self.market(price=100)
+        self.client.post('/trading/buy/', {'symbol': 'NIC', 'quantity': 3}, format='json')
+        response = self.client.post('/trading/sell/', {'symbol': 'NIC', 'quantity': 3}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(Holding.objects.filter(user=self.user).exists())
+        portfolio = self.portfolio()
+        self.assertEqual((portfolio.total_invested, portfolio.holdings_count), (Decimal('0.00'), 0))
+        self.assertPositionsConsistent()
+
+    def test_sell_rejected(self):
+        self.market(price=100)
+        response = self.client.post('/trading/sell/', {'symbol': 'NIC', 'quantity': 1}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+        self.client.post('/trading/buy/', {'symbol': 'NIC', 'quantity': 2}, format='json')
+        response = self.client.post('/trading/sell/', {'symbol': 'NIC', 'quantity': 3}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['error'], 'Insufficient shares. You own 2 shares')
+        self.assertEqual(Trade.objects.filter(user=self.user, order_type=Trade.OrderType.SELL).count(), 0)
+
+    def test_execute_sell_guards_shares(self):
+        execute_buy(self.user, self.nic, 2, '100')
+        with self.assertRaises(OrderRejected):
+            execute_sell(self.user, self.nic, 3, '100')
+        self.assertEqual(Holding.objects.get(user=self.user, stock=self.nic).quantity, 2)
+        self.assertPositionsConsistent()
+
+
+class FifoLotTests(TradingTestCase):
+
+    def test_sell_consumes_oldest_lots_first(self):
+        execute_buy(self.user, self.nic, 10, '100')
+        execute_buy(self.user, self.nic, 10, '110.55')
+        execute_buy(self.user, self.nic, 5, '90')
+
+        execution = execute_sell(self.user, self.nic, 15, '120')
+
+        gains = [(g.quantity, g.cost_basis, g.realized_pnl) for g in execution.gains]
+        self.assertEqual(gains, [(10, Decimal('1000.00'), Decimal('200.00')),
+                                 (5, Decimal('552.75'), Decimal('47.25'))])
+        # Left: 5 @ 110.55 and 5 @ 90
+        holding = execution.holding
+        self.assertEqual((holding.quantity, holding.total_invested), (10, Decimal('1002.75')))
+        self.assertEqual(holding.average_buy_price, Decimal('100.28'))
+        self.assertEqual(self.portfolio().realized_pnl, Decimal('247.25'))
+
+        breakdown = holding.get_breakdown_by_purchase()
+        self.assertEqual([(lot['remaining_quantity'], lot['price']) for lot in breakdown], [(5, 110.55), (5, 90.0)])
+        self.assertPositionsConsistent()
+
+
+class IdempotencyTests(TradingTestCase):
+
+    def buy(self, key):
+        return self.client.post('/trading/buy/', {'symbol': 'NIC', 'quantity': 4}, format='json',
+                                HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_replay_returns_first_response(self):
+        self.market(price=100)
+        first = self.buy('order-1')
+        second = self.buy('order-1')
+
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(second.status_code, 201)
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(second.json()['trade_details'], first.json()['trade_details'])
+        self.assertEqual(Trade.objects.filter(user=self.user).count(), 1)
+        self.assertEqual(self.portfolio().cash_balance, Decimal('99600.00'))
+
+    def test_key_reused_for_other_request(self):
+        self.market(price=100)
+        self.buy('order-1')
+        response = self.client.post('/trading/buy/', {'symbol': 'NIC', 'quantity': 5}, format='json',
+                                    HTTP_IDEMPOTENCY_KEY='order-1')
+        self.assertEqual(response.status_code, 422)
+
+    def test_failure_after_the_order_rolls_it_back(self):
+        self.market(price=100)
+        with mock.patch.object(Portfolio, 'get_total_stock_value', side_effect=RuntimeError('boom')):
+            with self.assertRaises(RuntimeError):
+                self.buy('order-1')
+        self.assertEqual(Trade.objects.filter(user=self.user).count(), 0)
+        self.assertEqual(self.portfolio().cash_balance, Decimal('100000.00'))
+
+        retry = self.buy('order-1')
+        self.assertEqual(retry.status_code, 201)
+        self.assertFalse(retry.has_header('Idempotent-Replayed'))
+        self.assertEqual(Trade.objects.filter(user=self.user).count(), 1)
+        self.assertEqual(self.portfolio().cash_balance, Decimal('99600.00'))
+
+
+class BasketTests(TradingTestCase):
+
+    def basket(self, legs, quotes=()):
+        snapshot = MarketSnapshot(
+            [{'symbol': symbol, 'lastTradedPrice': price} for symbol, price in quotes], source='live', version=1
+        )
+        with mock.patch.object(NepseClient, 'get_snapshot', return_value=snapshot):
+            return self.client.post('/trading/basket/', {'legs': legs}, format='json')
+
+    def test_zero_quote_falls_back_to_stored_price(self):
+        self.market()
+        response = self.basket([{'symbol': 'NIC', 'side': 'BUY', 'quantity': 2}], quotes=[('NIC', 0)])
+
+        self.assertEqual(response.status_code, 201)
+        trade = response.json()['trades'][0]
+        self.assertEqual((trade['price_per_share'], trade['price_source']), (400.0, 'database_cache'))
+        self.assertEqual(self.portfolio().cash_balance, Decimal('99200.00'))
+
+    def test_execute_basket_rejects_unpriced_leg(self):
+        with self.assertRaises(OrderRejected):
+            execute_basket(self.user, [Leg(self.nic, Trade.OrderType.BUY, 2, Decimal('0'), 'nepse_api_live')])
+        self.assertFalse(Trade.objects.filter(user=self.user).exists())
+
+    def test_all_or_nothing(self):
+        self.market()
+        execute_buy(self.user, self.nic, 3, '400')
+        response = self.basket([
+            {'symbol': 'NIC', 'side': 'SELL', 'quantity': 3},
+            {'symbol': 'NABIL', 'side': 'BUY', 'quantity': 2},
+            {'symbol': 'NIC', 'side': 'SELL', 'quantity': 1},
+        ], quotes=[('NIC', 410), ('NABIL', 500)])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['error'], 'Insufficient shares of NIC. You own 3 shares')
+        self.assertEqual(Trade.objects.filter(user=self.user).count(), 1)
+        self.assertFalse(Holding.objects.filter(user=self.user, stock=self.nabil).exists())
+        self.assertPositionsConsistent()
+
+    def test_sells_fund_buys(self):
+        self.market()
+        execute_buy(self.user, self.nic, 200, '400')
+        execute_buy(self.user, self.nabil, 38, '500')
+        # 1,000 cash left; the buy needs the sell's proceeds
+        response = self.basket([
+            {'symbol': 'NABIL', 'side': 'BUY', 'quantity': 10},
+            {'symbol': 'NIC', 'side': 'SELL', 'quantity': 200},
+        ], quotes=[('NIC', 410), ('NABIL', 500)])
+
+        self.assertEqual(response.status_code, 201)
+        summary = response.json()['summary']
+        self.assertEqual((summary['net_cash'], summary['holdings_count']), (77000.0, 1))
+        self.assertFalse(Holding.objects.filter(user=self.user, stock=self.nic).exists())
+        self.assertEqual(self.portfolio().realized_pnl, Decimal('2000.00'))
+        self.assertPositionsConsistent()
+
+    def test_rejected_while_closed(self):
+        self.market(status=MARKET_CLOSED)
+        response = self.basket([{'symbol': 'NIC', 'side': 'BUY', 'quantity': 1}], quotes=[('NIC', 410)])
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Trade.objects.filter(user=self.user).exists())
+
+
+class RestingOrderTests(TradingTestCase):
+
+    def setUp(self):
+        super().setUp()
+        get_trigger_book().reset()
+        self.addCleanup(get_trigger_book().reset)
+
+    def tick(self, symbol, old, new, seq=1):
+        return execute_triggered_orders(SnapshotDiff(seq, seq - 1, seq, [PriceDelta(symbol, old, new, 0, 0, 0, 0)]))
+
+    def test_limit_buy_fills_when_price_crosses(self):
+        response = self.client.post('/trading/orders/', {
+            'symbol': 'NIC', 'side': 'BUY', 'order_type': 'LIMIT', 'quantity': 5, 'limit_price': '395'
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        order_id = response.json()['order']['id']
+
+        self.assertEqual(self.tick('NIC', 400, 398), 0)
+        self.assertEqual(self.tick('NIC', 398, 390, seq=2), 1)
+
+        order = Order.objects.get(pk=order_id)
+        self.assertEqual((order.status, order.fill_price), (Order.Status.FILLED, Decimal('390.00')))
+        self.assertEqual(order.trade.quantity, 5)
+        self.assertPositionsConsistent()
+
+    def test_cancelled_order_does_not_fill(self):
+        response = self.client.post('/trading/orders/', {
+            'symbol': 'NIC', 'side': 'BUY', 'order_type': 'LIMIT', 'quantity': 5, 'limit_price': '395'
+        }, format='json')
+        order_id = response.json()['order']['id']
+        self.tick('NIC', 400, 399)
+
+        self.assertEqual(self.client.delete(f'/trading/orders/{order_id}/').status_code, 200)
+        self.assertEqual(self.tick('NIC', 399, 380, seq=2), 0)
+        self.assertFalse(Trade.objects.filter(user=self.user).exists())
+
+    def test_market_order_queued_while_closed_fills_at_open(self):
+        self.market(price=100, status=MARKET_CLOSED)
+        self.assertEqual(self.client.post('/trading/buy/', {'symbol': 'NIC', 'quantity': 5}, format='json').status_code, 202)
+        self.assertEqual(self.client.post('/trading/buy/', {'symbol': 'NABIL', 'quantity': 500}, format='json').status_code, 202)
+
+        result = execute_pending_orders({'NIC': Decimal('410'), 'NABIL': Decimal('500')})
+
+        self.assertEqual(result, {'filled': 1, 'rejected': 1})
+        statuses = dict(Order.objects.filter(user=self.user).values_list('stock__symbol', 'status'))
+        self.assertEqual(statuses, {'NIC': Order.Status.FILLED, 'NABIL': Order.Status.REJECTED})
+        self.assertEqual(self.portfolio().cash_balance, Decimal('97950.00'))
+        self.assertPositionsConsistent()
+
+
+class LedgerTests(TradingTestCase):
+
+    def assertMatchesStored(self, state):
+        portfolio = self.portfolio()
+        self.assertEqual(
+            (state.cash_balance, state.total_invested, state.realized_pnl),
+            (portfolio.cash_balance, portfolio.total_invested, portfolio.realized_pnl)
+        )
+        held = {h.stock_id: (h.quantity, h.total_invested) for h in Holding.objects.filter(user=self.user)}
+        self.assertEqual({stock_id: tuple(position) for stock_id, position in state.positions.items()}, held)
+
+    def test_replay_matches_stored_totals(self):
+        execute_buy(self.user, self.nic, 10, '100')
+        execute_buy(self.user, self.nabil, 4, '500')
+        execute_sell(self.user, self.nic, 6, '120')
+        execute_basket(self.user, [Leg(self.nabil, Trade.OrderType.SELL, 4, Decimal('510'), 'mock_data'),
+                                   Leg(self.nic, Trade.OrderType.BUY, 2, Decimal('130'), 'mock_data')])
+
+        self.assertEqual(LedgerEntry.objects.filter(user=self.user).count(), 1 + 5)
+        self.assertMatchesStored(portfolio_at(self.user.pk, timezone.now()))
+
+    def test_snapshot_plus_replay(self):
+        execute_buy(self.user, self.nic, 10, '100')
+        self.assertEqual(take_snapshots(timezone.now()), 1)
+        before_sell = self.portfolio()
+        execute_sell(self.user, self.nic, 4, '150')
+
+        state = portfolio_at(self.user.pk, timezone.now())
+        self.assertIsNotNone(state.snapshot_taken_at)
+        self.assertEqual(state.replayed, 1)
+        self.assertMatchesStored(state)
+
+        # Before the snapshot: rebuilt from the ledger alone
+        past = portfolio_at(self.user.pk, state.snapshot_taken_at - timedelta(microseconds=1))
+        self.assertIsNone(past.snapshot_taken_at)
+        self.assertEqual(past.cash_balance, before_sell.cash_balance)
+
+    def test_portfolio_at_view(self):
+        execute_buy(self.user, self.nic, 10, '100')
+        response = self.client.get('/trading/portfolio/at/', {'at': timezone.now().isoformat()})
+
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual((data['cash_balance'], data['total_invested']), (99000.0, 1000.0))
+        self.assertEqual(data['holdings'][0]['quantity'], 10)
+        self.assertEqual(self.client.get('/trading/portfolio/at/', {'at': 'yesterday'}).status_code, 400)
+
+
+class PriceHistoryTests(TradingTestCase):
+
+    def at(self, hour, minute=0):
+        return datetime.fromisoformat(f'2026-10-18T{hour:02}:{minute:02}:00+00:00')
+
+    def bar(self):
+        bar = DailyBar.objects.get(stock=self.nic)
+        return (bar.open, bar.high, bar.low, bar.close, bar.volume)
+
+    def test_ticks_roll_into_a_daily_bar(self):
+        written = record_ticks([
+            Tick('NIC', self.at(5, 30), 400, 100),
+            Tick('NIC', self.at(5, 31), 410, 250),
+            Tick('NIC', self.at(5, 32), 395, 300),
+            Tick('NOPE', self.at(5, 32), 1, 1),
+        ])
+        self.assertEqual(written, 3)
+        self.assertEqual(self.bar(), (Decimal('400'), Decimal('410'), Decimal('395'), Decimal('395'), 300))
+
+    def test_replayed_and_late_ticks_leave_the_bar_alone(self):
+        record_ticks([Tick('NIC', self.at(5, 30), 400, 100), Tick('NIC', self.at(5, 40), 405, 200)])
+        before = self.bar()
+
+        self.assertEqual(record_ticks([Tick('NIC', self.at(5, 30), 400, 100)]), 0)
+        self.assertEqual(self.bar(), before)
+
+        # An out-of-order tick widens the range but doesn't move the close
+        self.assertEqual(record_ticks([Tick('NIC', self.at(5, 35), 390, 150)]), 1)
+        self.assertEqual(self.bar(), (Decimal('400'), Decimal('405'), Decimal('390'), Decimal('405'), 200))
+        self.assertEqual(PriceTick.objects.filter(stock=self.nic).count(), 3)
+
+    def test_closing_prices_carry_the_prior_close(self):
+        for stock, day, close in [(self.nic, date(2026, 1, 5), 2), (self.nic, date(2026, 1, 10), 3),
+                                  (self.nic, date(2026, 1, 1), 1), (self.nabil, date(2026, 1, 11), 8)]:
+            DailyBar.objects.create(stock=stock, date=day, open=close, high=close, low=close, close=close)
+
+        with self.assertNumQueries(2):
+            closes = closing_prices([self.nic.id, self.nabil.id], date(2026, 1, 8), date(2026, 1, 12))
+        self.assertEqual(closes, {
+            self.nic.id: {date(2026, 1, 5): Decimal('2'), date(2026, 1, 10): Decimal('3')},
+            self.nabil.id: {date(2026, 1, 11): Decimal('8')},
+        })
+
+
+class SimulatedPriceTests(TradingTestCase):
+
+    def test_orders_ignore_simulated_quotes(self):
+        self.market()
+        quote = {'price': 123.4, 'change': 1.0, 'source': 'mock'}
+        with mock.patch.object(NepseClient, 'get_stock_price', return_value=quote):
+            bought = self.client.post('/trading/buy/', {'symbol': 'NIC', 'quantity': 2}, format='json')
+            sold = self.client.post('/trading/sell/', {'symbol': 'NIC', 'quantity': 1}, format='json')
+
+        self.assertEqual((bought.status_code, sold.status_code), (201, 200))
+        trades = Trade.objects.filter(user=self.user).order_by('id')
+        self.assertEqual([(t.price_per_share, t.price_source) for t in trades],
+                         [(Decimal('400.00'), 'database_cache')] * 2)
+
+    def test_simulated_snapshot_is_not_written_to_stocks(self):
+        snapshot = MarketSnapshot([{'symbol': 'NIC', 'lastTradedPrice': 1.5}], source='mock', version=1)
+        with mock.patch.object(NepseClient, 'get_snapshot', return_value=snapshot):
+            self.assertEqual(update_all_prices(), 0)
+        self.assertEqual(Stock.objects.get(symbol='NIC').current_price, Decimal('400.00'))
+
+        live = MarketSnapshot([{'symbol': 'NIC', 'lastTradedPrice': 401.5}], source='live', version=2)
+        with mock.patch.object(NepseClient, 'get_snapshot', return_value=live):
+            self.assertEqual(update_all_prices(), 1)
+        self.assertEqual(Stock.objects.get(symbol='NIC').current_price, Decimal('401.50'))
+
+
+class MarketSimulatorTests(TestCase):
+
+    def test_history_is_stable_for_a_seed(self):
+        days = previous_trading_days(date(2026, 10, 18), 3)
+        small = MarketSimulator([{'symbol': 'NIC', 'sector': 'Banks', 'price': 400}], seed=7, warmup=60)
+        large = MarketSimulator([
+            {'symbol': 'ADBL', 'sector': 'Banks', 'price': 300},
+            {'symbol': 'NIC', 'sector': 'Banks', 'price': 431},
+            {'symbol': 'UPPER', 'sector': 'Hydro', 'price': 200},
+        ], seed=7, warmup=60)
+        reseeded = MarketSimulator([{'symbol': 'NIC', 'sector': 'Banks', 'price': 400}], seed=8, warmup=60)
+
+        closes = [bars[3][-1, 0] for _, bars in small.sessions(days, ['NIC'])]
+        self.assertEqual(closes, [bars[3][-1, 0] for _, bars in large.sessions(days, ['NIC'])])
+        self.assertNotEqual(closes, [bars[3][-1, 0] for _, bars in reseeded.sessions(days, ['NIC'])])
+        self.assertEqual(small.vol[0], large.vol[large.index['NIC']])
+
+    def test_catch_up_is_capped(self):
+        simulator = MarketSimulator([{'symbol': 'NIC', 'price': 400}], seed=1, warmup=60)
+        simulator._last_wall -= 24 * 60 * 60
+        simulator.advance_to_now()
+        self.assertEqual(simulator.t, 60 + MAX_CATCH_UP)
+
+
+def live_snapshot(version, prices, volume=0):
+    return MarketSnapshot(
+        [{'symbol': symbol, 'lastTradedPrice': price, 'totalTradeQuantity': volume} for symbol, price in prices.items()],
+        source='live', version=version,
+    )
+
+
+class MarketSnapshotTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def test_quotes_are_indexed_by_symbol_and_read_only(self):
+        snapshot = MarketSnapshot([
+            {'symbol': 'NIC', 'lastTradedPrice': '400.5', 'percentageChange': 1.2, 'totalTradeQuantity': 30},
+            {'symbol': 'NABIL', 'lastTradedPrice': 500},
+            {'symbol': 'NIC', 'lastTradedPrice': 401},  # a repeated row replaces the earlier one
+        ], source='live')
+
+        self.assertEqual(list(snapshot.symbols), ['NIC', 'NABIL'])
+        self.assertEqual(snapshot.quotes['NIC']['price'], 401.0)
+        self.assertIsNone(snapshot.get('HDL'))
+        with self.assertRaises(TypeError):
+            snapshot.quotes['NIC']['price'] = 1
+        with self.assertRaises(AttributeError):
+            snapshot.source = 'mock'
+
+        quote = snapshot.get('NABIL')
+        quote['price'] = 1
+        self.assertEqual(snapshot.get('NABIL')['price'], 500.0)
+
+    def test_versions_increase_per_snapshot(self):
+        first, second = MarketSnapshot([]), MarketSnapshot([])
+        self.assertEqual(second.version, first.version + 1)
+
+
+class ColumnarSnapshotTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.snapshot = MarketSnapshot([
+            {'symbol': 'NIC', 'lastTradedPrice': 400, 'percentageChange': 2.5, 'totalTradeQuantity': 100},
+            {'symbol': 'NABIL', 'lastTradedPrice': 500, 'percentageChange': -1, 'totalTradeQuantity': 50},
+            {'symbol': 'HDL', 'lastTradedPrice': 1200, 'percentageChange': 4, 'totalTradeQuantity': 10},
+            {'symbol': 'FLAT', 'lastTradedPrice': 90, 'percentageChange': 0},
+            {'symbol': 'DEAD', 'lastTradedPrice': None, 'percentageChange': 9},
+        ], source='live', version=1)
+        self.columns = self.snapshot.columns
+
+    def symbols(self, rows):
+        return [str(self.columns.symbols[row]) for row in rows]
+
+    def test_unpriced_rows_are_dropped(self):
+        self.assertEqual(len(self.snapshot), 4)
+        self.assertNotIn('DEAD', self.snapshot)
+        self.assertEqual(self.snapshot.get('FLAT')['volume'], 0)
+
+    def test_rank(self):
+        self.assertEqual(self.symbols(self.columns.rank()), ['HDL', 'NIC', 'FLAT', 'NABIL'])
+        self.assertEqual(self.symbols(self.columns.rank('ltp', limit=2, descending=False)), ['FLAT', 'NIC'])
+        mask = self.columns.mask(min_volume=50)
+        self.assertEqual(self.symbols(self.columns.rank('volume', mask=mask)), ['NIC', 'NABIL'])
+
+    def test_top_movers(self):
+        self.assertEqual([m['symbol'] for m in self.columns.top_movers(limit=5)], ['HDL', 'NIC'])
+        self.assertEqual([m['symbol'] for m in self.columns.top_movers(gainers=False)], ['NABIL'])
+
+    def test_breadth_and_aggregate(self):
+        self.assertEqual(self.columns.breadth(), {'advances': 2, 'declines': 1, 'unchanged': 1})
+        totals = self.columns.aggregate()
+        self.assertEqual(totals['symbols'], 4)
+        self.assertEqual(totals['total_volume'], 160)
+        self.assertEqual(totals['turnover'], 400 * 100 + 500 * 50 + 1200 * 10)
+        self.assertEqual(totals['median_change'], 1.25)
+
+    def test_pickles_as_one_columnar_copy(self):
+        restored = pickle.loads(pickle.dumps(self.snapshot))
+        self.assertEqual((restored.version, restored.source), (1, 'live'))
+        self.assertEqual(restored.get('NIC'), self.snapshot.get('NIC'))
+        self.assertEqual(self.symbols(restored.columns.rank()), ['HDL', 'NIC', 'FLAT', 'NABIL'])
+
+
+class SnapshotDiffTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def test_changes_and_removals(self):
+        old = live_snapshot(1, {'NIC': 400, 'NABIL': 500, 'GONE': 10})
+        new = live_snapshot(2, {'NIC': 400, 'NABIL': 505, 'NEW': 20})
+
+        changes, removed = compute_changes(old, new)
+        self.assertEqual(changes, [PriceDelta('NABIL', 500.0, 505.0, 0, 0, 0.0, 0.0),
+                                   PriceDelta('NEW', None, 20.0, None, 0, None, 0.0)])
+        self.assertEqual(removed, ['GONE'])
+
+    def test_quiet_polls_leave_no_gaps(self):
+        seen = []
+        engine = DiffEngine(consumers=[seen.append])
+        polls = [{'NIC': 400}, {'NIC': 400}, {'NIC': 401}, {'NIC': 401}, {'NIC': 402}]
+        previous = None
+        for version, prices in enumerate(polls, start=1):
+            snapshot = live_snapshot(version, prices)
+            engine(snapshot, previous)
+            previous = snapshot
+
+        self.assertEqual([diff.seq for diff in seen], [1, 2, 3])
+        self.assertEqual([d['seq'] for d in recent_diffs()], [1, 2, 3])
+
+        response = APIClient().get('/market_data/deltas/', {'since': 2})
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.json()['resync'])
+        self.assertEqual([d['seq'] for d in response.json()['diffs']], [3])
+
+    def test_mock_snapshots_are_not_diffed(self):
+        mock_snapshot = MarketSnapshot([{'symbol': 'NIC', 'lastTradedPrice': 1}], source='mock', version=1)
+        self.assertIsNone(DiffEngine()(mock_snapshot))
+        self.assertEqual(recent_diffs(), [])
+
+
+class IntradayChartViewTests(TestCase):
+
+    def test_bad_days_is_a_client_error(self):
+        for url in ('/market_data/intraday/', '/market_data/async/intraday/'):
+            response = self.client.get(url, {'symbol': 'NIC', 'days': 'abc'})
+            self.assertEqual(response.status_code, 400, url)
+            self.assertEqual(response.json(), {'error': 'days must be a number'})
+
+    def test_days_are_clamped(self):
+        self.assertEqual([chart_days(v) for v in (None, '', '0', '3', '40')], [1, 1, 1, 3, 5])
+
+
+class SingleFlightTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.calls = 0
+
+    def fetch(self, value='fresh', delay=None):
+        def run():
+            self.calls += 1
+            if delay:
+                delay.wait(2)
+            cache.set('key', value, 60)
+            return value
+        return run
+
+    def test_concurrent_misses_share_one_fetch(self):
+        release = threading.Event()
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(shared_cache.single_flight('key', self.fetch(delay=release))))
+            for _ in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        release.set()
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual(results, ['fresh'] * 4)
+        self.assertEqual(self.calls, 1)
+
+    def test_follower_waits_for_another_workers_fetch(self):
+        cache.add(shared_cache.lock_key('key'), 'other-worker', 60)
+        threading.Timer(0.2, lambda: cache.set('key', 'theirs', 60)).start()
+
+        self.assertEqual(shared_cache.single_flight('key', self.fetch()), 'theirs')
+        self.assertEqual(self.calls, 0)
+
+    def test_follower_serves_the_last_value_when_the_leader_stalls(self):
+        cache.set(shared_cache.last_value_key('key'), 'previous', 60)
+        cache.add(shared_cache.lock_key('key'), 'other-worker', 60)
+
+        self.assertEqual(shared_cache.single_flight('key', self.fetch(), wait_timeout=0.1), 'previous')
+        self.assertEqual(self.calls, 0)
+
+    def test_followers_wait_as_long_as_the_lock_is_held(self):
+        self.assertGreaterEqual(shared_cache.follower_wait(), worst_case_request_time())
+        self.assertGreater(shared_cache.lock_timeout(), shared_cache.follower_wait())
+
+
+class CircuitBreakerTests(TestCase):
+
+    def setUp(self):
+        self.now = 1000.0
+        patcher = mock.patch('services.circuit_breaker.time.monotonic', lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.breaker = CircuitBreaker('test', window=4, min_calls=4, failure_rate=0.5, cool_down=30)
+
+    def trip(self):
+        for ok in (True, True, False, False):
+            self.breaker.before_call()
+            if ok:
+                self.breaker.record_success()
+            else:
+                self.breaker.record_failure()
+
+    def test_opens_at_the_failure_rate_once_enough_calls_are_seen(self):
+        for _ in range(3):
+            self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, CLOSED)  # under min_calls
+        self.breaker.reset()
+
+        self.trip()
+        self.assertEqual(self.breaker.state, OPEN)
+        with self.assertRaises(CircuitOpenError) as raised:
+            self.breaker.before_call()
+        self.assertEqual(raised.exception.retry_in, 30)
+        self.assertEqual(self.breaker.to_dict()['rejected_calls'], 1)
+
+    def test_half_open_lets_one_probe_through(self):
+        self.trip()
+        self.now += 30
+        self.assertEqual(self.breaker.state, HALF_OPEN)
+
+        self.breaker.before_call()
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.before_call()  # probe already in flight
+
+    def test_successful_probe_closes_with_a_clean_window(self):
+        self.trip()
+        self.now += 30
+        self.breaker.before_call()
+        self.breaker.record_success()
+
+        self.assertEqual(self.breaker.state, CLOSED)
+        self.assertEqual(self.breaker.to_dict()['recent_failures'], 0)
+
+    def test_failed_probe_reopens_for_another_cool_down(self):
+        self.trip()
+        self.now += 30
+        self.breaker.before_call()
+        self.breaker.record_failure()
+
+        self.assertEqual(self.breaker.state, OPEN)
+        self.now += 29
+        self.assertEqual(self.breaker.state, OPEN)
+        self.now += 1
+        self.assertEqual(self.breaker.state, HALF_OPEN)
+
+
+class StaleWhileRevalidateTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.calls = 0
+        self.refreshes = []
+        executor = mock.Mock(submit=self.refreshes.append)
+        patcher = mock.patch('services.cache._get_refresh_executor', return_value=executor)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def fetch(self, value='fresh'):
+        def run():
+            self.calls += 1
+            return (value, 'live') if value else None
+        return run
+
+    def age(self, seconds):
+        envelope = cache.get('key')
+        envelope['fetched_at'] -= seconds
+        envelope['next_refresh_at'] -= seconds
+        cache.set('key', envelope, 60)
+
+    def run_refreshes(self):
+        # The pool runs these off the request thread
+        for run in self.refreshes:
+            thread = threading.Thread(target=run)
+            thread.start()
+            thread.join(5)
+        self.refreshes.clear()
+
+    def test_miss_fetches_once(self):
+        result = shared_cache.swr_get('key', self.fetch(), 10, 60)
+        self.assertEqual((result.value, result.source, result.stale), ('fresh', 'live', False))
+        shared_cache.swr_get('key', self.fetch(), 10, 60)
+        self.assertEqual(self.calls, 1)
+
+    def test_miss_with_no_upstream_returns_none(self):
+        self.assertIsNone(shared_cache.swr_get('key', self.fetch(None), 10, 60))
+
+    def test_stale_value_is_served_while_one_refresh_runs(self):
+        shared_cache.swr_set('key', 'old', 'live', 10, 60)
+        self.age(15)
+
+        first = shared_cache.swr_get('key', self.fetch('new'), 10, 60)
+        second = shared_cache.swr_get('key', self.fetch('new'), 10, 60)
+        self.assertEqual((first.value, first.stale), ('old', True))
+        self.assertEqual(second.value, 'old')
+        self.assertEqual(len(self.refreshes), 1)  # the refresh lock is held
+        self.assertEqual(self.calls, 0)
+
+        self.run_refreshes()
+        result = shared_cache.swr_get('key', self.fetch('new'), 10, 60)
+        self.assertEqual((result.value, result.stale), ('new', False))
+        self.assertEqual(self.calls, 1)
+
+    def test_failed_refresh_keeps_the_stale_value_and_backs_off(self):
+        shared_cache.swr_set('key', 'old', 'live', 10, 60)
+        self.age(15)
+
+        shared_cache.swr_get('key', self.fetch(None), 10, 60)
+        self.run_refreshes()
+        result = shared_cache.swr_get('key', self.fetch(None), 10, 60)
+
+        self.assertEqual((result.value, result.stale), ('old', True))
+        self.assertEqual(self.refreshes, [])  # next refresh is not due yet
+        self.assertEqual(self.calls, 1)
+
+
+def bar(time, close, volume=10):
+    return {'date': time, 'open': close, 'high': close, 'low': close, 'close': close, 'volume': volume}
+
+
+class CandleStoreTests(TestCase):
+    SESSIONS = {
+        '2026-10-14': [bar('2026-10-14 11:00', 100), bar('2026-10-14 14:00', 101)],
+        '2026-10-15': [bar('2026-10-15 11:00', 102)],
+        '2026-10-16': [bar('2026-10-16 11:00', 103)],
+        '2026-10-18': [bar('2026-10-18 11:00', 104), bar('2026-10-18 11:01', 105)],
+    }
+
+    def setUp(self):
+        cache.clear()
+        self.requests = []
+        patcher = mock.patch('services.candle_store.today', return_value='2026-10-18')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def fetch(self, days):
+        self.requests.append(days)
+        # Upstream hands back every bar of the last `days` sessions, unsorted
+        rows = [row for day in sorted(self.SESSIONS)[-days:] for row in self.SESSIONS[day]]
+        return list(reversed(rows))
+
+    def window(self, days):
+        result = CandleStore.get_window('NIC', days, self.fetch, 60, 600)
+        return [candle['close'] for candle in result.value]
+
+    def test_merge_appends_and_revises_the_forming_bar(self):
+        candles, _ = merge_bars([], [bar('2026-10-18 11:00', 104)])
+        candles, added = merge_bars(candles, [
+            bar('2026-10-18 10:59', 99), bar('2026-10-18 11:01', 106), bar('2026-10-18 11:00', 105),
+        ])
+        self.assertEqual(added, 2)
+        self.assertEqual([(c['time'][-5:], c['close']) for c in candles], [('11:00', 105.0), ('11:01', 106.0)])
+
+    def test_window_backfills_once_and_shares_frozen_sessions(self):
+        self.assertEqual(self.window(3), [102.0, 103.0, 104.0, 105.0])
+        self.assertEqual(self.requests, [1, 3])
+        self.assertEqual(cache.get(sessions_key('NIC')), ['2026-10-15', '2026-10-16'])
+
+        self.assertEqual(self.window(2), [103.0, 104.0, 105.0])
+        self.assertEqual(self.window(1), [104.0, 105.0])
+        self.assertEqual(self.requests, [1, 3])  # served from the cached segments
+
+    def test_finished_session_is_frozen_when_the_next_one_starts(self):
+        candles, _ = merge_bars([], [bar('2026-10-16 11:00', 103)])
+        shared_cache.swr_set(live_key('NIC'), {'day': '2026-10-16', 'candles': candles}, 'live', 60, 600)
+
+        live, source = CandleStore._refresh_live('NIC', lambda days: [bar('2026-10-18 11:00', 104)])
+        self.assertEqual((live['day'], source), ('2026-10-18', 'live'))
+        self.assertEqual([c['close'] for c in cache.get(segment_key('NIC', '2026-10-16'))], [103.0])
+        self.assertEqual(cache.get(sessions_key('NIC')), ['2026-10-16'])
+
+
+class UpsertStocksTests(TradingTestCase):
+
+    def test_counts(self):
+        result = upsert_stocks([
+            {'symbol': 'NIC', 'current_price': '400.004'},  # same once rounded to the column
+            {'symbol': 'NABIL', 'current_price': 505},
+            {'symbol': 'HDL', 'current_price': 1200, 'name': 'Himalayan Distillery'},
+            {'current_price': 1},  # no symbol
+        ])
+
+        self.assertEqual(result[:4], (1, 1, 1, 0))
+        self.assertEqual(sorted(result.repriced), ['HDL', 'NABIL'])
+        self.assertEqual(Stock.objects.get(symbol='NABIL').current_price, Decimal('505.00'))
+        self.assertEqual(Stock.objects.get(symbol='HDL').name, 'Himalayan Distillery')
+
+    def test_missing_fields_are_left_alone(self):
+        upsert_stocks([{'symbol': 'NIC', 'current_price': 410, 'sector': ''}])
+
+        self.nic.refresh_from_db()
+        self.assertEqual((self.nic.name, self.nic.current_price), ('NIC Asia Bank', Decimal('410.00')))
+
+    def test_unknown_symbols_are_skipped_without_create(self):
+        result = upsert_stocks([{'symbol': 'HDL', 'current_price': 1200}, {'symbol': 'NIC', 'current_price': 400}],
+                               create=False)
+
+        self.assertEqual(result[:4], (0, 0, 1, 1))
+        self.assertFalse(Stock.objects.filter(symbol='HDL').exists())
+
+    def test_batches_give_the_same_counts(self):
+        rows = [{'symbol': f'S{i}', 'current_price': i + 1} for i in range(7)]
+        self.assertEqual(upsert_stocks(rows, batch_size=3).created, 7)
+
+        rows[0]['current_price'] = 50
+        self.assertEqual(upsert_stocks(rows, batch_size=3)[:3], (0, 1, 6))
+
+
+class TradeHistoryPaginationTests(TradingTestCase):
+
+    def setUp(self):
+        super().setUp()
+        start = timezone.now() - timedelta(days=1)
+        # Oldest first; the middle two share a timestamp so id breaks the tie
+        offsets = [0, 1, 2, 2, 3]
+        self.trades = []
+        for offset in offsets:
+            trade = Trade.objects.create(
+                user=self.user, stock=self.nic, order_type=Trade.OrderType.BUY,
+                quantity=1, price_per_share=Decimal('400.00'), total_amount=Decimal('400.00'),
+            )
+            Trade.objects.filter(pk=trade.pk).update(timestamp=start + timedelta(minutes=offset))
+            trade.refresh_from_db()
+            self.trades.append(trade)
+        self.newest_first = [t.id for t in reversed(self.trades)]
+
+    def test_cursor_round_trip(self):
+        trade = self.trades[2]
+        self.assertEqual(decode_cursor(encode_cursor(trade, PREV)), (trade.timestamp, trade.id, PREV))
+
+        bad = [
+            'not-a-cursor!',
+            base64.urlsafe_b64encode(b'{"a": 1}').decode(),
+            base64.urlsafe_b64encode(b'["2026-10-18T00:00:00+00:00", 1, "sideways"]').decode(),
+            base64.urlsafe_b64encode(b'["yesterday", 1, "next"]').decode(),
+        ]
+        for token in bad:
+            with self.assertRaises(PaginationError, msg=token):
+                decode_cursor(token)
+
+    def test_walks_every_row_once_across_tied_timestamps(self):
+        seen, cursor, pages = [], None, 0
+        while True:
+            items, cursor, prev_cursor = paginate_newest_first(Trade.objects.all(), cursor, limit=2)
+            self.assertEqual(prev_cursor is None, pages == 0)
+            seen += [t.id for t in items]
+            pages += 1
+            if cursor is None:
+                break
+        self.assertEqual(seen, self.newest_first)
+        self.assertEqual(pages, 3)
+
+    def test_prev_cursor_returns_the_page_before(self):
+        first, next_cursor, _ = paginate_newest_first(Trade.objects.all(), limit=2)
+        second, _, prev_cursor = paginate_newest_first(Trade.objects.all(), next_cursor, limit=2)
+        back, forward_cursor, back_cursor = paginate_newest_first(Trade.objects.all(), prev_cursor, limit=2)
+
+        self.assertEqual([t.id for t in second], self.newest_first[2:4])
+        self.assertEqual([t.id for t in back], [t.id for t in first])
+        self.assertIsNone(back_cursor)
+        self.assertEqual(decode_cursor(forward_cursor)[1:], (first[-1].id, NEXT))
+
+    def test_history_view_pages_and_rejects_bad_cursors(self):
+        # A fresh user, as each request gets, so the portfolio's counter is current
+        self.client.force_authenticate(CustomUser.objects.get(pk=self.user.pk))
+        response = self.client.get('/trading/history/', {'limit': 3, 'include_total': 'true'})
+        self.assertEqual([t['id'] for t in response.data['trades']], self.newest_first[:3])
+        self.assertEqual(response.data['pagination']['total'], 5)
+
+        response = self.client.get('/trading/history/', {'cursor': response.data['pagination']['next_cursor']})
+        self.assertEqual([t['id'] for t in response.data['trades']], self.newest_first[3:])
+        self.assertIsNone(response.data['pagination']['next_cursor'])
+
+        response = self.client.get('/trading/history/', {'cursor': 'garbage'})
+        self.assertEqual(response.status_code, 400)
+
+
+class PartitionTradesTests(TestCase):
+
+    def command(self, existing=()):
+        """The command in dry-run mode, reporting `existing` as the current partitions"""
+        command = partition_trades.Command(stdout=StringIO())
+        command.dry_run = True
+        command.fetch = lambda sql, params=None: [(name,) for name in existing]
+        return command
+
+    def test_month_helpers(self):
+        self.assertEqual(partition_trades.month_start(datetime(2026, 10, 18, 9, 30)),
+                         datetime(2026, 10, 1, tzinfo=dt_timezone.utc))
+        self.assertEqual(partition_trades.next_month(datetime(2026, 12, 1)), datetime(2027, 1, 1, tzinfo=dt_timezone.utc))
+        self.assertEqual(partition_trades.partition_name(datetime(2027, 1, 1)), 'trading_trade_p2027_01')
+
+    def test_only_missing_partitions_are_created(self):
+        command = self.command(existing=['trading_trade_p2026_11', 'trading_trade_default'])
+        created = command.ensure_partitions(datetime(2026, 12, 5, tzinfo=dt_timezone.utc), 1,
+                                            since=datetime(2026, 10, 20, tzinfo=dt_timezone.utc))
+
+        sql = command.stdout.getvalue().splitlines()
+        self.assertEqual(created, 3)
+        self.assertEqual([line.split('"')[1] for line in sql],
+                         ['trading_trade_p2026_10', 'trading_trade_p2026_12', 'trading_trade_p2027_01'])
+        self.assertIn("FROM ('2026-12-01T00:00:00+00:00') TO ('2027-01-01T00:00:00+00:00')", sql[1])
+
+    def test_default_partition_is_added_when_missing(self):
+        command = self.command(existing=['trading_trade_p2026_10'])
+        self.assertEqual(command.ensure_partitions(datetime(2026, 10, 18, tzinfo=dt_timezone.utc), 0), 0)
+        self.assertIn('"trading_trade_default" PARTITION OF "trading_trade" DEFAULT', command.stdout.getvalue())
+
+    @unittest.skipIf(connection.vendor == 'postgresql', 'checks the refusal on other databases')
+    def test_refuses_without_postgres(self):
+        with self.assertRaisesMessage(CommandError, 'needs PostgreSQL'):
+            call_command('partition_trades', '--dry-run')
+
+
+class ExportTests(TradingTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.market(price=100)
+        self.client.post('/trading/buy/', {'symbol': 'NIC', 'quantity': 10}, format='json')
+        self.market(price=120)
+        self.client.post('/trading/sell/', {'symbol': 'NIC', 'quantity': 4}, format='json')
+
+    def export(self, path, **params):
+        response = self.client.get(f'/trading/export/{path}/', params)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content)
+
+    def test_trades_csv(self):
+        response, body = self.export('trades')
+
+        rows = list(csv.reader(body.decode().splitlines()))
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertEqual(rows[0], list(export_views.TradeExportView.columns))
+        self.assertEqual([(row[2], row[3], row[4]) for row in rows[1:]], [('NIC', 'BUY', '10'), ('NIC', 'SELL', '4')])
+
+    def test_gzip_wraps_the_same_body(self):
+        Stock.objects.filter(pk=self.nic.pk).update(current_price=Decimal('130.00'))
+        _, plain = self.export('holdings', output='ndjson')
+        response, body = self.export('holdings', output='ndjson', gzip='true')
+
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertTrue(response['Content-Disposition'].endswith('.ndjson.gz"'))
+        self.assertEqual(gzip.decompress(body), plain)
+        holding = json.loads(plain)
+        self.assertEqual((holding['symbol'], holding['quantity'], holding['profit_loss']), ('NIC', 6, '180.00'))
+
+    def test_realized_pnl(self):
+        _, body = self.export('realized-pnl', output='ndjson')
+
+        gain = json.loads(body)
+        self.assertEqual((gain['quantity'], gain['sell_price'], gain['cost_per_share']), (4, '120.00', '100.00'))
+        self.assertEqual(gain['realized_pnl'], '80.00')
+
+    def test_body_is_flushed_in_pieces(self):
+        lines = [f'{i:04}\n' for i in range(100)]
+        with mock.patch.object(export_views, 'FLUSH_BYTES', 64):
+            plain = list(export_views._body(iter(lines), compress=False))
+            compressed = list(export_views._body(iter(lines), compress=True))
+
+        self.assertGreater(len(plain), 1)
+        self.assertTrue(all(len(piece) <= 64 + 5 for piece in plain))
+        self.assertEqual(b''.join(plain), ''.join(lines).encode())
+        self.assertEqual(gzip.decompress(b''.join(compressed)), b''.join(plain))
+
+    def test_unknown_output(self):
+        response = self.client.get('/trading/export/trades/', {'output': 'xml'})
+        self.assertEqual(response.status_code, 400)
+
+
+class StandinServerTests(TestCase):
+
+    def setUp(self):
+        self.server = StandinServer(port=0, symbols=12, seed=1, tick_interval=60).start()
+        self.addCleanup(self.server.stop)
+        self.session = requests.Session()
+        self.addCleanup(self.session.close)
+
+    def get(self, path, **params):
+        return self.session.get(self.server.address + path, params=params, timeout=5)
+
+    def control(self, **changes):
+        return self.session.post(self.server.address + '/_standin', json=changes, timeout=5)
+
+    def test_serves_the_upstream_payloads(self):
+        rows = self.get('/LiveMarket').json()
+        self.assertEqual([row['symbol'] for row in rows[:1] + rows[-2:]], ['NABIL', 'SYN001', 'SYN002'])
+        self.assertEqual(len(MarketSnapshot(rows, version=0)), 12)
+        self.assertEqual(self.get('/IsNepseOpen').json()['isOpen'], 'OPEN')
+        self.assertTrue(self.get('/stockIntraday', symbol='nic', days=2).json())
+        self.assertEqual(self.get('/stockIntraday', symbol='NOPE').status_code, 404)
+        self.assertEqual(self.get('/Nope').status_code, 404)
+
+    def test_runtime_changes_are_validated_before_any_apply(self):
+        for changes in ({'error_rate': 2}, {'error_status': 200}, {'state': 'OPEN', 'latency': 'slow'}, {'symbols': 5}):
+            response = self.control(**changes)
+            self.assertEqual(response.status_code, 400, changes)
+        state = self.control().json()
+        self.assertEqual((state['state'], state['latency'], state['error_rate']), ('OPEN', 'fixed:0', 0.0))
+
+        self.assertEqual(self.control(state='HALT', latency='uniform:1:2').status_code, 200)
+        self.assertEqual(self.get('/IsNepseOpen').json()['isOpen'], 'HALT')
+
+    def test_injected_failures_are_counted(self):
+        self.control(error_rate=1, error_status=502)
+
+        self.assertEqual(self.get('/LiveMarket').status_code, 502)
+        self.assertEqual(self.get('/Summary').status_code, 502)
+        self.assertEqual(self.control().json()['injected_errors'], 2)
+
+
+class NepseHttpTests(TestCase):
+    """The upstream HTTP clients against a local stand-in"""
+
+    def setUp(self):
+        self.standin = StandinServer(port=0, symbols=5, seed=1, tick_interval=60).start()
+        self.addCleanup(self.standin.stop)
+        config = {**settings.NEPSE_API, 'BASE_URL': self.standin.address, 'BACKOFF_FACTOR': 0, 'BACKOFF_JITTER': 0}
+        self.enterContext(override_settings(NEPSE_API=config))
+        self.enterContext(mock.patch.object(nepse_http, '_session', None))  # built for this config
+        self.addCleanup(get_breaker('/LiveMarket').reset)
+
+    def test_calls_share_one_session(self):
+        session = nepse_http.get_session()
+        self.assertEqual(len(nepse_get('/LiveMarket').json()), 5)
+        self.assertEqual(nepse_get('/IsNepseOpen').status_code, 200)
+        self.assertIs(nepse_http.get_session(), session)
+
+    def test_gateway_errors_are_retried_then_handed_back(self):
+        self.standin.update(error_rate=1, error_status=503)
+
+        response = nepse_get('/LiveMarket')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(self.standin.requests, settings.NEPSE_API['MAX_RETRIES'] + 1)
+
+    def test_client_errors_are_not_retried(self):
+        self.assertEqual(nepse_get('/Nope').status_code, 404)
+        self.assertEqual(self.standin.requests, 1)
+
+    def aget(self, path, **params):
+        async def fetch():
+            try:
+                return await nepse_http.anepse_get(path, params)
+            finally:
+                await nepse_http.get_async_client().aclose()
+        return asyncio.run(fetch())
+
+    def test_async_get(self):
+        response = self.aget('/stockIntraday', symbol='NIC', days=None)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json())
+
+    def test_async_get_retries_like_the_session(self):
+        self.standin.update(error_rate=1, error_status=502)
+
+        self.assertEqual(self.aget('/LiveMarket').status_code, 502)
+        self.assertEqual(self.standin.requests, settings.NEPSE_API['MAX_RETRIES'] + 1)
@@ -3,8 +3,10 @@ from django.urls import path
 from . import views
 from .api.portfolio_views import (
     PortfolioDashboardView, PortfolioPerformanceView,
-    HoldingDetailView
+    HoldingDetailView, PortfolioAtView
 )
+from .api.export_views import TradeExportView, HoldingExportView, RealizedPnLExportView
+from .api.order_views import OrderListView, OrderCancelView, BasketOrderView
 
 urlpatterns = [
     path("", views.index, name="index"),
@@ -19,5 +21,14 @@ urlpatterns = [
     
     path('portfolio/dashboard/', PortfolioDashboardView.as_view(), name='portfolio-dashboard'),
     path('portfolio/performance/', PortfolioPerformanceView.as_view(), name='portfolio-performance'),
+    path('portfolio/at/', PortfolioAtView.as_view(), name='portfolio-at'),
     path('holdings/<str:symbol>/', HoldingDetailView.as_view(), name='holding-detail'),
+    
+    path('orders/', OrderListView.as_view(), name='orders'),
+    path('orders/<int:order_id>/', OrderCancelView.as_view(), name='order-cancel'),
+    path('basket/', BasketOrderView.as_view(), name='basket'),
+    
+    path('export/trades/', TradeExportView.as_view(), name='export-trades'),
+    path('export/holdings/', HoldingExportView.as_view(), name='export-holdings'),
+    path('export/realized-pnl/', RealizedPnLExportView.as_view(), name='export-realized-pnl'),
 ]
\ No newline at end of file
@@ -1,5 +1,4 @@
 from django.http import HttpResponse
-from django.db import transaction
 from django.utils import timezone
 from django.conf import settings
 from .models import Stock, Portfolio, Trade, Holding
@@ -9,8 +8,13 @@ from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.permissions import IsAuthenticated
 from decimal import Decimal
-from datetime import datetime
+from datetime import datetime, timedelta
+from django.utils.dateparse import parse_date
+from .pagination import page_size, paginate_newest_first, PaginationError
+from .idempotency import idempotent
 from .utils import update_holdings_after_buy, can_user_afford, validate_buy_order
+from .services.order_execution import execute_buy, execute_sell, OrderRejected
+from .services.opening_batch import queue_market_order
 from services.nepse_client import NepseClient
 import logging
 import pytz
@@ -40,48 +44,22 @@ class StockListView(APIView):
         # FIXED: Use 'is_open' instead of 'isOpen'
         if market_status and market_status.get('is_open'):  # <-- CHANGED HERE
             logger.info("Market is OPEN - fetching live prices")
-            live_data = NepseClient.get_live_prices()
+            snapshot = NepseClient.get_snapshot()
             
-            # DEBUG: Log what we got
-            logger.info(f"Got live_data: {type(live_data)} with {len(live_data) if live_data else 0} items")
+            logger.info(f"Got snapshot v{snapshot.version} ({snapshot.source}) with {len(snapshot)} quotes")
             
-            if live_data and len(live_data) > 0:
-                # Log first item to verify data
-                if len(live_data) > 0:
-                    logger.info(f"Sample item: {live_data[0]}")
-                
-                # Create price map from live data
-                price_map = {}
-                for item in live_data:
-                    symbol = item.get('symbol')
-                    price = item.get('lastTradedPrice')
-                    
-                    # Get change - your test shows it's 'percentageChange'
-                    change = item.get('percentageChange', 0)
-                    
-                    if symbol and price is not None:
-                        try:
-                            price_map[symbol] = {
-                                'price': float(price),
-                                'change': float(change) if change not in (None, 0, '0') else 0,
-                                'high': float(item.get('highPrice')) if item.get('highPrice') else None,
-                                'low': float(item.get('lowPrice')) if item.get('lowPrice') else None,
-                                'volume': item.get('totalTradeQuantity', 0)
-                            }
-                        except (ValueError, TypeError) as e:
-                            logger.error(f"Error parsing {symbol}: {e}")
-                            price_map[symbol] = {
-                                'price': float(price),
-                                'change': 0,
-                                'high': None,
-                                'low': None,
-                                'volume': 0
-                            }
-                
-                logger.info(f"Built price_map with {len(price_map)} stocks")
+            if len(snapshot) > 0:
+                # Resolve every DB symbol to its snapshot row in one pass,
+                # then read plain lists instead of per-stock quote dicts
+                columns = snapshot.columns
+                stock_list = list(stocks)
+                rows = columns.rows_for([stock.symbol for stock in stock_list]).tolist()
+                ltp, change, high, low, volume = columns.as_lists(
+                    'ltp', 'pct_change', 'high', 'low', 'volume'
+                )
                 
                 # Build stock data with live prices
-                for stock in stocks:
+                for stock, row in zip(stock_list, rows):
                     stock_dict = {
                         'id': stock.id,
                         'symbol': stock.symbol,
@@ -90,13 +68,13 @@ class StockListView(APIView):
                     }
                     
                     # Use live price if available
-                    if stock.symbol in price_map:
-                        stock_dict['current_price'] = price_map[stock.symbol]['price']
-                        stock_dict['change'] = price_map[stock.symbol]['change']
-                        stock_dict['high'] = price_map[stock.symbol]['high']
-                        stock_dict['low'] = price_map[stock.symbol]['low']
-                        stock_dict['volume'] = price_map[stock.symbol]['volume']
-                        stock_dict['price_source'] = 'live'
+                    if row >= 0:
+                        stock_dict['current_price'] = ltp[row]
+                        stock_dict['change'] = change[row]
+                        stock_dict['high'] = high[row]
+                        stock_dict['low'] = low[row]
+                        stock_dict['volume'] = volume[row]
+                        stock_dict['price_source'] = snapshot.source
                     else:
                         # Fallback to database price
                         stock_dict['current_price'] = float(stock.current_price) if stock.current_price else 0
@@ -226,6 +204,16 @@ class HoldingsListView(APIView):
         })
         
 
+def queued_order_response(order):
+    return Response({
+        "success": True,
+        "message": (f"Market is currently closed. Your order to {order.side.lower()} {order.quantity} shares "
+                    f"of {order.stock.symbol} is queued and will execute at the market open."),
+        "market_hours": "NEPSE: Sunday-Thursday, 11:00 AM - 3:00 PM NPT",
+        "order": order.to_dict()
+    }, status=status.HTTP_202_ACCEPTED)
+
+
 class BuyOrderView(APIView):
     """
     POST: Place a buy order
@@ -234,7 +222,7 @@ class BuyOrderView(APIView):
     """
     permission_classes = [IsAuthenticated]
     
-    @transaction.atomic  # CRITICAL: All or nothing
+    @idempotent
     def post(self, request):
         user = request.user
         
@@ -263,9 +251,20 @@ class BuyOrderView(APIView):
         # === STEP 2: CHECK MARKET HOURS ===
         market_status = NepseClient.get_market_status()
         
+        # Closed: queue for the open instead of turning the user away
+        if market_status and market_status.get('is_closed'):
+            stock = Stock.objects.filter(symbol=symbol).first()
+            if stock is None:
+                return Response({
+                    "error": f"Stock with symbol '{symbol}' not found in our database",
+                    "suggestion": "Please check the symbol or sync stocks first"
+                }, status=status.HTTP_404_NOT_FOUND)
+            order = queue_market_order(user, stock, Trade.OrderType.BUY, quantity)
+            return queued_order_response(order)
+        
         if market_status and not market_status.get('is_open', False):
             return Response({
-                "warning": "Market is currently closed. Order will be processed when market opens.",
+                "warning": market_status.get('message') or "Market is not open for trading.",
                 "market_hours": "NEPSE: Sunday-Thursday, 11:00 AM - 3:00 PM NPT"
             }, status=status.HTTP_400_BAD_REQUEST)
         
@@ -274,7 +273,8 @@ class BuyOrderView(APIView):
             # Try to get live price from NEPSE API
             price_data = NepseClient.get_stock_price(symbol)
             
-            if price_data and price_data.get('price'):
+            # Simulated quotes are for display only; orders fill at a live price or the stored one
+            if price_data and price_data.get('source') == 'live' and price_data.get('price'):
                 # Convert to Decimal to avoid type issues
                 current_price = Decimal(str(price_data['price']))
                 price_source = 'nepse_api_live'
@@ -320,157 +320,72 @@ class BuyOrderView(APIView):
             stock.current_price = current_price
             stock.save()
         
-        # === STEP 5: Calculate cost and check balance ===
-        total_cost = current_price * quantity  # This will be Decimal if current_price is Decimal
-        
-        # Get user's portfolio (created automatically via signal)
-        portfolio = user.portfolio
-        
-        # Compare Decimal with Decimal
-        if portfolio.cash_balance < total_cost:
-            return Response({
-                "error": "Insufficient balance",
-                "required": float(total_cost),
-                "available": float(portfolio.cash_balance),
-                "short_by": float(total_cost - portfolio.cash_balance)
-            }, status=status.HTTP_400_BAD_REQUEST)
-        
-        # === STEP 6: Execute the buy order (ALL DATABASE UPDATES INSIDE TRANSACTION) ===
+        # === STEP 5: Execute the buy order ===
+        # Everything above ran outside the transaction; execute_buy locks the
+        # portfolio and holding only for the database writes
         try:
-            # 6.1 Create trade record
-            trade = Trade.objects.create(
-                user=user,
-                stock=stock,
-                quantity=quantity,
-                price_per_share=current_price,
-                order_type=Trade.OrderType.BUY,
-                total_amount=total_cost,
-                # price_source=price_source  # Uncomment if you add this field to Trade model
-            )
-            
-            # 6.2 Update portfolio cash balance
-            portfolio.cash_balance -= total_cost
-            portfolio.save()
-            
-            # 6.3 Update holdings (CREATE or UPDATE)
-            holding, is_new_holding = self.update_holdings_after_buy(
-                user=user,
-                stock=stock,
-                quantity=quantity,
-                price_per_share=current_price
-            )
-            
-            # === STEP 7: Calculate updated portfolio summary ===
-            total_invested = self.calculate_total_invested(user)
-            total_current_value = self.calculate_current_portfolio_value(user)
-            
-            # === STEP 8: Prepare success response ===
-            response_data = {
-                "success": True,
-                "message": f"Successfully bought {quantity} shares of {symbol}",
-                "price_info": {
-                    "price_per_share": float(current_price),
-                    "total_cost": float(total_cost),
-                    "price_source": price_source,
-                    "price_change_percent": price_change,
-                    "timestamp": trade.timestamp.isoformat()
-                },
-                "trade_details": {
-                    "trade_id": trade.id,
-                    "symbol": symbol,
-                    "quantity": quantity,
-                    "order_type": "BUY"
-                },
-                "portfolio_update": {
-                    "new_balance": float(portfolio.cash_balance),
-                    "total_invested": float(total_invested),
-                    "total_portfolio_value": float(total_current_value),
-                    "total_profit_loss": float(total_current_value - total_invested)
-                },
-                "holding_update": {
-                    "is_new_holding": is_new_holding,
-                    "total_shares_owned": holding.quantity,
-                    "average_price": float(holding.average_buy_price),
-                    "current_value": float(holding.quantity * current_price),
-                    "unrealized_profit_loss": float(
-                        (holding.quantity * current_price) - holding.total_invested
-                    )
-                }
-            }
-            
-            # Add warning if price came from cache
-            if price_source in ['database_cache', 'database_fallback']:
-                response_data["warning"] = "Price may be delayed. Using last known price from database."
-            
-            return Response(response_data, status=status.HTTP_201_CREATED)
-            
+            execution = execute_buy(user, stock, quantity, current_price, price_source)
+        except OrderRejected as e:
+            return Response(e.to_response(), status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
-            # If anything fails, the transaction rolls back automatically
+            # The transaction has rolled back; nothing was written
             logger.error(f"Buy order failed for user {user.id}, stock {symbol}: {str(e)}")
             return Response({
                 "error": "Trade failed due to server error",
                 "detail": str(e) if settings.DEBUG else "Please try again later"
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-    
-    def update_holdings_after_buy(self, user, stock, quantity, price_per_share):
-        """
-        Helper method to update holdings after a buy order
-        Returns: (holding_object, is_new_holding)
-        """
-        # Ensure price_per_share is Decimal
-        if not isinstance(price_per_share, Decimal):
-            price_per_share = Decimal(str(price_per_share))
-            
-        total_cost = price_per_share * quantity
         
-        try:
-            # Try to get existing holding
-            holding = Holding.objects.get(user=user, stock=stock)
-            
-            # Calculate new values
-            new_quantity = holding.quantity + quantity
-            new_total_invested = holding.total_invested + total_cost
-            new_avg_price = new_total_invested / new_quantity
-            
-            # Update only the database fields (not properties)
-            holding.quantity = new_quantity
-            holding.average_buy_price = new_avg_price
-            holding.total_invested = new_total_invested
-            # REMOVED: holding.current_value = ... (this is likely a property)
-            # REMOVED: holding.profit_loss = ... (this is likely a property)
-            holding.save()
-            
-            return holding, False
-            
-        except Holding.DoesNotExist:
-            # Create new holding - only set database fields
-            holding = Holding.objects.create(
-                user=user,
-                stock=stock,
-                quantity=quantity,
-                average_buy_price=price_per_share,
-                total_invested=total_cost,
-                # REMOVED: current_value and profit_loss as they're likely properties
-            )
-            return holding, True
-    
-    def calculate_total_invested(self, user):
-        """Calculate total money invested across all holdings"""
-        holdings = Holding.objects.filter(user=user)
-        return sum(holding.total_invested for holding in holdings)
-    
-    def calculate_current_portfolio_value(self, user):
-        """Calculate current value of all holdings + cash"""
-        holdings_value = Decimal('0')
-        for holding in Holding.objects.filter(user=user):
-            # Use current stock price to calculate current value
-            holdings_value += holding.quantity * holding.stock.current_price
-        
-        return user.portfolio.cash_balance + holdings_value
+        trade, portfolio, holding = execution.trade, execution.portfolio, execution.holding
+        is_new_holding = execution.is_new_holding
+        total_cost = trade.total_amount
+        
+        # === STEP 6: Portfolio summary from the maintained totals ===
+        total_invested = portfolio.total_invested
+        stock_value = portfolio.get_total_stock_value()
+        
+        # === STEP 7: Prepare success response ===
+        response_data = {
+            "success": True,
+            "message": f"Successfully bought {quantity} shares of {symbol}",
+            "price_info": {
+                "price_per_share": float(current_price),
+                "total_cost": float(total_cost),
+                "price_source": price_source,
+                "price_change_percent": price_change,
+                "timestamp": trade.timestamp.isoformat()
+            },
+            "trade_details": {
+                "trade_id": trade.id,
+                "symbol": symbol,
+                "quantity": quantity,
+                "order_type": "BUY"
+            },
+            "portfolio_update": {
+                "new_balance": float(portfolio.cash_balance),
+                "total_invested": float(total_invested),
+                "total_portfolio_value": float(portfolio.cash_balance + stock_value),
+                "total_profit_loss": float(stock_value - total_invested)
+            },
+            "holding_update": {
+                "is_new_holding": is_new_holding,
+                "total_shares_owned": holding.quantity,
+                "average_price": float(holding.average_buy_price),
+                "current_value": float(holding.quantity * current_price),
+                "unrealized_profit_loss": float(
+                    (holding.quantity * current_price) - holding.total_invested
+                )
+            }
+        }
+        
+        # Add warning if price came from cache
+        if price_source in ['database_cache', 'database_fallback']:
+            response_data["warning"] = "Price may be delayed. Using last known price from database."
+        
+        return Response(response_data, status=status.HTTP_201_CREATED)
 class SellOrderView(APIView):
     permission_classes = [IsAuthenticated]
     
-    @transaction.atomic
+    @idempotent
     def post(self, request):
         user = request.user
         symbol = request.data.get('symbol', '').upper()
@@ -483,9 +398,9 @@ class SellOrderView(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Check if user owns this stock FIRST
+        # Check if user owns this stock FIRST (re-checked under lock on execution)
         try:
-            holding = Holding.objects.get(
+            holding = Holding.objects.select_related('stock').get(
                 user=user, 
                 stock__symbol=symbol
             )
@@ -504,58 +419,51 @@ class SellOrderView(APIView):
         # ========== THEN CHECK MARKET HOURS ==========
         market_status = NepseClient.get_market_status()
         
-        # If market is explicitly closed, block the trade
-        if market_status and not market_status.get('isOpen', False):
+        # Closed: queue for the open; halted or unknown: block the trade
+        if market_status and market_status.get('is_closed'):
+            order = queue_market_order(user, holding.stock, Trade.OrderType.SELL, quantity)
+            return queued_order_response(order)
+        
+        if market_status and not market_status.get('is_open', False):
             return Response({
-                "warning": "Market is currently closed. Orders can only be placed during market hours.",
-                "market_hours": market_status.get('marketHours', "NEPSE: Sunday-Thursday, 11:00 AM - 3:00 PM NPT"),
-                "current_time": market_status.get('currentTime')
+                "warning": market_status.get('message') or "Market is not open for trading.",
+                "market_hours": market_status.get('market_hours', "NEPSE: Sunday-Thursday, 11:00 AM - 3:00 PM NPT"),
+                "current_time": market_status.get('current_time')
             }, status=status.HTTP_400_BAD_REQUEST)
         
         # ========== GET CURRENT PRICE ==========
         # Try to get live price, fallback to database price
         price_data = NepseClient.get_stock_price(symbol)
         
-        if price_data and price_data.get('price'):
-            current_price = price_data['price']
+        # Simulated quotes are for display only; orders fill at a live price or the stored one
+        if price_data and price_data.get('source') == 'live' and price_data.get('price'):
+            current_price = Decimal(str(price_data['price']))
             price_source = 'live'
         else:
             # Fallback to database price
-            stock = holding.stock
-            current_price = stock.current_price
+            current_price = holding.stock.current_price
             price_source = 'database'
             logger.warning(f"Using database price for sell order: {symbol}")
         
-        total_value = current_price * quantity
-        
-        # ========== CREATE SELL TRADE ==========
-        trade = Trade.objects.create(
-            user=user,
-            stock=holding.stock,
-            quantity=quantity,
-            price_per_share=current_price,
-            order_type=Trade.OrderType.SELL,
-            total_amount=total_value
+        # ========== EXECUTE: HOLDING, CASH AND TRADE IN ONE TRANSACTION ==========
+        try:
+            execution = execute_sell(
+                user, holding.stock, quantity, current_price,
+                'nepse_api_live' if price_source == 'live' else 'database_cache'
+            )
+        except OrderRejected as e:
+            return Response(e.to_response(), status=status.HTTP_400_BAD_REQUEST)
+        trade, portfolio, updated_holding, gains = (
+            execution.trade, execution.portfolio, execution.holding, execution.gains
         )
-        
-        # ========== UPDATE HOLDINGS ==========
-        holding.update_after_sell(quantity, current_price)
-        
-        # ========== UPDATE CASH BALANCE ==========
-        portfolio = user.portfolio
-        portfolio.cash_balance += total_value
-        portfolio.save()
+        total_value = trade.total_amount
         
         # ========== CHECK IF HOLDING STILL EXISTS ==========
-        try:
-            updated_holding = Holding.objects.get(
-                user=user, 
-                stock__symbol=symbol
-            )
+        if updated_holding is not None:
             remaining_shares = updated_holding.quantity
             new_avg_price = float(updated_holding.average_buy_price)
             new_total_invested = float(updated_holding.total_invested)
-        except Holding.DoesNotExist:
+        else:
             remaining_shares = 0
             new_avg_price = 0
             new_total_invested = 0
@@ -575,6 +483,8 @@ class SellOrderView(APIView):
                 "remaining_shares": remaining_shares,
                 "new_average_price": new_avg_price,
                 "total_invested_remaining": new_total_invested,
+                "cost_basis": float(sum(gain.cost_basis for gain in gains)),
+                "realized_profit_loss": float(sum(gain.realized_pnl for gain in gains)),
                 "trade_id": trade.id,
                 "timestamp": trade.timestamp.isoformat()
             }
@@ -592,32 +502,30 @@ class SellOrderView(APIView):
         
 class TradeHistoryView(APIView):
     """
-    Get user's trade history
+    Get user's trade history, newest first, one page at a time
     GET /api/trading/history/
-    Optional query params: ?limit=10&page=1
+    Optional query params:
+        ?limit=50 (max 200)  ?cursor=<next_cursor or prev_cursor>
+        ?symbol=NABIL  ?order_type=BUY|SELL  ?from=2026-01-01  ?to=2026-01-31
+        ?include_total=true (unfiltered total, from Portfolio.total_trades)
     """
     permission_classes = [IsAuthenticated]
     
     def get(self, request):
         user = request.user
         
-        # Get query parameters for pagination
-        limit = int(request.GET.get('limit', 50))
-        page = int(request.GET.get('page', 1))
-        offset = (page - 1) * limit
-        
-        # Get trades ordered by most recent
-        trades = Trade.objects.filter(user=user)\
-            .select_related('stock')\
-            .order_by('-timestamp')
-        
-        # Apply pagination
-        total_trades = trades.count()
-        paginated_trades = trades[offset:offset + limit]
+        try:
+            limit = page_size(request.GET.get('limit'))
+            trades = self.filter_trades(request, Trade.objects.filter(user=user))
+            page, next_cursor, prev_cursor = paginate_newest_first(
+                trades.select_related('stock'), request.GET.get('cursor'), limit
+            )
+        except PaginationError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
         
         # Serialize trade data
         trades_data = []
-        for trade in paginated_trades:
+        for trade in page:
             trades_data.append({
                 'id': trade.id,
                 'symbol': trade.stock.symbol,
@@ -630,15 +538,48 @@ class TradeHistoryView(APIView):
                 'status': 'COMPLETED',  # Could add more statuses later
             })
         
+        pagination = {
+            'limit': limit,
+            'next_cursor': next_cursor,
+            'prev_cursor': prev_cursor,
+        }
+        if request.GET.get('include_total', '').lower() in ('1', 'true', 'yes'):
+            pagination['total'] = user.portfolio.total_trades
+        
         return Response({
             'trades': trades_data,
-            'pagination': {
-                'total': total_trades,
-                'page': page,
-                'limit': limit,
-                'pages': (total_trades + limit - 1) // limit
-            }
+            'pagination': pagination
         })
+    
+    @staticmethod
+    def filter_trades(request, trades):
+        """
+        Narrow by symbol / order_type / date range. All of these are checked
+        while walking the (user, -timestamp, -id) index, and the date range
+        just bounds that walk.
+        """
+        symbol = request.GET.get('symbol', '').upper()
+        if symbol:
+            trades = trades.filter(stock__symbol=symbol)
+        
+        order_type = request.GET.get('order_type', '').upper()
+        if order_type:
+            if order_type not in Trade.OrderType.values:
+                raise PaginationError(f"order_type must be one of {', '.join(Trade.OrderType.values)}")
+            trades = trades.filter(order_type=order_type)
+        
+        for param, lookup in (('from', 'timestamp__gte'), ('to', 'timestamp__lt')):
+            value = request.GET.get(param)
+            if not value:
+                continue
+            day = parse_date(value)
+            if day is None:
+                raise PaginationError(f"'{param}' must be a date (YYYY-MM-DD)")
+            if param == 'to':
+                day += timedelta(days=1)  # inclusive end date
+            start_of_day = timezone.make_aware(datetime.combine(day, datetime.min.time()))
+            trades = trades.filter(**{lookup: start_of_day})
+        return trades
         
 class DashboardSummaryView(APIView):
     """
@@ -700,7 +641,7 @@ class DashboardSummaryView(APIView):
             },
             'recent_trades': recent_trades_data,
             'quick_stats': {
-                'total_trades': Trade.objects.filter(user=user).count(),
+                'total_trades': portfolio.total_trades,
                 'holdings_count': holdings.count(),
                 'today_pnl': 0,  # Will implement later
             }
@@ -770,18 +711,18 @@ class StockDetailsView(APIView):
         symbols = request.GET.getlist('symbols[]')
         if symbols:
             prices = {}
-            live_data = NepseClient.get_live_prices()
-            if live_data:
-                for item in live_data:
-                    if item.get('symbol') in symbols:
-                        prices[item['symbol']] = {
-                            'price': item.get('lastTradedPrice'),
-                            'change': item.get('percentageChange'),  # Fixed: was 'percentChange'
-                            'high': item.get('highPrice'),
-                            'low': item.get('lowPrice'),
-                            'volume': item.get('totalTradeQuantity'),
-                            'source': 'live'
-                        }
+            snapshot = NepseClient.get_snapshot()
+            for symbol in symbols:
+                quote = snapshot.get(symbol)
+                if quote:
+                    prices[symbol] = {
+                        'price': quote['price'],
+                        'change': quote['change'],
+                        'high': quote['high'],
+                        'low': quote['low'],
+                        'volume': quote['volume'],
+                        'source': quote['source']
+                    }
             
             # Fill in any missing symbols with mock/db data
             for symbol in symbols: